@@ -1,15 +1,20 @@
+import time
 import colorsys
 
+import numpy as np
+
 import bokeh.io
 from bokeh import plotting as bkp
 from bokeh.core.properties import value
-from bokeh.models import FixedTicker, Legend
+from bokeh.models import ColumnDataSource, FixedTicker, Legend
 from bokeh.models.mappers import LinearColorMapper
 
 import ipywidgets.widgets
 from ipywidgets.widgets import fixed, IntSlider, FloatSlider
 # from ipywidgets.widgets import SelectionSlider # for ipywidgets 5.x
 
+from leabra.trace import downsample_minmax, downsample_lttb, append_decimated
+
 
     ## Disable autoscrolling
 
@@ -85,14 +90,42 @@ def floatslider(*args, **kwargs):
     return s
 
 
+    ## Downsampling
+
+MAX_POINTS = 2000 # maximum number of points of a displayed line
+
+def downsample(xs, ys, max_points=MAX_POINTS, method='minmax'):
+    """Reduce a line to at most `max_points` points, preserving its peaks.
+
+    `ys` can be a list, an array or a (1-dimensional) recorder `Trace`.
+
+    method  'minmax' (min and max of bins, fast), 'lttb' (Largest-Triangle-Three-Buckets,
+            closer to the original shape) or None (no downsampling).
+    """
+    ys = np.asarray(ys, dtype=float)
+    xs = np.arange(len(ys)) if xs is None else np.asarray(xs)
+    if method is None or max_points is None:
+        return xs, ys
+    return {'minmax': downsample_minmax, 'lttb': downsample_lttb}[method](xs, ys, max_points)
+
+
     ## Graphs
 
 def line(xs, ys, std=None, fig=None, title='', width=700, height=400, dots=False, legend='None',
-         color='#00a0b0', alpha=1.0, line_width=1, show=True, **kwargs):
+         color='#00a0b0', alpha=1.0, line_width=1, show=True, max_points=MAX_POINTS,
+         downsampling='minmax', **kwargs):
 
     if fig is None:
         fig = figure(plot_width=width, plot_height=height, tools="save", title=title, **kwargs)
 
+    xs, ys = np.asarray(xs), np.asarray(ys, dtype=float)  # recorder traces are read once
+    if max_points is not None and len(ys) > max_points: # keeping the same points of xs, ys and std
+        idx, _ = downsample(None, ys, max_points=max_points, method=downsampling)
+        idx = idx.astype(int)
+        xs, ys = xs[idx], ys[idx]
+        if std is not None:
+            std = np.asarray(std)[idx]
+
     fig.line(xs, ys, line_color=color, line_alpha=alpha, line_width=line_width, legend_label=legend, )
     if dots:
         fig.scatter(xs, ys, line_color=None, fill_color=color, size=4)
@@ -140,8 +173,8 @@ def _unit_activity_aux(data, names=default_names):
         line_dash = 'solid'
         if name == 'v_m_eq':
             line_dash = 'dashed'
-        line = fig.line(range(len(data[name])), data[name], color=color, line_width=2,
-                                                             line_dash=line_dash)
+        xs, ys = downsample(None, data[name])
+        line = fig.line(xs, ys, color=color, line_width=2, line_dash=line_dash)
         lines.append(line)
 
     legend = Legend(items=[(name, [line]) for name, line in zip(names, lines)],
@@ -165,5 +198,66 @@ def unit_activity_interactive(data, names=default_names, figdata=None):
         handle, fig, lines = figdata
         names = ['net', 'v_m', 'I_net', 'act']
         for name, line in zip(names, lines):
-            line['y'] = data[name]
+            xs, ys = downsample(None, data[name])
+            line.update(x=xs, y=ys)
         bokeh.io.push_notebook(handle=handle)
+
+
+    ## Live plots
+
+class LivePlot:
+    """Lines updated incrementally during a run, e.g. the epoch metrics of a training.
+
+    New points are streamed to the displayed figure, rather than re-rendering it.
+    When a line exceeds `max_points` points, it is downsampled to half of them
+    (min/max decimation, preserving peaks), so that the memory and the rendering
+    time stay bounded however long the run. Notebook updates are throttled to one
+    every `min_interval` seconds.
+
+    >>> plot = LivePlot(['sse', 'cos_diff'], title='training')
+    >>> for epoch in range(10000):
+    ...     train_epoch(network)
+    ...     stats = network.metrics.end_epoch()
+    ...     plot.update(epoch, {name: stats[name]['mean'] for name in plot.names})
+    >>> plot.flush()
+    """
+
+    colors = ('#00a0b0', '#cc333f', '#eb6841', '#6a4a3c', '#edc951', 'black')
+
+    def __init__(self, names, title='', width=700, height=400, max_points=MAX_POINTS,
+                 min_interval=0.5, **kwargs):
+        self.names        = list(names)
+        self.max_points   = max_points
+        self.min_interval = min_interval
+        self.fig = figure(plot_width=width, plot_height=height, tools="save", title=title, **kwargs)
+        self.sources = {}
+        for name, color in zip(self.names, self.colors * len(self.names)):
+            self.sources[name] = ColumnDataSource(data={'x': [], 'y': []})
+            self.fig.line('x', 'y', source=self.sources[name], line_color=color, legend_label=name)
+        self._pending = {name: ([], []) for name in self.names}
+        self._last_push = 0.0
+        self.handle = bkp.show(self.fig, notebook_handle=True)
+
+    def update(self, x, values):
+        """Add a point to each line. `values` is a dict of name: value."""
+        for name, value in values.items():
+            xs, ys = self._pending[name]
+            xs.append(x)
+            ys.append(value)
+        if time.perf_counter() - self._last_push >= self.min_interval:
+            self.flush()
+
+    def flush(self):
+        """Send the pending points to the figure."""
+        for name, (xs, ys) in self._pending.items():
+            if not xs:
+                continue
+            source = self.sources[name]
+            decimated = append_decimated(source.data['x'], source.data['y'], xs, ys, self.max_points)
+            if decimated is not None:
+                source.data = {'x': list(decimated[0]), 'y': list(decimated[1])}
+            else:
+                source.stream({'x': xs, 'y': ys})
+        self._pending = {name: ([], []) for name in self.names}
+        self._last_push = time.perf_counter()
+        bokeh.io.push_notebook(handle=self.handle)
@@ -4,3 +4,10 @@ from .unit        import Unit, UnitSpec, INPUT, HIDDEN, OUTPUT
 from .layer       import Layer, LayerSpec
 from .connection  import Connection, ConnectionSpec
 from .network     import Network, NetworkSpec
+from .engine      import Engine, NetworkState, LayerState
+from .population  import PopulationEngine
+from .neuromod    import Neuromodulation
+from .metrics     import Metrics
+from .trace       import TraceRecorder, TraceReader
+from .training    import Trainer, ArrayPatterns, GeneratorPatterns
+from .cache       import SettleCache
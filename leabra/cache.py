@@ -0,0 +1,115 @@
+"""Cache of the settled minus phase activities, for repeated inference on the same inputs.
+
+`Network.settle()` runs the minus phase from a reset state: its result only
+depends on the inputs, the weights, the specs, and the little state the layers
+carry over from the previous trial (their average activity `avg_act`, which
+drives the feedback inhibition of the first cycle, and the non-decayed part of
+their inhibition if `trial_decay < 1.0`). A `SettleCache` attached to a network
+stores the settled state of its units and layers, keyed by all of these, and
+restores it when they occur again:
+
+>>> network.settle_cache = SettleCache(maxsize=1024)
+>>> for epoch in range(10):
+...     for inputs in evaluation_patterns:
+...         network.set_inputs(inputs)
+...         network.settle()           # simulated during the first epochs only
+>>> network.settle_cache.stats()
+{'hits': 800, 'misses': 200, 'bypasses': 0, 'size': 200, 'hit_rate': 0.8}
+
+As the carried-over state depends on the previous trial, a pattern presented
+after different patterns is a different entry. When the same sequence of patterns
+is presented repeatedly, the carried-over state becomes identical after an epoch
+or two, and all settles are then restored from the cache, exactly.
+
+Entries are invalidated whenever the weights change: every connection has a
+`version` counter, incremented by learning and by the methods that set its
+weights (`Connection.weights_changed()` must be called after modifying `wt` in
+place). A modification of a spec changes its frozen record, and invalidates the
+entries too, as does a modification of the masks of the layers and connections
+(see the `lesion` module). The least recently used entries are dropped beyond `maxsize`.
+
+A restored settle takes no cycle: the running averages of the units (`avg_ss`,
+`avg_s`, `avg_m`), which integrate the activities across trials and are only used
+for learning, are not updated, as with `Engine.solve()`. The cache is bypassed
+when a `TraceRecorder` is attached to the network, or hooks are registered
+(see the `hooks` module).
+"""
+import collections
+
+import numpy as np
+
+
+UNIT_VARS  = ('g_e', 'I_net', 'I_net_r', 'v_m', 'v_m_eq', 'act', 'act_nd', 'act_m', 'adapt')
+LAYER_VARS = ('gc_i', 'ffi', 'fbi', 'avg_act')
+
+
+class SettleCache:
+    """LRU cache of the settled states of a network, keyed by (inputs, weights version)."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize  = maxsize
+        self.entries  = collections.OrderedDict()
+        self.hits     = 0
+        self.misses   = 0
+        self.bypasses = 0  # settles that could not use the cache
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        looked_up = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'bypasses': self.bypasses,
+                'size': len(self.entries), 'hit_rate': self.hits / looked_up if looked_up else 0.0}
+
+    @staticmethod
+    def usable(network):
+        """False if the settles must be simulated (when their cycles are recorded, or hooks
+        are registered)."""
+        return network.recorder is None and not network.hooks
+
+    @staticmethod
+    def key(network):
+        """Key of the settled state: input activities, weights versions, frozen specs, carried-over
+        state and masks."""
+        inputs = tuple(sorted((name, np.asarray(acts, dtype=float).tobytes())
+                              for name, acts in network._inputs.items()))
+        versions = tuple((id(conn), conn.version, conn.spec.freeze()) for conn in network.connections)
+        specs = tuple((layer.spec.freeze(), layer.unit_record() if layer.units else None)
+                      for layer in network.layers)
+        carried = tuple((layer.avg_act, layer.ffi - layer.spec.trial_decay * layer.ffi,
+                         layer.fbi - layer.spec.trial_decay * layer.fbi) for layer in network.layers)
+        masks = tuple(None if obj.mask is None else obj.mask.tobytes()
+                      for obj in network.layers + network.connections)
+        return inputs, versions, specs, carried, masks, network.spec.quarter_size
+
+    def get(self, key):
+        """Return the entry of the key, or None. Counts the hit or miss."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, network):
+        """Store the settled state of the network."""
+        self.entries[key] = [({var: np.array([getattr(u, var) for u in layer.units]) for var in UNIT_VARS},
+                              {var: getattr(layer, var) for var in LAYER_VARS})
+                             for layer in network.layers]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    @staticmethod
+    def restore(entry, network):
+        """Set the settled state of an entry on the units and layers of the network."""
+        for layer, (unit_values, layer_values) in zip(network.layers, entry):
+            for var, values in unit_values.items():
+                for u, value in zip(layer.units, values.tolist()):
+                    setattr(u, var, value)
+            for var, value in layer_values.items():
+                setattr(layer, var, value)
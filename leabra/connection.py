@@ -1,54 +1,214 @@
+import copy
 import random
 
 import numpy as np
+import scipy.sparse
 
+from .spec import Spec
+from .lesion import assign_mask
+
+
+
+def _link_value(name):
+    """Property reading and writing the link's value in its connection's `name` array."""
+    def getter(link):
+        return getattr(link.connection, name)[link.index]
+    def setter(link, value):
+        link.connection.own_arrays()
+        getattr(link.connection, name)[link.index] = value
+    return property(getter, setter)
 
 
 class Link:
-    """A link between two units. Simple, non active class."""
+    """A link between two units. Simple, non active class.
+
+    The link's values are stored in the arrays of its connection: the link is a view
+    on the position `index` of those arrays.
+    """
 
-    def __init__(self, pre_unit, post_unit, w0, fw0, index=None):
+    def __init__(self, connection, index):
         """
         Parameters:
-            pre_unit   the unit sending its activity
-            post_unit  the unit receiving the activity
-            w0         the initial weight value
-            fw0        initial value of the fast weight parameter
-            index      position in the weight matrix
+            connection  the connection the link belongs to
+            index       position of the link in the connection's arrays
         """
-        self.pre  = pre_unit
-        self.post = post_unit
-        self.wt   = w0
-        self.fwt  = fw0
-        self.dwt  = 0.0
-        self.key  = None
+        self.connection = connection
+        self.index      = index
+        self.key        = None
 
+    wt  = _link_value('wt')   # weight
+    fwt = _link_value('fwt')  # fast weight parameter (linear version of the weight)
+    dwt = _link_value('dwt')  # weight change
 
-class Connection:
-    """Connection between layers"""
+    @property
+    def pre(self):
+        """The unit sending its activity"""
+        return self.connection.pre.units[self.connection.link_units(self.index)[0]]
 
-    def __init__(self, pre_layer, post_layer, spec=None):
+    @property
+    def post(self):
+        """The unit receiving the activity"""
+        return self.connection.post.units[self.connection.link_units(self.index)[1]]
+
+
+class Connection:
+    """Connection between layers
+
+    The values of the links are stored as arrays, in link order: `wt` (weights),
+    `fwt` (fast weights) and `dwt` (weight changes). Link `k` goes from the unit
+    `pre_idx[k]` of the pre layer to the unit `post_idx[k]` of the post layer. For
+    full projections, the connection is dense: the links are ordered by pre unit,
+    then by post unit, so that `wt` can be viewed as a (pre size, post size) matrix,
+    and the index arrays are not stored, but computed on demand. Pruning the weak
+    links of a connection (`prune()`) converts it to the non-dense form. Links can
+    also be cut without removing them, by a mask (`set_mask()`).
+
+    The link arrays of a cloned connection (see `Network.clone()`) are shared with
+    the original, read-only, until either modifies them: the methods modifying the
+    arrays call `own_arrays()` first, which copies them.
+    """
+
+    def __init__(self, pre_layer, post_layer, spec=None, rng=None):
         """
         Parameters:
             pre_layer   the layer sending its activity.
             post_layer  the layer receiving the activity.
+            rng         numpy random Generator used to draw the initial weights. If
+                        None, a generator seeded from the `random` module is used. A
+                        seeded network redraws them from its generator (see
+                        `NetworkSpec.seed`).
         """
         self.pre   = pre_layer
         self.post  = post_layer
-        self.links = []
         self.spec  = spec
         if self.spec is None:
             self.spec = ConnectionSpec()
 
+        self._pre_idx  = None         # index of the pre unit of each link (None if dense)
+        self._post_idx = None         # index of the post unit of each link (None if dense)
+        self.wt        = np.zeros(0)  # weights
+        self.fwt       = np.zeros(0)  # fast weights
+        self.dwt       = np.zeros(0)  # weight changes
+        self._links    = None         # Link views, created on demand
+        self._shared   = False        # True if the link arrays are shared with clones
+        self.version   = 0            # incremented each time the weights change
+        self.n_pruned  = 0            # number of links removed by `prune()`
+        self.mask      = None         # link mask: False for the cut links (see `set_mask()`)
+        self.wt_quant  = None         # (scale, offset) if `wt` holds quantized integer
+                                      # weights: the weights are `scale * wt + offset`.
+        self._sparse   = None         # cached CSR structure of the links, if not dense
+        self._sparse_wt = None        # cached sparse weight matrix: (wt, version, matrix)
+
         self.wt_scale_act = 1.0  # scaling relative to activity.
         self.wt_scale_rel_eff = None  # effective relative scaling weight, once other connections
                                       # are taken into account (computed by the network).
 
-        self.spec.projection_init(self)
+        self.spec.projection_init(self, rng=rng)
 
         pre_layer.from_connections.append(self)
         post_layer.to_connections.append(self)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_links'] = None  # views are recreated on demand
+        state['_sparse'] = state['_sparse_wt'] = None  # recomputed on demand
+        state['_shared'] = False  # the copied arrays are not shared
+        return state
+
+    def clone(self, pre_layer, post_layer):
+        """Return a copy of the connection between the given layers, sharing the link
+        arrays (copy-on-write), the index arrays and the spec."""
+        for name in ('wt', 'fwt', 'dwt'):
+            getattr(self, name).flags.writeable = False
+        self._shared = True
+        conn = copy.copy(self)
+        conn.pre, conn.post, conn._shared = pre_layer, post_layer, True
+        if self.mask is not None:
+            conn.mask = self.mask.copy()
+        pre_layer.from_connections.append(conn)
+        post_layer.to_connections.append(conn)
+        return conn
+
+    def own_arrays(self):
+        """Copy the link arrays if they are shared with clones, before modifying them in place."""
+        if self._shared:
+            self.wt, self.fwt, self.dwt = self.wt.copy(), self.fwt.copy(), self.dwt.copy()
+            self._shared = False
+
+    def set_links(self, wt, fwt, pre_idx=None, post_idx=None, dwt=None):
+        """Replace the links of the connection.
+
+        If `pre_idx` and `post_idx` are None, the connection is dense: `wt` and `fwt`
+        are the (pre size, post size) matrices, in row-major order. The link mask is
+        removed. `dwt` holds the pending weight changes of the links (see
+        `NetworkSpec.small_batch_n`); if None, it is reset to zero.
+        """
+        self.wt  = np.array(wt, dtype=float).ravel()
+        self.fwt = np.array(fwt, dtype=float).ravel()
+        self.dwt = np.zeros(len(self.wt)) if dwt is None else np.array(dwt, dtype=float).ravel()
+        self._shared = False
+        if pre_idx is None:
+            assert post_idx is None
+            assert len(self.wt) == len(self.pre.units) * len(self.post.units)
+            self._pre_idx, self._post_idx = None, None
+        else:
+            self._pre_idx  = np.asarray(pre_idx, dtype=int)
+            self._post_idx = np.asarray(post_idx, dtype=int)
+            assert len(self._pre_idx) == len(self._post_idx) == len(self.wt)
+        assert len(self.fwt) == len(self.dwt) == len(self.wt)
+        self.mask   = None
+        self._links = None
+        self.weights_changed()
+
+    def weights_changed(self):
+        """Increment the weights version. Must be called after modifying `wt` in place.
+
+        The version identifies the weights for caches (see `cache.SettleCache`). It
+        is incremented by the methods of the connection and of its spec that modify
+        the weights.
+        """
+        self.version += 1
+
+    @property
+    def dense(self):
+        """True if the links are the full (pre size, post size) matrix."""
+        return self._pre_idx is None
+
+    @property
+    def pre_idx(self):
+        """Index of the pre unit of each link"""
+        if self.dense:
+            return np.repeat(np.arange(len(self.pre.units)), len(self.post.units))
+        return self._pre_idx
+
+    @property
+    def post_idx(self):
+        """Index of the post unit of each link"""
+        if self.dense:
+            return np.tile(np.arange(len(self.post.units)), len(self.pre.units))
+        return self._post_idx
+
+    def link_units(self, k):
+        """Return the indexes of the pre and post units of link `k`."""
+        if self.dense:
+            return divmod(k, len(self.post.units))
+        return self._pre_idx[k], self._post_idx[k]
+
+    @property
+    def n_links(self):
+        return len(self.wt)
+
+    def init_weights(self, rng=None):
+        """Draw new initial weights (see `ConnectionSpec.init_weights`)."""
+        self.spec.init_weights(self, rng=rng)
+
+    @property
+    def links(self):
+        """List of the links of the connection, as Link views on the connection's arrays."""
+        if self._links is None:
+            self._links = [Link(self, k) for k in range(self.n_links)]
+        return self._links
+
     @property
     def wt_scale(self):
         try:
@@ -59,36 +219,64 @@ class Connection:
 
     @property
     def weights(self):
-        """Return a matrix of the links weights"""
+        """Return a matrix of the links weights. Pruned links have a zero weight."""
         if self.spec.proj.lower() == '1to1':
-            return np.array([[link.wt for link in self.links]])
-        else:  # proj == 'full'
-            W = np.zeros((len(self.pre.units), len(self.post.units)))  # weight matrix
-            link_it = iter(self.links)  # link iterator
-            for i, pre_u in enumerate(self.pre.units):
-                for j, post_u in enumerate(self.post.units):
-                    W[i, j] = next(link_it).wt
-            return W
+            values = np.zeros(len(self.pre.units))
+            values[self.pre_idx] = self.wt
+            return np.array([values])
+        elif self.dense:  # proj == 'full'
+            return self.wt.reshape(len(self.pre.units), len(self.post.units)).copy()
+        else:  # pruned full projection
+            matrix = np.zeros((len(self.pre.units), len(self.post.units)))
+            matrix[self.pre_idx, self.post_idx] = self.wt
+            return matrix
 
     @weights.setter
     def weights(self, value):
-        """Override the links weights"""
-        if self.spec.proj.lower() == '1to1':
-            assert len(value) == len(self.links)
-            for wt, link in zip(value, self.links):
-                link.wt  = wt
-                link.fwt = self.spec.sig_inv(wt)
-        else:  # proj == 'full'
-            link_it = iter(self.links)  # link iterator
-            assert len(value) * len(value[0]) == len(self.links)
-            for i, pre_u in enumerate(self.pre.units):
-                for j, post_u in enumerate(self.post.units):
-                    link = next(link_it)
-                    link.wt = value[i][j]
-                    link.fwt = self.spec.sig_inv(value[i][j])
-
-    def learn(self):
-        self.spec.learn(self)
+        """Override the links weights. The values of pruned links are ignored."""
+        value = np.asarray(value, dtype=float)
+        if not self.dense and value.size != self.n_links:  # matrix of a pruned connection
+            if self.spec.proj.lower() == '1to1':
+                value = value.ravel()[self.pre_idx]
+            else:
+                value = value.reshape(len(self.pre.units), len(self.post.units))[self.pre_idx, self.post_idx]
+        value = value.ravel()  # row-major order is the link order
+        assert len(value) == self.n_links, '{} != {}'.format(len(value), self.n_links)
+        self.own_arrays()
+        self.wt[:]  = value
+        self.fwt[:] = self.spec.sig_inv(value)
+        self.weights_changed()
+
+    def link_values(self, name):
+        """Return a copy of the values of a link attribute ('wt', 'fwt' or 'dwt'), in link order."""
+        return getattr(self, name).copy()
+
+    def set_link_values(self, name, values):
+        """Set the values of a link attribute ('wt', 'fwt' or 'dwt'), in link order."""
+        assert len(values) == self.n_links, '{} != {}'.format(len(values), self.n_links)
+        self.own_arrays()
+        getattr(self, name)[:] = values
+        if name == 'wt':
+            self.weights_changed()
+
+    def set_mask(self, mask):
+        """Cut the links where `mask` is False (see the `lesion` module). None to restore them.
+
+        mask  boolean array of shape (n_links,), in link order, or (batch, n_links)
+              for a different mask in each batch element of the `Engine`'s states.
+              The current mask array is updated in place if it has the same shape.
+        """
+        self.mask = assign_mask(self.mask, mask, self.n_links)
+
+    def learn(self, apply=True):
+        self.spec.learn(self, apply=apply)
+
+    def update_weights(self):
+        self.spec.update_weights(self)
+
+    def prune(self, threshold=None, top_k=None):
+        """Remove the weak links. Return the number of links removed (see `ConnectionSpec.prune`)."""
+        return self.spec.prune(self, threshold=threshold, top_k=top_k)
 
     def cycle(self):
         self.spec.cycle(self)
@@ -96,7 +284,10 @@ class Connection:
     def compute_netin_scaling(self):
         self.spec.compute_netin_scaling(self)
 
-class ConnectionSpec:
+MASK_CHUNK = 2**20  # maximum number of masked weights computed at once, with batched link masks
+
+
+class ConnectionSpec(Spec):
 
     legal_proj  = 'full', '1to1'        #              ... for self.proj
 
@@ -134,39 +325,156 @@ class ConnectionSpec:
             assert hasattr(self, key) # making sure the parameter exists.
             setattr(self, key, value)
 
+    def constants(self):
+        """Constants derived from the parameters, precomputed in the frozen spec."""
+        return {'xcal_slope' : (1 - self.d_rev)/self.d_rev,  # slope of the XCAL negative part
+                'sig_inv_exp': 1 / self.sig_gain}
+
     def cycle(self, connection):
         """Transmit activity."""
-        for link in connection.links:
-            if link.post.act_ext is None: # activity not forced
-                scaled_act = self.wt_scale_abs * connection.wt_scale * link.wt * link.pre.act
-                link.post.add_excitatory(scaled_act)
-
-    def _rnd_wt(self):
-        """Return a random weight, according to the specified distribution"""
+        pre_act = np.array([u.act for u in connection.pre.units])
+        net_raw = self.wt_scale_abs * connection.wt_scale * self.net_input(connection, pre_act)
+        for post_u, net in zip(connection.post.units, net_raw):
+            if post_u.act_ext is None: # activity not forced
+                post_u.add_excitatory(net)
+
+    def net_input(self, connection, pre_act, wt=None):
+        """Return the unscaled input of the connection to each post unit.
+
+        pre_act  the activities of the pre units. Can have leading batch dimensions.
+        wt       the weights, if not the connection's. Can have the same leading
+                 batch dimensions as `pre_act`, for one set of weights per element.
+        """
+        if connection.pre.mask is not None:
+            pre_act = pre_act * connection.pre.mask  # silenced units transmit nothing
+        if wt is None:
+            if connection.wt_quant is not None:
+                return self._dequantized_input(connection, pre_act)
+            wt = connection.wt
+        mask = connection.mask
+        if mask is None:
+            return self._link_input(connection, pre_act, wt)
+        if mask.ndim == 1:
+            return self._link_input(connection, pre_act, wt * mask)  # cut links transmit nothing
+        # one mask per batch element: the masked weights are computed by chunks of elements
+        step = max(1, MASK_CHUNK // max(1, mask.shape[-1]))
+        if step >= len(mask):
+            return self._link_input(connection, pre_act, wt * mask)
+        return np.concatenate([self._link_input(connection,
+                                                pre_act[k:k + step] if pre_act.ndim > 1 else pre_act,
+                                                (wt[k:k + step] if wt.ndim > 1 else wt) * mask[k:k + step])
+                               for k in range(0, len(mask), step)])
+
+    def _link_input(self, connection, pre_act, wt):
+        """Unscaled input of the links with weights `wt` (see `net_input`), without masks."""
+        n_pre = len(connection.pre.units)
+        if connection.dense:
+            if wt.ndim == 1:
+                return pre_act @ wt.reshape(n_pre, -1)
+            weights = wt.reshape(wt.shape[:-1] + (n_pre, -1))
+            return np.matmul(pre_act[..., np.newaxis, :], weights)[..., 0, :]
+        if wt.ndim == 1:  # a sparse (post size, pre size) matrix, for all the batch elements
+            matrix = self._sparse_matrix(connection, wt)
+            if pre_act.ndim == 1:
+                return matrix @ pre_act
+            net = (matrix @ pre_act.reshape(-1, n_pre).T).T
+            return net.reshape(pre_act.shape[:-1] + net.shape[-1:])
+        return self._scatter_links(connection, wt * pre_act[..., connection.pre_idx])
+
+    def _dequantized_input(self, connection, pre_act):
+        """Net input of quantized weights, without converting them: `scale * wt + offset`
+        summed over the links is `scale * net(wt) + offset * net(1)`."""
+        scale, offset = connection.wt_quant
+        net = scale * self.net_input(connection, pre_act, wt=connection.wt)
+        if offset != 0.0:
+            if connection.mask is not None:
+                net += offset * self.net_input(connection, pre_act, wt=np.ones(connection.n_links))
+            elif connection.dense:
+                net += offset * np.sum(pre_act, axis=-1, keepdims=True)
+            else:
+                net += offset * self._scatter_links(connection, pre_act[..., connection.pre_idx])
+        return net
+
+    def _scatter_links(self, connection, link_values):
+        """Sum values defined over the links (last axis) on their post unit."""
+        incidence = self._sparse_structure(connection)[3]
+        out = link_values.reshape(-1, link_values.shape[-1]) @ incidence
+        return out.reshape(link_values.shape[:-1] + out.shape[-1:])
+
+    def _sparse_matrix(self, connection, wt):
+        """Return the weights `wt` of a non-dense connection as a sparse (post size, pre size)
+        CSR matrix. Cached for the connection's weights, until they change."""
+        cached = connection._sparse_wt
+        if cached is not None and cached[0] is wt and cached[1] == connection.version:
+            return cached[2]
+        order, indices, indptr, _ = self._sparse_structure(connection)
+        matrix = scipy.sparse.csr_matrix((wt if order is None else wt[order], indices, indptr),
+                                         shape=(len(connection.post.units), len(connection.pre.units)))
+        if wt is connection.wt:
+            connection._sparse_wt = wt, connection.version, matrix
+        return matrix
+
+    def _sparse_structure(self, connection):
+        """Return the CSR structure of the links of a non-dense connection, with the post
+        units as rows, as `(order, indices, indptr, incidence)`.
+
+        `order` sorts the links by post unit, then pre unit (None if they already are),
+        and `incidence` is the sparse (n_links, post size) matrix summing values
+        defined over the links on their post unit. Cached until the links change.
+        """
+        cached = connection._sparse
+        if cached is None or cached[0] is not connection._post_idx:
+            pre_idx, post_idx = connection._pre_idx, connection._post_idx
+            n_links, n_post = len(post_idx), len(connection.post.units)
+            order = np.lexsort((pre_idx, post_idx))
+            if np.array_equal(order, np.arange(n_links)):
+                order = None
+            indices = pre_idx if order is None else pre_idx[order]
+            indptr = np.concatenate([[0], np.cumsum(np.bincount(post_idx, minlength=n_post))])
+            incidence = scipy.sparse.csr_matrix((np.ones(n_links), post_idx, np.arange(n_links + 1)),
+                                                shape=(n_links, n_post))
+            cached = connection._sparse = post_idx, (order, indices, indptr, incidence)
+        return cached[1]
+
+    def _link_products(self, connection, pre_values, post_values):
+        """Return the product of pre and post unit values for each link (last axis)."""
+        if connection.dense:
+            products = pre_values[..., :, np.newaxis] * post_values[..., np.newaxis, :]
+            return products.reshape(products.shape[:-2] + (-1,))
+        return pre_values[..., connection.pre_idx] * post_values[..., connection.post_idx]
+
+    def _rnd_wts(self, n, rng):
+        """Return `n` random weights, according to the specified distribution"""
         if self.rnd_type == 'uniform':
-            return random.uniform(self.rnd_mean - self.rnd_var,
-                                  self.rnd_mean + self.rnd_var)
+            return rng.uniform(self.rnd_mean - self.rnd_var, self.rnd_mean + self.rnd_var, n)
         elif self.rnd_type == 'gaussian':
-            return random.gauss(self.rnd_mean, np.sqrt(self.rnd_var))
+            return rng.normal(self.rnd_mean, np.sqrt(self.rnd_var), n)
         raise NotImplementedError
 
+    def init_weights(self, connection, rng=None):
+        """Draw the initial weights of the connection's links.
+
+        rng  numpy random Generator. If None, a generator seeded from the `random`
+             module is used, so that `random.seed()` makes the weights reproducible.
+        """
+        if rng is None:
+            rng = np.random.default_rng(random.getrandbits(64))
+        wt = self._rnd_wts(connection.n_links, rng)
+        # new arrays: shared ones are not modified
+        connection.wt, connection.fwt, connection.dwt = wt, self.sig_inv(wt), np.zeros(len(wt))
+        connection._shared = False
+        connection.weights_changed()
+
     def _full_projection(self, connection):
         # creating unit-to-unit links
-        connection.links = []
-        for i, pre_u in enumerate(connection.pre.units):
-            for j, post_u in enumerate(connection.post.units):
-                w0 = self._rnd_wt()
-                fw0 = self.sig_inv(w0)
-                connection.links.append(Link(pre_u, post_u, w0, fw0, index=(i, j)))
+        n = len(connection.pre.units) * len(connection.post.units)
+        connection.set_links(np.zeros(n), np.zeros(n))
 
     def _1to1_projection(self, connection):
         # creating unit-to-unit links
-        connection.links = []
         assert len(connection.pre.units) == len(connection.post.units)
-        for i, (pre_u, post_u) in enumerate(zip(connection.pre.units, connection.post.units)):
-            w0 = self._rnd_wt()
-            fw0 = self.sig_inv(w0)
-            connection.links.append(Link(pre_u, post_u, w0, fw0, index=(i, i)))
+        n = len(connection.pre.units)
+        connection.set_links(np.zeros(n), np.zeros(n), pre_idx=np.arange(n), post_idx=np.arange(n))
 
     def compute_netin_scaling(self, connection):
         """Compute Netin Scaling
@@ -175,7 +483,7 @@ class ConnectionSpec:
         """
         pre_act_avg = connection.pre.avg_act_p_eff
         pre_size = len(connection.pre.units)
-        n_links = len(connection.links)
+        n_links = connection.n_links + connection.n_pruned  # pruning does not change the scaling
 
         sem_extra = 2.0 # constant
         pre_act_n = max(1, int(pre_act_avg * pre_size + 0.5)) # estimated number of active units
@@ -188,54 +496,144 @@ class ConnectionSpec:
             post_act_n_exp = min(post_act_n_max, post_act_n_avg + sem_extra)
             connection.wt_scale_act = 1.0 / post_act_n_exp
 
-    def projection_init(self, connection):
+    def projection_init(self, connection, rng=None):
         if self.proj == 'full':
             self._full_projection(connection)
         if self.proj == '1to1':
             self._1to1_projection(connection)
+        self.init_weights(connection, rng=rng)
+
+
+    def prune(self, connection, threshold=None, top_k=None):
+        """Remove the weak links of the connection, converting it to the non-dense form.
 
+        threshold  the links with a lower weight are removed.
+        top_k      only the `top_k` strongest links received by each post unit are kept.
 
-    def learn(self, connection):
+        Must be called between trials. Return the number of links removed. The
+        removed links are still counted by the netin scaling, so that the input of
+        the remaining links is unchanged. The pending weight changes of the kept
+        links are kept.
+        """
+        wt, post_idx = connection.wt, connection.post_idx
+        keep = np.ones(len(wt), dtype=bool)
+        if threshold is not None:
+            keep &= wt >= threshold
+        if top_k is not None:
+            # rank of each link among the links of its post unit, by decreasing weight
+            order = np.lexsort((-wt, post_idx))
+            sorted_post = post_idx[order]
+            rank = np.empty(len(wt), dtype=int)
+            rank[order] = np.arange(len(wt)) - np.searchsorted(sorted_post, sorted_post)
+            keep &= rank < top_k
+        n_removed = len(wt) - int(np.count_nonzero(keep))
+        if n_removed > 0:
+            mask = connection.mask
+            connection.set_links(wt[keep], connection.fwt[keep], pre_idx=connection.pre_idx[keep],
+                                 post_idx=post_idx[keep], dwt=connection.dwt[keep])
+            connection.n_pruned += n_removed
+            if mask is not None:
+                connection.set_mask(mask[..., keep])
+        return n_removed
+
+    def learn(self, connection, apply=True):
+        """Accumulate the weight changes of the trial in `dwt`, and apply them if `apply` is True.
+
+        If `apply` is False, the weights are not modified: the changes of several
+        trials are applied together by `update_weights()`.
+        """
         if self.lrule is not None:
+            connection.own_arrays()
             self.learning_rule(connection)
+        if apply:
+            self.update_weights(connection)
+
+    def update_weights(self, connection):
+        """Apply the accumulated weight changes `dwt` (see `apply_dwt`), and clip the weights."""
+        if self.lrule is not None:
+            connection.own_arrays()
             self.apply_dwt(connection)
-        for link in connection.links:
-            link.wt = max(0.0, min(1.0, link.wt)) # clipping weights after change
+            connection.weights_changed()
+        self.clip_weights(connection)
 
-    def apply_dwt(self, connection):
+    def clip_weights(self, connection):
+        """Clip the weights in [0, 1], after changes."""
+        wt = connection.wt
+        if len(wt) > 0 and (wt.min() < 0.0 or wt.max() > 1.0):  # not copying shared weights in range
+            connection.own_arrays()
+            np.clip(connection.wt, 0.0, 1.0, out=connection.wt)
 
-        for link in connection.links:
-            # print('before  wt={}  fwt={}  dwt={}'.format(link.wt, link.fwt, link.dwt))
-            link.dwt *= (1 - link.fwt) if (link.dwt > 0) else link.fwt
-            link.fwt += link.dwt
-            link.wt = self.sig(link.fwt)
-            # print('after   wt={}  fwt={}  dwt={}'.format(link.wt, link.fwt, link.dwt))
+    def apply_dwt(self, connection, frozen=None):
+        """Apply the weight changes `dwt` to the fast weights and the weights, and reset them.
 
-            link.dwt = 0.0
+        connection  an object with `wt`, `fwt` and `dwt` arrays.
+        frozen      the frozen record to read the parameters from. Default to the spec's.
+        """
+        dwt = connection.dwt
+        dwt *= np.where(dwt > 0, 1 - connection.fwt, connection.fwt)
+        connection.fwt += dwt
+        connection.wt[...] = self.sig(connection.fwt, frozen=frozen)
+        dwt[...] = 0.0
 
     def learning_rule(self, connection):
         """Leabra learning rule."""
-
-        for i, link in enumerate(connection.links):
-            srs = link.post.avg_s_eff * link.pre.avg_s_eff
-            srm = link.post.avg_m * link.pre.avg_m
-            # print('{}:{} erro {}\n  ru_avg_s_eff={}\n  su_avg_s_eff={}\n  srs={}\n  ru_avg_m={}\n  su_avg_m={}\n  srm={}'.format(connection.post.name, i, self.m_lrn  * self.xcal(srs, srm), link.post.avg_s_eff, link.pre.avg_s_eff, srs, link.post.avg_m, link.pre.avg_m, srm))
-            # print('{}:{} hebb {}\n  avg_l_lrn={}\n  xcal={}\n  srs={}\n  avg_l={}'.format(connection.post.name, i, link.post.avg_l_lrn * self.xcal(srs, link.post.avg_l), link.post.avg_l_lrn, self.xcal(srs, link.post.avg_l), srs, link.post.avg_l))
-            link.dwt += (  self.lrate * ( self.m_lrn * self.xcal(srs, srm)
-                         + link.post.avg_l_lrn * self.xcal(srs, link.post.avg_l)))
-
-    def xcal(self, x, th):
-        if (x < self.d_thr):
-            return 0
-        elif (x > th * self.d_rev):
-            return (x - th)
-        else:
-            return (-x * ((1 - self.d_rev)/self.d_rev))
-
-    def sig(self, w):
-        return 1 / (1 + (self.sig_off * (1 - w) / w) ** self.sig_gain)
+        pre, post = connection.pre.units, connection.post.units
+        connection.dwt += self.compute_dwt(connection,
+                                           np.array([u.avg_s_eff for u in pre]),
+                                           np.array([u.avg_m     for u in pre]),
+                                           np.array([u.avg_s_eff for u in post]),
+                                           np.array([u.avg_m     for u in post]),
+                                           np.array([u.avg_l     for u in post]),
+                                           np.array([u.avg_l_lrn for u in post]))
+
+    def compute_dwt(self, connection, pre_avg_s_eff, pre_avg_m, post_avg_s_eff, post_avg_m,
+                    post_avg_l, post_avg_l_lrn, frozen=None):
+        """Return the weight changes of the Leabra learning rule, from the units's averages.
+
+        The arguments are arrays over the pre or post units, that can have leading batch
+        dimensions. The XCAL products are computed as outer products over the links.
+        `frozen` is the frozen record to read the parameters from (default to the spec's).
+        The cut links, and the links of silenced units, do not change.
+        """
+        c = self.freeze() if frozen is None else frozen
+        srs = self._link_products(connection, pre_avg_s_eff, post_avg_s_eff)
+        srm = self._link_products(connection, pre_avg_m, post_avg_m)
+        ones = np.ones(pre_avg_m.shape[-1])
+        link_avg_l     = self._link_products(connection, ones, post_avg_l)
+        link_avg_l_lrn = self._link_products(connection, ones, post_avg_l_lrn)
+
+        dwt = (  c.lrate * ( c.m_lrn * self.xcal(srs, srm, frozen=c)
+               + link_avg_l_lrn * self.xcal(srs, link_avg_l, frozen=c)))
+        mask = self._learning_mask(connection)
+        return dwt if mask is None else dwt * mask
+
+    def _learning_mask(self, connection):
+        """Return the mask of the links that learn: not cut, between units not silenced (None if all)."""
+        mask = connection.mask
+        pre_mask, post_mask = connection.pre.mask, connection.post.mask
+        if pre_mask is not None or post_mask is not None:
+            units = self._link_products(
+                connection, np.ones(len(connection.pre.units), dtype=bool) if pre_mask is None else pre_mask,
+                np.ones(len(connection.post.units), dtype=bool) if post_mask is None else post_mask)
+            mask = units if mask is None else mask & units
+        return mask
+
+    def xcal(self, x, th, frozen=None):
+        """XCAL check-mark function. Works on scalars and arrays."""
+        c = self.freeze() if frozen is None else frozen
+        return np.where(x < c.d_thr, 0.0,
+                        np.where(x > th * c.d_rev, x - th, -x * c.xcal_slope))
+
+    def sig(self, w, frozen=None):
+        c = self.freeze() if frozen is None else frozen
+        with np.errstate(divide='ignore'):
+            return 1 / (1 + (c.sig_off * (1 - w) / w) ** c.sig_gain)
 
     def sig_inv(self, w):
-        if   w <= 0.0: return 0.0
-        elif w >= 1.0: return 1.0
-        return 1 / (1 + ((1 - w) / w) ** (1 / self.sig_gain) / self.sig_off)
+        """Inverse of `sig()`. Works on scalars and arrays."""
+        c = self.freeze()
+        w = np.asarray(w, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fw = 1 / (1 + ((1 - w) / w) ** c.sig_inv_exp / c.sig_off)
+        fw = np.where(w <= 0.0, 0.0, np.where(w >= 1.0, 1.0, fw))
+        return float(fw) if fw.ndim == 0 else fw
@@ -0,0 +1,905 @@
+"""Vectorized simulation engine, separating the network's parameters from its state.
+
+A `Network` holds the parameters of the simulation (the specs and the connection
+weights) along with the state of one simulation (the variables of its units and
+layers). The `Engine` is compiled from a network, and only reads its specs and
+weights: the dynamical variables live in a separate `NetworkState`, made of plain
+arrays. The engine is stateless, so many states can be simulated with the same
+engine concurrently (from threads, asyncio tasks, or as batches), and
+snapshotting or restoring a state is a cheap array copy:
+
+>>> engine = Engine(network)
+>>> state  = engine.new_state()
+>>> sse    = engine.trial(state, inputs={'input_layer': [1.0, 0.0]},
+...                              outputs={'output_layer': [0.0, 1.0]})
+>>> snapshot = state.copy()
+
+All the state arrays have a leading batch dimension: one state can hold several
+independent simulations, advanced together. The engine reproduces the equations
+of `UnitSpec`, `LayerSpec` and `ConnectionSpec`, and gives the same results as the
+`Network` methods, up to floating point rounding.
+
+Learning modifies the connection weights, which are shared by all the states of
+an engine. When learning with a batched state, the weight changes of the batch
+elements are summed before being applied. As with the `Network`, the changes of
+`small_batch_n` trials (see `NetworkSpec`) are accumulated before being applied.
+
+By default, as the `Network`, the engine integrates the units's dynamics with
+fixed 1 ms cycles. With an `AdaptiveStep`, it takes steps of several ms while the
+activities change slowly, and comes back to 1 ms steps when they change fast or
+when a unit crosses its activation threshold. A step of `n` ms is computed as `n`
+successive 1 ms steps with the inputs of the units (net input, inhibition) frozen
+during the step. The step control is a heuristic: it guarantees that no activity
+changes by more than `AdaptiveStep.tol` and no unit crosses its threshold during an
+accepted step of more than 1 ms, not a bound on the error against the fixed-step
+simulation, which `compare_steps()` measures. The time semantics (`quarter_size`,
+`cycle_count`, in ms) are unchanged.
+
+The units of a layer can have their own parameters (see `Layer.set_unit_params()`):
+they are simulated together, with arrays of parameters.
+
+The masks of the layers and connections (see the `lesion` module) are applied at
+every cycle. They can have a leading batch dimension, for a different lesion in
+each batch element.
+
+The hooks registered on the network (see the `hooks` module) are called with
+`StateView`s of the states. The cycle hooks are looked up once per quarter.
+
+For inference, `solve()` computes the settled activities of the minus phase
+directly, as the fixed point of the units's equations, falling back to `settle()`
+if it does not converge. Use `compare_solver()` to compare both.
+"""
+import time
+
+import numpy as np
+
+from .unit import HIDDEN
+from .metrics import StateView
+from .lesion import masked_mean
+
+
+class LayerState:
+    """Dynamical variables of a layer and its units.
+
+    The variables of the units are (batch, size) arrays; the variables of the layer
+    are (batch,) arrays.
+    """
+
+    unit_vars  = ('g_e', 'I_net', 'I_net_r', 'v_m', 'v_m_eq', 'act', 'act_nd', 'act_m',
+                  'adapt', 'spike', 'act_ext', 'forced',
+                  'avg_ss', 'avg_s', 'avg_m', 'avg_l', 'avg_s_eff')
+    layer_vars = ('gc_i', 'ffi', 'fbi', 'avg_act')
+
+    def __init__(self, layer, unit_spec, batch=1):
+        self.name = layer.name
+        shape = (batch, len(layer.units))
+        for name in self.unit_vars + self.layer_vars:
+            setattr(self, name, np.zeros(shape if name in self.unit_vars else batch))
+        self.forced = np.zeros(shape, dtype=bool)  # True where the activity is forced
+        self.avg_ss[:] = unit_spec.avg_init
+        self.avg_s[:]  = unit_spec.avg_init
+        self.avg_m[:]  = unit_spec.avg_init
+        self.avg_l[:]  = unit_spec.avg_l_init
+        self.v_m[:]    = unit_spec.v_m_init
+        self.v_m_eq[:] = unit_spec.v_m_init
+
+    def copy(self):
+        other = LayerState.__new__(LayerState)
+        other.name = self.name
+        for name in self.unit_vars + self.layer_vars:
+            setattr(other, name, getattr(self, name).copy())
+        return other
+
+    def restore(self, other):
+        """Copy the values of another LayerState into this one, in place."""
+        for name in self.unit_vars + self.layer_vars:
+            getattr(self, name)[...] = getattr(other, name)
+
+
+class NetworkState:
+    """State of a simulation: the LayerState of each layer, and the network counters."""
+
+    counters = ('cycle_count', 'cycle_tot', 'quarter_nb', 'trial_count', 'phase', 'step_count')
+
+    def __init__(self, layers, batch=1):
+        self.batch       = batch
+        self.layers      = layers  # list of LayerState, in the network's layer order
+        self.cycle_count = 0       # number of cycles finished in the current trial
+        self.cycle_tot   = 0       # total number of cycles executed
+        self.quarter_nb  = 1       # current quarter number (1, 2, 3 or 4)
+        self.trial_count = 0       # number of trial finished
+        self.phase       = 'minus'
+        self.step_count  = 0       # total number of integration steps computed (== cycle_tot with fixed steps)
+        self.inputs      = {}      # activities forced at the start of the trial
+        self.outputs     = {}      # activities forced at the start of the plus phase
+        self.metrics     = None    # a `metrics.Metrics` instance, not copied in snapshots
+        self.recorder    = None    # a `trace.TraceRecorder` instance, not copied in snapshots
+
+    def layer(self, name):
+        """Return the LayerState of a layer from its name."""
+        for layer_state in self.layers:
+            if layer_state.name == name:
+                return layer_state
+        raise ValueError("layer '{}' not found.".format(name))
+
+    def copy(self):
+        """Return an independent copy of the state (a snapshot)."""
+        other = NetworkState([layer_state.copy() for layer_state in self.layers], self.batch)
+        self._copy_counters(self, other)
+        return other
+
+    def restore(self, snapshot):
+        """Restore the values of a snapshot in place."""
+        assert len(snapshot.layers) == len(self.layers)
+        for layer_state, layer_snapshot in zip(self.layers, snapshot.layers):
+            layer_state.restore(layer_snapshot)
+        self._copy_counters(snapshot, self)
+
+    @classmethod
+    def _copy_counters(cls, src, dst):
+        for name in cls.counters:
+            setattr(dst, name, getattr(src, name))
+        dst.inputs, dst.outputs = dict(src.inputs), dict(src.outputs)
+
+
+def step_rate(rate, dt_integ):
+    """Fraction of the gap to its target covered by a first-order relaxation in `dt_integ` ms.
+
+    `rate` is the fraction covered by one 1 ms Euler step. For `dt_integ` > 1, the
+    result is the one of `dt_integ` successive 1 ms steps toward a constant target.
+    """
+    if dt_integ == 1:
+        return rate
+    return 1 - (1 - rate)**dt_integ
+
+
+def act_fun(unit_spec, x):
+    """Vectorized version of `UnitSpec.xx1` and `UnitSpec.noisy_xx1`, for a frozen UnitSpec."""
+    X = unit_spec.act_gain * np.maximum(x, 0.0)
+    xx1 = X / (X + 1)
+    if not unit_spec.noisy_act:
+        return xx1
+    xs, conv = unit_spec.nxx1_table
+    return np.where(x < xs[0], 0.0, np.where(xs[-1] < x, xx1, np.interp(x, xs, conv)))
+
+
+def anderson_step(xs, gs):
+    """Return the next iterate of a fixed-point iteration `x = g(x)`, by Anderson acceleration.
+
+    The iterate is the combination of the last images `gs` of the points `xs` whose
+    residuals `gs - xs` combine with the smallest norm (the coefficients summing to
+    one). The points are (batch, n) arrays, combined independently in each batch
+    element.
+    """
+    fs = [g - x for x, g in zip(xs, gs)]
+    dfs = np.stack([f1 - f0 for f0, f1 in zip(fs[:-1], fs[1:])], axis=-1)  # (batch, n, m)
+    dgs = np.stack([g1 - g0 for g0, g1 in zip(gs[:-1], gs[1:])], axis=-1)
+    gram = np.einsum('bni,bnj->bij', dfs, dfs)
+    gram += 1e-12 * (np.trace(gram, axis1=1, axis2=2)[:, None, None] + 1e-12) * np.eye(gram.shape[-1])
+    gamma = np.linalg.solve(gram, np.einsum('bni,bn->bi', dfs, fs[-1])[..., np.newaxis])
+    return gs[-1] - (dgs @ gamma)[..., 0]
+
+
+class AdaptiveStep:
+    """Parameters of the adaptive integration time step of the Engine.
+
+    Steps of more than 1 ms are only accepted if they change no activity by more
+    than `tol` and cross no activation threshold. This bounds the change during a
+    step, not the error against 1 ms cycles (see `compare_steps()`).
+    """
+
+    def __init__(self, tol=0.005, dt_max=8):
+        """
+        Parameters:
+            tol     maximum change of the activity of any unit during a step of more
+                    than 1 ms. Larger steps are retried with half the size.
+            dt_max  maximum step size, in ms. Must be a power of two.
+        """
+        assert dt_max >= 1 and dt_max & (dt_max - 1) == 0, 'dt_max must be a power of two'
+        self.tol    = tol
+        self.dt_max = dt_max
+
+
+class Engine:
+    """Stateless, vectorized simulation of a network. See the module documentation.
+
+    The engine reads the parameters of the specs from their frozen records (see
+    `spec.FrozenSpec`), so that modifying a spec is taken into account at the next cycle.
+    """
+
+    def __init__(self, network, neuromodulation=None, adaptive_step=None, executor=None):
+        """Compile the network. Must be recreated if layers or connections are added.
+
+        Parameters:
+            network          the network to simulate.
+            neuromodulation  a `neuromod.Neuromodulation` instance, modulating the
+                             activation threshold of the units. None to disable.
+            adaptive_step    an `AdaptiveStep` instance, for adaptive integration
+                             steps. None for fixed 1 ms steps.
+            executor         a `concurrent.futures.Executor`, used to compute the
+                             transmission of the connections in parallel. None to
+                             compute them sequentially.
+        """
+        self.network = network
+        self.neuromodulation = neuromodulation
+        self.adaptive_step   = adaptive_step
+        self.executor        = executor
+        self.layers  = list(network.layers)
+        self._unit_specs = [layer.units[0].spec for layer in self.layers]
+        index = {id(layer): k for k, layer in enumerate(self.layers)}
+        self.connections = [(conn, index[id(conn.pre)], index[id(conn.post)])
+                            for conn in network.connections]
+
+    @property
+    def unit_specs(self):
+        """The frozen unit spec of each layer, reflecting the current parameters.
+
+        The parameters of the units with their own values are (size,) arrays, with
+        the value of each unit (see `Layer.unit_record()`).
+        """
+        return [layer.unit_record() for layer in self.layers]
+
+    @property
+    def layer_specs(self):
+        """The frozen spec of each layer, reflecting the current parameters."""
+        return [layer.spec.freeze() for layer in self.layers]
+
+    @property
+    def quarter_size(self):
+        return self.network.spec.quarter_size
+
+    def new_state(self, batch=1):
+        """Return a new state, as the one of a newly created network."""
+        return NetworkState([LayerState(layer, spec, batch=batch)
+                             for layer, spec in zip(self.layers, self.unit_specs)], batch)
+
+    def _layer_index(self, name):
+        for k, layer in enumerate(self.layers):
+            if layer.name == name:
+                return k
+        raise ValueError("layer '{}' not found.".format(name))
+
+    def net(self, state, name):
+        """Return the `net` value of the units of a layer."""
+        k = self._layer_index(name)
+        return self.unit_specs[k].g_bar_e * state.layers[k].g_e
+
+
+        ## Units and layers
+
+    def force_activity(self, state, name, activities):
+        """Force the activities of a layer's units (see `UnitSpec.force_activity`).
+
+        activities  an array of shape (size,), or (batch, size).
+        """
+        k = self._layer_index(name)
+        ls, us = state.layers[k], self.unit_specs[k]
+        acts = np.broadcast_to(np.asarray(activities, dtype=float), ls.act.shape)
+        ls.forced[...]  = True
+        ls.act_ext[...] = acts
+        ls.g_e[...]     = acts / us.g_bar_e
+        ls.I_net[...]   = 0.0
+        ls.act[...]     = acts
+        ls.act_nd[...]  = acts
+        ls.v_m[...]     = np.where(acts == 0, us.e_rev_l, us.act_thr + acts / us.act_gain)
+        ls.v_m_eq[...]  = ls.v_m
+
+    def _trial_init(self, state):
+        """Reset the units and decay the layers's inhibition (see `LayerSpec.trial_init`)."""
+        for layer_spec, ls, us in zip(self.layer_specs, state.layers, self.unit_specs):
+            for name in ('g_e', 'I_net', 'I_net_r', 'act', 'act_nd', 'act_m', 'adapt', 'act_ext'):
+                getattr(ls, name)[...] = 0.0
+            ls.v_m[...]    = us.v_m_init
+            ls.v_m_eq[...] = us.v_m_init
+            ls.forced[...] = False
+            ls.ffi -= layer_spec.trial_decay * ls.ffi
+            ls.fbi -= layer_spec.trial_decay * ls.fbi
+
+    def _inhibition(self, spec, ls, dt_integ=1, mask=None):
+        """Compute the layer inhibition (see `LayerSpec._inhibition`), from the frozen layer spec.
+
+        mask  the unit mask of the layer: the silenced units are left out of the mean net input.
+        """
+        if spec.lay_inhib:
+            ls.ffi[...] = spec.ff * np.maximum(0, masked_mean(ls.g_e, mask) - spec.ff0)
+            ls.fbi += step_rate(spec.fb_dt, dt_integ) * (spec.fb * ls.avg_act - ls.fbi)
+            return spec.g_i * (ls.ffi + ls.fbi)
+        return np.zeros_like(ls.gc_i)
+
+    def _calculate_net_in(self, us, ls, net_raw, dt_integ=1):
+        """Update the net input of the units of a layer (see `UnitSpec.calculate_net_in`)."""
+        ls.g_e[...] = np.where(ls.forced, ls.g_e,
+                               ls.g_e + step_rate(us.dt_net, dt_integ) * (net_raw - ls.g_e))
+
+    def _cycle_units(self, us, ls, dt_integ=1, act_thr=None):
+        """Cycle the units of a layer (see `UnitSpec.cycle`).
+
+        act_thr  activation threshold of the units, if modulated (a number, or an
+                 array broadcastable to (batch, size)). Default to the spec's.
+        """
+        free = ~ls.forced
+        if act_thr is None:
+            act_thr = us.act_thr
+
+        gc_e = us.g_bar_e * ls.g_e
+        gc_i = us.g_bar_i * ls.gc_i[:, np.newaxis]
+        gc_l = us.gc_l
+        def I_net_at(v_m_eff):
+            return (  gc_e * (us.e_rev_e - v_m_eff)
+                    + gc_i * (us.e_rev_i - v_m_eff)
+                    + gc_l * (us.e_rev_l - v_m_eff)
+                    - ls.adapt
+                    + us.bias)
+
+        if dt_integ == 1:
+            # I_net, with half-step integration, and I_net_r, with one-step integration
+            I_net = I_net_at(ls.v_m)
+            I_net = I_net_at(ls.v_m + dt_integ/2 * us.dt_v_m * I_net)
+            I_net_r = I_net_at(ls.v_m_eq)
+
+            v_m    = ls.v_m    + dt_integ * us.dt_v_m * I_net
+            v_m_eq = ls.v_m_eq + dt_integ * us.dt_v_m * I_net_r
+        else:
+            # with frozen conductances, I_net = g_tot * (v_inf - v_m): each 1 ms step
+            # covers a constant fraction of the gap between v_m and v_inf.
+            g_tot = gc_e + gc_i + gc_l
+            v_inf = (gc_e * us.e_rev_e + gc_i * us.e_rev_i + gc_l * us.e_rev_l
+                     - ls.adapt + us.bias) / g_tot
+            k = us.dt_v_m * g_tot
+            I_net, I_net_r = I_net_at(ls.v_m), I_net_at(ls.v_m_eq)
+            v_m    = v_inf + (ls.v_m    - v_inf) * (1 - k * (1 - k/2))**dt_integ  # half-step integration
+            v_m_eq = v_inf + (ls.v_m_eq - v_inf) * (1 - k)**dt_integ
+
+        # reseting v_m if over the threshold (spike-like behavior)
+        spike = (v_m > act_thr).astype(float)
+        v_m   = np.where(spike, us.v_m_r, v_m)
+        I_net = np.where(spike, 0.0, I_net)
+
+        # computing new_act, from v_m_eq (because rate-coded neuron)
+        g_e_thr = (  gc_i * (us.e_rev_i - act_thr)
+                   + gc_l * (us.e_rev_l - act_thr)
+                   - ls.adapt + us.bias) / (act_thr - us.e_rev_e)
+        new_act = act_fun(us, np.where(v_m_eq <= act_thr, v_m_eq - act_thr, gc_e - g_e_thr))
+        act_nd = ls.act_nd + step_rate(us.dt_v_m, dt_integ) * (new_act - ls.act_nd)
+
+        if us.adapt_on:
+            adapt = ls.adapt + (
+                        step_rate(us.dt_adapt, dt_integ) * (us.v_m_gain * (v_m - us.e_rev_l) - ls.adapt)
+                        + dt_integ * spike * us.spike_gain)
+            ls.adapt[...] = np.where(free, adapt, ls.adapt)
+
+        for name, value in [('I_net', I_net), ('I_net_r', I_net_r), ('v_m', v_m),
+                            ('v_m_eq', v_m_eq), ('spike', spike), ('act_nd', act_nd),
+                            ('act', act_nd)]:
+            getattr(ls, name)[...] = np.where(free, value, getattr(ls, name))
+
+        self._update_avgs(us, ls, dt_integ)
+
+    def _update_avgs(self, us, ls, dt_integ=1):
+        """Update all averages except long-term (see `UnitSpec.update_avgs`)."""
+        ls.avg_ss += step_rate(us.avg_ss_dt, dt_integ) * (ls.act_nd - ls.avg_ss)
+        ls.avg_s  += step_rate(us.avg_s_dt,  dt_integ) * (ls.avg_ss - ls.avg_s )
+        ls.avg_m  += step_rate(us.avg_m_dt,  dt_integ) * (ls.avg_s  - ls.avg_m )
+        ls.avg_s_eff[...] = us.avg_m_in_s * ls.avg_m + (1 - us.avg_m_in_s) * ls.avg_s
+
+    def _avg_l_lrn(self, layer, us, ls):
+        """Vectorized version of `UnitSpec.avg_l_lrn`"""
+        if layer.genre != HIDDEN:  # no self-organization for non-hidden layers
+            return np.zeros_like(ls.avg_l)
+        return us.avg_lrn_min + us.avg_fact * (ls.avg_l - us.avg_l_min)
+
+
+        ## Network
+
+    def _pre_cycle(self, state):
+        """See `Network._pre_cycle`"""
+        if state.cycle_count == self.quarter_size: # a quarter just ended
+            state.quarter_nb += 1
+            if state.quarter_nb == 5: # a trial just ended
+                state.trial_count += 1
+                state.quarter_nb = 1
+            state.cycle_count = 0
+
+        if state.cycle_count == 0: # start of a quarter
+            for conn, _, _ in self.connections:
+                conn.compute_netin_scaling()
+
+            if state.quarter_nb == 1: # start of trial
+                self._trial_init(state)
+                for name, activities in state.inputs.items():
+                    self.force_activity(state, name, activities)
+                if state.metrics is not None:
+                    state.metrics.trial_start(StateView(self, state))
+                self.network.hooks.call('trial_start', StateView, self, state)
+            elif state.quarter_nb == 4: # start of plus phase
+                for name, activities in state.outputs.items():
+                    self.force_activity(state, name, activities)
+                self.network.hooks.call('plus_start', StateView, self, state)
+            self.network.hooks.call('quarter_start', StateView, self, state)
+
+    def _post_cycle(self, state, learn=True):
+        """See `Network._post_cycle`"""
+        if state.cycle_count == self.quarter_size: # end of a quarter
+            self.network.hooks.call('quarter_end', StateView, self, state)
+            if state.quarter_nb == 3: # end of minus phase
+                self.end_minus_phase(state)
+            if state.quarter_nb == 4: # end of plus phase
+                self.end_plus_phase(state, learn=learn)
+
+    def cycle(self, state, learn=True, dt_integ=1):
+        """Execute a cycle, of `dt_integ` ms"""
+        self._cycle(state, learn, dt_integ, self._cycle_hooks())
+
+    def _cycle_hooks(self):
+        """The network's hooks if some are called at every cycle, else None."""
+        hooks = self.network.hooks
+        return hooks if hooks.per_cycle else None
+
+    def _cycle(self, state, learn=True, dt_integ=1, hooks=None):
+        """Execute a cycle, calling the cycle hooks of `hooks` if not None."""
+        self._pre_cycle(state)
+        if hooks is not None:
+            hooks.call('cycle_start', StateView, self, state)
+        self._step(state, dt_integ)
+        self._advance(state, dt_integ, learn=learn, hooks=hooks)
+
+    def _transmit(self, state):
+        """Return the raw net input of each layer, transmitted by all connections.
+
+        All connections read the activities of the state before any unit is updated
+        (the state's activities act as the front buffer, and the net inputs as the
+        back buffer), so that feedback and self-recurrent connections are well
+        defined, and the transmissions can run in parallel. The contributions of
+        the connections are summed in the network's connection order, whatever
+        the order of their computation.
+        """
+        def transmit(connection):
+            k, (conn, pre_k, _) = connection
+            return self._net_input(k, conn, state.layers[pre_k].act)
+
+        if self.executor is None or len(self.connections) < 2:
+            contributions = map(transmit, enumerate(self.connections))
+        else:
+            contributions = self.executor.map(transmit, enumerate(self.connections))
+        net_raw = [np.zeros_like(ls.act) for ls in state.layers]
+        for (_, _, post_k), net in zip(self.connections, contributions):
+            net_raw[post_k] += net
+        return net_raw
+
+    def _net_input(self, k, conn, pre_act):
+        """Return the scaled input of the connection `k` to each post unit."""
+        return conn.spec.wt_scale_abs * conn.wt_scale * conn.spec.net_input(conn, pre_act)
+
+    def _step(self, state, dt_integ=1):
+        """Integrate the units and layers over `dt_integ` ms. Return the act_thr of each layer."""
+        net_raw = self._transmit(state)
+
+        if self.neuromodulation is not None:
+            t = (state.quarter_nb - 1) * self.quarter_size + state.cycle_count
+            occupancies = self.neuromodulation.occupancies(state, t)
+
+        act_thrs = []
+        for layer, layer_spec, us, ls, net in zip(self.layers, self.layer_specs, self.unit_specs,
+                                                  state.layers, net_raw):
+            self._calculate_net_in(us, ls, net, dt_integ)
+            if layer.mask is not None:
+                ls.g_e *= layer.mask  # silenced units receive no input
+            if state.phase == 'minus':
+                ls.gc_i[...] = self._inhibition(layer_spec, ls, dt_integ, mask=layer.mask)
+            act_thr = us.act_thr
+            if self.neuromodulation is not None:
+                act_thr = self.neuromodulation.act_thr(layer.name, us, occupancies)
+            self._cycle_units(us, ls, dt_integ, act_thr=act_thr)
+            if layer.mask is not None:
+                ls.act    *= layer.mask
+                ls.act_nd *= layer.mask
+            ls.avg_act[...] = masked_mean(ls.act, layer.mask)
+            act_thrs.append(act_thr)
+        return act_thrs
+
+    def _advance(self, state, dt_integ, learn=True, hooks=None):
+        state.cycle_count += dt_integ
+        state.cycle_tot   += dt_integ
+        state.step_count  += 1
+        if state.metrics is not None and state.metrics.needs_cycles:
+            state.metrics.cycle(StateView(self, state))
+        if state.recorder is not None:
+            state.recorder.record(StateView(self, state))
+        if hooks is not None:
+            hooks.call('cycle_end', StateView, self, state)
+        self._post_cycle(state, learn=learn)
+
+    def quarter(self, state, learn=True):
+        """Execute a quarter"""
+        hooks = self._cycle_hooks()  # looked up once per quarter
+        self._cycle(state, learn, 1, hooks)
+        dt_integ = 1
+        while state.cycle_count < self.quarter_size:
+            if self.adaptive_step is None:
+                self._cycle(state, learn, 1, hooks)
+            else:
+                dt_integ = self._adaptive_cycle(state, dt_integ, learn=learn, hooks=hooks)
+
+    def _adaptive_cycle(self, state, dt_integ, learn=True, hooks=None):
+        """Execute a step of at most `dt_integ` ms, inside a quarter. Return the size of the next step.
+
+        The step is halved until the activities change by less than `tol` and no
+        unit crosses its threshold during the step. The next step is doubled if the
+        change was less than `tol/2`. The cycle hooks are called once per step.
+        """
+        if hooks is not None:
+            hooks.call('cycle_start', StateView, self, state)
+        dt_integ = min(dt_integ, self.quarter_size - state.cycle_count)
+        while dt_integ & (dt_integ - 1):  # rounding down to a power of two
+            dt_integ &= dt_integ - 1
+        before, n_rejected = state.copy(), 0
+        while True:
+            act_thrs = self._step(state, dt_integ)
+            change = self._step_change(before, state, act_thrs)
+            if dt_integ == 1 or change <= self.adaptive_step.tol:
+                break
+            state.restore(before)
+            dt_integ //= 2
+            n_rejected += 1
+        state.step_count += n_rejected  # rejected steps count as integration steps too
+        self._advance(state, dt_integ, learn=learn, hooks=hooks)
+        if change <= self.adaptive_step.tol / 2:
+            return min(2 * dt_integ, self.adaptive_step.dt_max)
+        return dt_integ
+
+    def _step_change(self, before, after, act_thrs):
+        """Maximum change of activity of the free units, or infinity if a threshold was crossed."""
+        change = 0.0
+        for ls_before, ls, act_thr in zip(before.layers, after.layers, act_thrs):
+            free = ~ls.forced
+            if np.any(free & ((ls_before.v_m_eq > act_thr) != (ls.v_m_eq > act_thr))):
+                return np.inf
+            if np.any(free):
+                change = max(change, np.max(np.abs(ls.act - ls_before.act)[free]))
+        return change
+
+    def trial(self, state, inputs=None, outputs=None, learn=True):
+        """Execute a trial, up until the end of the plus phase. Return the SSE of each batch element.
+
+        inputs, outputs  if not None, replace the activities forced on the input
+                         (resp. output) layers, as in `Network.set_inputs()`.
+        """
+        if inputs is not None:
+            state.inputs = inputs
+        if outputs is not None:
+            state.outputs = outputs
+        self.quarter(state, learn=learn)
+        while state.quarter_nb != 4:
+            assert state.cycle_count == self.quarter_size
+            self.quarter(state, learn=learn)
+        return self.compute_sse(state)
+
+    def settle(self, state, inputs=None):
+        """Execute the minus phase of a trial, without plus phase nor learning.
+
+        See `Network.settle()`. The settled activities are in the states's `act_m`.
+        """
+        if inputs is not None:
+            state.inputs = inputs
+        assert ((state.cycle_count == 0 and state.quarter_nb == 1) or
+                (state.cycle_count == self.quarter_size and state.quarter_nb == 4)), \
+               'settle() must be called between trials'
+        self.quarter(state, learn=False)
+        while state.quarter_nb != 3:
+            self.quarter(state, learn=False)
+        # skipping the plus phase
+        state.quarter_nb = 4
+        state.phase = 'minus'
+        if state.metrics is not None:
+            state.metrics.trial_end(StateView(self, state, True))
+        self.network.hooks.call('trial_end', StateView, self, state, True)
+
+    def solve(self, state, inputs=None, tol=1e-5, max_iter=100, anderson=5, fallback=True):
+        """Compute the settled minus phase activities directly, as the fixed point of the units's equations.
+
+        Replaces `settle()` for inference: rather than simulating the trajectory of
+        the minus phase, the steady state of the rate-coded equations is computed. At
+        equilibrium, `g_e` equals the net input, `v_m_eq` its asymptotic value, the
+        feedback inhibition is `fb * avg_act`, and `act` is the activation function
+        of `v_m_eq`. The layers are solved one after the other, from the activities
+        of the layers solved before (see `_solve_layer`): a feedforward network is
+        solved by the first sweep over the layers, and the second one checks it;
+        with feedback or recurrent connections, the sweeps are repeated until the
+        activities do not change, accelerated by Anderson mixing. Such networks can
+        have several equilibria, and the solver can reach another one than the
+        simulation. Units with an adaptation current (`adapt_on`) have no such
+        equilibrium during the minus phase: if any unit spec has `adapt_on`, the
+        solver does not converge. Neither does it when cycle or quarter hooks are
+        registered (see the `hooks` module), as it runs no cycle.
+
+        The state is left as after `settle()`, with the activities in `act` and
+        `act_m`. Returns True if the sweeps converged for all batch elements. If
+        not, and `fallback` is True, the state is restored and `settle()` is run
+        instead. Averages (`avg_s`, `avg_m`, ...) are not updated by the solver.
+
+        Parameters:
+            tol       convergence threshold on the change of the activities during
+                      a sweep.
+            max_iter  maximum number of sweeps over the layers.
+            anderson  number of previous sweeps combined by Anderson acceleration
+                      (see `anderson_step()`), which converges where the sweeps
+                      oscillate through feedback connections.
+        """
+        if inputs is not None:
+            state.inputs = inputs
+        assert ((state.cycle_count == 0 and state.quarter_nb == 1) or
+                (state.cycle_count == self.quarter_size and state.quarter_nb == 4)), \
+               'solve() must be called between trials'
+        if self.network.hooks.per_quarter and fallback:  # the hooks need the cycles
+            self.settle(state)
+            return False
+        snapshot = state.copy()
+
+        if state.quarter_nb == 4:  # starting a new trial
+            state.trial_count += 1
+        for conn, _, _ in self.connections:
+            conn.compute_netin_scaling()
+        self._trial_init(state)
+        for name, activities in state.inputs.items():
+            self.force_activity(state, name, activities)
+        if state.metrics is not None:
+            state.metrics.trial_start(StateView(self, state))
+        self.network.hooks.call('trial_start', StateView, self, state)
+
+        occupancies = None
+        if self.neuromodulation is not None:  # concentrations at the end of the minus phase
+            occupancies = self.neuromodulation.occupancies(state, 3 * self.quarter_size - 1)
+
+        converged, xs, gs, min_change = False, [], [], np.inf
+        if any(us.adapt_on for us in self.unit_specs) or self.network.hooks.per_quarter:
+            max_iter = 0
+        for _ in range(max_iter):
+            xs.append(np.concatenate([ls.act for ls in state.layers], axis=-1))
+            change = self._solve_sweep(state, tol, occupancies)
+            if change < tol:
+                converged = True
+                break
+            gs.append(np.concatenate([ls.act for ls in state.layers], axis=-1))
+            if change > min_change:  # the combination diverged: restarting from the last sweep
+                xs, gs = xs[-1:], gs[-1:]
+            min_change = min(min_change, change)
+            xs, gs = xs[-anderson:], gs[-anderson:]
+            if len(xs) > 1:  # a feedforward network converges without it
+                self._set_activities(state, anderson_step(xs, gs))
+
+        if not converged and fallback:
+            state.restore(snapshot)
+            self.settle(state)
+            return False
+
+        for ls in state.layers:
+            ls.act_nd[...] = ls.act
+            ls.act_m[...]  = ls.act
+        state.cycle_tot   += 3 * self.quarter_size
+        state.quarter_nb   = 4
+        state.cycle_count  = self.quarter_size
+        state.phase        = 'minus'
+        if state.metrics is not None:
+            view = StateView(self, state, True)
+            state.metrics.minus_end(view)
+            state.metrics.trial_end(view)
+        self.network.hooks.call('minus_end', StateView, self, state, True)
+        self.network.hooks.call('trial_end', StateView, self, state, True)
+        return converged
+
+    def _set_activities(self, state, acts):
+        """Set the activities of the free units from a (batch, n_units) array."""
+        start = 0
+        for layer, ls in zip(self.layers, state.layers):
+            act = acts[:, start:start + len(layer.units)]
+            start += len(layer.units)
+            ls.act[...] = np.where(ls.forced, ls.act, np.clip(act, 0.0, 1.0))
+            if layer.mask is not None:
+                ls.act *= layer.mask
+            ls.avg_act[...] = masked_mean(ls.act, layer.mask)
+
+    def _solve_sweep(self, state, tol, occupancies=None):
+        """Solve the equilibrium of each layer in turn, from the current activities of the
+        others. Return the maximum change of the activities."""
+        change = 0.0
+        for k, (layer, spec, us, ls) in enumerate(zip(self.layers, self.layer_specs, self.unit_specs,
+                                                      state.layers)):
+            free = ~ls.forced
+            if not np.any(free):
+                continue
+            net = np.zeros_like(ls.act)
+            for j, (conn, pre_k, post_k) in enumerate(self.connections):
+                if post_k == k:
+                    net += self._net_input(j, conn, state.layers[pre_k].act)
+            ls.g_e[...] = np.where(ls.forced, ls.g_e, net)
+            if layer.mask is not None:
+                ls.g_e *= layer.mask
+            act_thr = us.act_thr
+            if occupancies is not None:
+                act_thr = self.neuromodulation.act_thr(layer.name, us, occupancies)
+            act = self._solve_layer(layer, spec, us, ls, act_thr, tol)
+            change = max(change, np.max(np.abs(np.where(free, act - ls.act, 0.0))))
+            ls.act[...] = act
+            ls.avg_act[...] = masked_mean(act, layer.mask)
+            if spec.lay_inhib:
+                ls.fbi[...]  = spec.fb * ls.avg_act
+                ls.gc_i[...] = spec.g_i * (ls.ffi + ls.fbi)
+        return change
+
+    def _solve_layer(self, layer, spec, us, ls, act_thr, tol):
+        """Return the equilibrium activities of a layer, for its current excitatory input.
+
+        With layer inhibition, the activities depend on the inhibition `gc_i`, which
+        depends on the average activity: `gc_i = g_i * (ffi + fb * avg_act(gc_i))`.
+        The activities decrease with `gc_i`, so that this equation has a single root,
+        found in its bracket by the Illinois variant of the secant method, in each
+        batch element. Sets `v_m_eq`, `ffi` and `gc_i`.
+        """
+        gc_e = us.g_bar_e * ls.g_e
+        gc_l = us.gc_l
+
+        def equilibrium(gc_i):
+            gc_i = us.g_bar_i * gc_i[:, np.newaxis]
+            v_m_eq = (gc_e * us.e_rev_e + gc_i * us.e_rev_i + gc_l * us.e_rev_l
+                      - ls.adapt + us.bias) / (gc_e + gc_i + gc_l)
+            g_e_thr = (  gc_i * (us.e_rev_i - act_thr)
+                       + gc_l * (us.e_rev_l - act_thr)
+                       - ls.adapt + us.bias) / (act_thr - us.e_rev_e)
+            act = act_fun(us, np.where(v_m_eq <= act_thr, v_m_eq - act_thr, gc_e - g_e_thr))
+            act = np.where(ls.forced, ls.act, act)
+            if layer.mask is not None:
+                act = act * layer.mask
+            return v_m_eq, act
+
+        if spec.lay_inhib:
+            ls.ffi[...] = spec.ff * np.maximum(0, masked_mean(ls.g_e, layer.mask) - spec.ff0)
+
+            def excess(gc_i):  # increasing function of gc_i, zero at equilibrium
+                return gc_i - spec.g_i * (ls.ffi + spec.fb * masked_mean(equilibrium(gc_i)[1], layer.mask))
+
+            max_act = np.maximum(1.0, np.max(ls.act, axis=-1))  # the activation function is below 1
+            lo, hi = spec.g_i * ls.ffi, spec.g_i * (ls.ffi + spec.fb * max_act)
+            f_lo, f_hi = excess(lo), excess(hi)
+            side = np.zeros_like(lo)  # -1 (+1) if the last iteration moved the lower (upper) bound
+            gc_i = lo
+            for _ in range(100):
+                width = f_hi - f_lo
+                gc_i = np.where(width > 0, lo - f_lo * (hi - lo) / np.where(width > 0, width, 1.0), lo)
+                f = excess(gc_i)
+                if np.all((np.abs(f) <= 1e-3 * tol) | (hi - lo <= 1e-3 * tol)):
+                    break
+                below = f < 0
+                f_hi = np.where(below & (side < 0), f_hi / 2, f_hi)  # Illinois: halving the value
+                f_lo = np.where(~below & (side > 0), f_lo / 2, f_lo)  # of the bound kept twice
+                lo, f_lo = np.where(below, gc_i, lo), np.where(below, f, f_lo)
+                hi, f_hi = np.where(below, hi, gc_i), np.where(below, f_hi, f)
+                side = np.where(below, -1.0, 1.0)
+            ls.gc_i[...] = gc_i
+        v_m_eq, act = equilibrium(ls.gc_i)
+        ls.v_m_eq[...] = np.where(ls.forced, ls.v_m_eq, v_m_eq)
+        return act
+
+    def compute_sse(self, state):
+        """Compute the sum of squared error of each batch element (see `Network.compute_sse`)."""
+        sse = np.zeros(state.batch)
+        for name, activities in state.outputs.items():
+            act_m = state.layers[self._layer_index(name)].act_m
+            sse += np.sum((np.asarray(activities, dtype=float) - act_m)**2, axis=-1)
+        return sse
+
+    def end_minus_phase(self, state):
+        """End of the minus phase. Current unit activity is stored."""
+        for ls in state.layers:
+            ls.act_m[...] = ls.act
+        state.phase = 'plus'
+        if state.metrics is not None:
+            state.metrics.minus_end(StateView(self, state))
+        self.network.hooks.call('minus_end', StateView, self, state)
+
+    def end_plus_phase(self, state, learn=True):
+        """End of the plus phase. Connections change weights, if `learn` is True."""
+        if learn:
+            self.learn(state)
+        for us, ls in zip(self.unit_specs, state.layers):
+            ls.avg_l += us.avg_l_dt * (us.avg_l_gain * ls.avg_m - ls.avg_l)
+            np.maximum(ls.avg_l, us.avg_l_min, out=ls.avg_l)
+        state.phase = 'minus'
+        if state.metrics is not None:
+            state.metrics.trial_end(StateView(self, state))
+        self.network.hooks.call('trial_end', StateView, self, state)
+
+    def learn(self, state):
+        """Accumulate the weight changes of the trial, and apply them every `small_batch_n`
+        trials (see `ConnectionSpec.learn` and `NetworkSpec.small_batch_n`)."""
+        for conn, pre_k, post_k in self.connections:
+            spec = conn.spec
+            if spec.lrule is not None:
+                pre, post = state.layers[pre_k], state.layers[post_k]
+                avg_l_lrn = self._avg_l_lrn(self.layers[post_k], self.unit_specs[post_k], post)
+                dwt = spec.compute_dwt(conn, pre.avg_s_eff, pre.avg_m, post.avg_s_eff,
+                                       post.avg_m, post.avg_l, avg_l_lrn)
+                conn.own_arrays()
+                conn.dwt += np.sum(dwt, axis=0)
+        if self.network._count_dwt_trial():
+            for conn, _, _ in self.connections:
+                conn.spec.update_weights(conn)
+
+
+def compare_steps(network, inputs, adaptive_step, n_trials=1, outputs=None):
+    """Compare the adaptive step integration with the fixed-step one, on settled activities.
+
+    Both simulations run on a copy of the network's weights, without learning.
+    Returns a dict with the maximum absolute difference of the `act_m` of the units,
+    and the number of integration steps of each simulation.
+
+    Parameters:
+        network        the network to simulate.
+        inputs         the inputs of the trials, as in `Engine.settle`.
+        adaptive_step  the `AdaptiveStep` instance to compare.
+        n_trials       number of trials to run.
+        outputs        the outputs for the plus phase. If None, only the minus
+                       phase of each trial is run.
+    """
+    fixed, adaptive = Engine(network), Engine(network, adaptive_step=adaptive_step)
+    states = fixed.new_state(), adaptive.new_state()
+    error = 0.0
+    for _ in range(n_trials):
+        for engine, state in zip((fixed, adaptive), states):
+            if outputs is None:
+                engine.settle(state, inputs)
+            else:
+                engine.trial(state, inputs, outputs, learn=False)
+        error = max([error] + [np.max(np.abs(ls_fixed.act_m - ls_adaptive.act_m))
+                               for ls_fixed, ls_adaptive in zip(states[0].layers, states[1].layers)])
+    return {'max_abs_error': error,
+            'fixed_steps'  : states[0].step_count,
+            'adaptive_steps': states[1].step_count}
+
+
+def compare_solver(network, inputs, **kwargs):
+    """Compare the fixed-point solver with the simulation of the minus phase.
+
+    Each input pattern is solved and settled from a new state, without learning.
+    The simulation may not settle: with strong inhibition, the activities of the
+    1 ms cycles can oscillate around the fixed point. Returns a dict with:
+
+        max_abs_error  the maximum absolute difference between the `act_m` of the
+                       units, for the patterns for which the solver converged
+                       and the simulation settled.
+        converged      the fraction of patterns for which the solver converged.
+        settled        the fraction of patterns for which the simulation settled:
+                       an additional cycle changes no activity by more than `tol`.
+        solve_time, settle_time  the duration of both methods, in seconds.
+        speedup        `settle_time / solve_time`.
+
+    Parameters:
+        network  the network to simulate.
+        inputs   list of input patterns, as in `Engine.settle`.
+        kwargs   parameters of `Engine.solve`.
+    """
+    engine = Engine(network)
+    tol = kwargs.get('tol', 1e-5)
+    error, n_converged, n_settled, solve_time, settle_time = 0.0, 0, 0, 0.0, 0.0
+    for pattern in inputs:
+        solved, settled = engine.new_state(), engine.new_state()
+        start = time.perf_counter()
+        converged = engine.solve(solved, pattern, fallback=False, **kwargs)
+        solve_time += time.perf_counter() - start
+        start = time.perf_counter()
+        engine.settle(settled, pattern)
+        settle_time += time.perf_counter() - start
+        next_cycle = settled.copy()
+        engine._step(next_cycle)
+        is_settled = all(np.max(np.abs(ls_next.act - ls.act)) <= tol
+                         for ls_next, ls in zip(next_cycle.layers, settled.layers))
+        n_converged += converged
+        n_settled   += is_settled
+        if converged and is_settled:
+            error = max([error] + [np.max(np.abs(ls_solved.act_m - ls_settled.act_m))
+                                   for ls_solved, ls_settled in zip(solved.layers, settled.layers)])
+    return {'max_abs_error': error,
+            'converged'    : n_converged / len(inputs),
+            'settled'      : n_settled / len(inputs),
+            'solve_time'   : solve_time,
+            'settle_time'  : settle_time,
+            'speedup'      : settle_time / solve_time}
@@ -0,0 +1,94 @@
+"""Hooks: functions called at the events of the simulation, without subclassing.
+
+Every `Network` has a `Hooks` registry, `network.hooks`. The hooks are called by
+the network, and by the `Engine` simulating it, with a view of the simulation
+(`metrics.NetworkView` or `metrics.StateView`), at the events:
+
+    trial_start    at the start of the trial, after the inputs are forced.
+    plus_start     at the start of the plus phase, after the outputs are forced.
+    quarter_start  at the start of each quarter, after trial_start or plus_start.
+    cycle_start    at the start of each cycle, before the connections transmit.
+    cycle_end      after each cycle, before the end events of its quarter.
+    quarter_end    at the end of each quarter, before minus_end or trial_end.
+    minus_end      at the end of the minus phase.
+    trial_end      at the end of the trial (after learning), or after `settle()`.
+
+Hooks can read the simulation, and modify it: inject noise, change the inputs
+during a trial, record variables, or schedule neuromodulators. The arrays of a
+`StateView` are the state's own; with a `NetworkView`, modify the units of
+`view.network`. `force_activity()` forces activities with both views:
+
+>>> def occlude(view):  # hiding the input in the second half of the minus phase
+...     if view.cycle == 38:
+...         view.force_activity('input_layer', [0.0, 0.0, 0.0, 0.0])
+>>> network.hooks.add('cycle_start', occlude)
+
+The hooks of each event are stored as a tuple, rebuilt when hooks are added or
+removed, and the view is only created if the tuple is not empty. The events of
+the trials, phases and quarters are checked at the quarter boundaries only. The
+cycle hooks are looked up once per quarter: if there are none, the cycles run
+without any hook code. Cycle hooks added during a quarter are called from the
+next quarter on.
+
+Hooks that modify the simulation are not compatible with shortcuts that skip the
+cycles: `SettleCache` is bypassed while hooks are registered, and `Engine.solve()`
+falls back to `settle()` when cycle or quarter hooks are registered. The hooks are
+not copied nor pickled with the network (see `Network.__getstate__`).
+"""
+
+
+EVENTS = ('trial_start', 'plus_start', 'quarter_start', 'cycle_start', 'cycle_end',
+          'quarter_end', 'minus_end', 'trial_end')
+
+
+class Hooks:
+    """Registry of the hooks of a network, by event. See the module documentation."""
+
+    def __init__(self):
+        for event in EVENTS:
+            setattr(self, event, ())  # the hooks of the event, in call order
+
+    def add(self, event, hook):
+        """Register `hook(view)` to be called at `event`, after the hooks already registered.
+        Return the hook."""
+        self._check(event)
+        setattr(self, event, getattr(self, event) + (hook,))
+        return hook
+
+    def remove(self, event, hook):
+        """Unregister a hook. Raises ValueError if it is not registered for `event`."""
+        self._check(event)
+        hooks = list(getattr(self, event))
+        hooks.remove(hook)
+        setattr(self, event, tuple(hooks))
+
+    def clear(self):
+        """Unregister all hooks."""
+        for event in EVENTS:
+            setattr(self, event, ())
+
+    def __bool__(self):
+        return any(getattr(self, event) for event in EVENTS)
+
+    @property
+    def per_cycle(self):
+        """True if hooks are called at every cycle."""
+        return bool(self.cycle_start or self.cycle_end)
+
+    @property
+    def per_quarter(self):
+        """True if hooks are called inside the phases (every quarter or cycle)."""
+        return bool(self.per_cycle or self.quarter_start or self.quarter_end)
+
+    def call(self, event, view_class, *args):
+        """Call the hooks of `event` with a `view_class(*args)` view, created only if there are hooks."""
+        hooks = getattr(self, event)
+        if hooks:
+            view = view_class(*args)
+            for hook in hooks:
+                hook(view)
+
+    @staticmethod
+    def _check(event):
+        if event not in EVENTS:
+            raise ValueError("unknown event '{}', must be one of {}".format(event, ', '.join(EVENTS)))
@@ -1,6 +1,10 @@
+import copy
+
 import numpy as np
 
 from .unit import Unit, INPUT, HIDDEN, OUTPUT
+from .spec import Spec
+from .lesion import assign_mask, masked_mean
 
 
 class Layer:
@@ -32,6 +36,9 @@ class Layer:
 
         self.avg_act       = 0.0  # average activity, computed after every cycle.
         self.avg_act_p_eff = self.spec.avg_act_targ_init
+        self.mask          = None # unit mask: False for the silenced units (see `set_mask()`)
+        self.unit_params   = {}   # the units's own parameter values (see `set_unit_params()`)
+        self._unit_record  = None # (unit spec record, unit_params, record with the unit_params)
 
         self.from_connections = [] # connections from this layer
         self.to_connections   = [] # connections to this layer
@@ -42,6 +49,68 @@ class Layer:
         """Initialize the layer for a new trial. Reset all units, decays fbi and ffi."""
         self.spec.trial_init(self)
 
+    def clone(self):
+        """Return a copy of the layer and its units, sharing their specs, without connections."""
+        layer = copy.copy(self)
+        layer.units = [u.clone() for u in self.units]
+        layer.logs = {name: list(values) for name, values in self.logs.items()}
+        layer.from_connections, layer.to_connections = [], []
+        if self.mask is not None:
+            layer.mask = self.mask.copy()
+        return layer
+
+    def set_mask(self, mask):
+        """Silence the units where `mask` is False (see the `lesion` module). None to restore them.
+
+        mask  boolean array of shape (size,), or (batch, size) for a different mask
+              in each batch element of the `Engine`'s states. The current mask array
+              is updated in place if it has the same shape.
+        """
+        self.mask = assign_mask(self.mask, mask, len(self.units))
+
+    def set_unit_params(self, **params):
+        """Give each unit its own value of some parameters of its spec.
+
+        The values are stored in `unit_params`, as (size,) arrays, and override the
+        ones of the unit spec, shared by the units, which still provides the other
+        parameters. The `Engine` simulates the units of the layer together, with
+        arrays of parameters (see `unit_record()`).
+
+        >>> layer.set_unit_params(act_thr=np.linspace(0.45, 0.55, len(layer.units)),
+        ...                       bias=rng.normal(0.0, 0.01, len(layer.units)))
+
+        Raises ValueError for the parameters that cannot differ between the units
+        simulated together: the non-numeric ones, and `act_gain` and `act_sd`, which
+        define the noisy activation function table.
+        """
+        spec = self.units[0].spec
+        unit_params = dict(self.unit_params)  # a new dict: the records are cached by identity
+        for name, values in params.items():
+            values = np.array(values, dtype=float)
+            if name not in spec.params() or values.shape != (len(self.units),):
+                raise ValueError("'{}' must be a parameter of the unit spec, with one value per unit "
+                                 "({})".format(name, len(self.units)))
+            values.flags.writeable = False
+            unit_params[name] = values
+        self._unit_record = spec.freeze(), unit_params, spec.freeze_with(unit_params)  # or ValueError
+        self.unit_params = unit_params
+        for k, unit in enumerate(self.units):
+            unit.own_params = unit_params, k
+
+    def unit_record(self):
+        """Return the frozen record of the unit spec, with the `unit_params` as (size,) arrays.
+
+        The record is cached until the unit spec or the unit parameters are modified.
+        """
+        frozen = self.units[0].spec.freeze()
+        if not self.unit_params:
+            return frozen
+        cached = self._unit_record
+        if cached[0] is not frozen or cached[1] is not self.unit_params:
+            cached = self._unit_record = (frozen, self.unit_params,
+                                          self.units[0].spec.freeze_with(self.unit_params))
+        return cached[2]
+
     @property
     def activities(self):
         """Return the matrix of the units's activities"""
@@ -81,9 +150,11 @@ class Layer:
             print('   {}: {:.2f}'.format(name, getattr(self, name)))
 
 
-class LayerSpec:
+class LayerSpec(Spec):
     """Layer parameters"""
 
+    state_attrs = ('cycle_count',)
+
     def __init__(self, **kwargs):
         """Initialize a LayerSpec"""
         self.lay_inhib = True # activate inhibition?
@@ -118,22 +189,23 @@ class LayerSpec:
 
     def _inhibition(self, layer):
         """Compute the layer inhibition"""
-        if self.lay_inhib:
+        c = self.freeze()
+        if c.lay_inhib:
             # Calculate feed forward inhibition
             netin = [u.g_e for u in layer.units]
             # if layer.genre == OUTPUT and self.cycle_count < 300:
             #     print(self.cycle_count, netin)
-            layer.ffi = self.ff * max(0, np.mean(netin) - self.ff0)
+            layer.ffi = c.ff * max(0, masked_mean(np.array(netin), layer.mask) - c.ff0)
 
             # Calculate feed back inhibition
             # if layer.genre == OUTPUT and self.cycle_count < 300:
             #     print(self.cycle_count, 'layer.avg_act ', layer.avg_act)
-            layer.fbi += self.fb_dt * (self.fb * layer.avg_act - layer.fbi)
+            layer.fbi += c.fb_dt * (c.fb * layer.avg_act - layer.fbi)
 
             # if layer.genre == OUTPUT and self.cycle_count < 300:
             #     print('gc_i ',  self.g_i * (layer.ffi + layer.fbi))
             #     print('gc_i ',  self.g_i * (layer.ffi + layer.fbi), layer.ffi, layer.fbi)
-            return self.g_i * (layer.ffi + layer.fbi)
+            return c.g_i * (layer.ffi + layer.fbi)
         else:
             return 0.0
 
@@ -143,6 +215,9 @@ class LayerSpec:
         # calculate net inputs for this layer
         for u in layer.units:
             u.calculate_net_in()
+        silenced = [] if layer.mask is None else [u for u, on in zip(layer.units, layer.mask) if not on]
+        for u in silenced:
+            u.g_e = 0.0
 
         # update the state of the layer
         if phase == 'minus':
@@ -151,8 +226,10 @@ class LayerSpec:
         #     print(self.cycle_count, layer.gc_i)
         for u in layer.units:
             u.cycle(phase, g_i=layer.gc_i)
+        for u in silenced:
+            u.act, u.act_nd = 0.0, 0.0
 
-        layer.avg_act = np.mean(layer.activities)
+        layer.avg_act = masked_mean(np.array(layer.activities), layer.mask)
 
         layer.update_logs()
         self.cycle_count += 1
@@ -0,0 +1,100 @@
+"""Lesions: silencing units and cutting links, without rebuilding the network.
+
+The `mask` of a layer (see `Layer.set_mask()`) silences its units: a silenced
+unit has a zero activity, transmits nothing, and is left out of the averages of
+its layer that drive the inhibition (the mean net input and `avg_act`). The
+`mask` of a connection (see `Connection.set_mask()`) cuts its links: a cut link
+transmits nothing. Neither the cut links nor the links of silenced units learn,
+so that a lesion is not re-grown by learning, and their weights are kept:
+removing the mask restores the intact network.
+
+>>> network.connections[0].set_mask(network.connections[0].weights.ravel() > 0.3)
+>>> network.layers[1].set_mask([True, False, True, True, False])
+
+The masks are applied by the `Network`, the `Engine` and the `PopulationEngine`,
+and are read at every cycle: they can be toggled at any time, by modifying the
+mask arrays in place, without allocating memory. With the `Engine`, a mask can
+have a leading batch dimension, for a different lesion in each batch element of
+the states. `sweep()` uses it to settle many lesion configurations together (the
+weights of a connection with a batched mask are masked by chunks of batch elements,
+see `connection.MASK_CHUNK`):
+
+>>> acts = sweep(network, [{'hidden_layer': mask} for mask in hidden_masks], patterns)
+>>> acts['output_layer'].shape  # (configurations, patterns, units)
+(1000, 4, 2)
+
+The netin scaling of the connections counts the cut links, so that the input of
+the remaining links is unchanged.
+"""
+import numpy as np
+
+
+def assign_mask(current, mask, size):
+    """Return the mask array to store, given the current one (or None). See `Layer.set_mask()`.
+
+    The current array is updated in place, and returned, if it has the shape of `mask`.
+    """
+    if mask is None:
+        return None
+    mask = np.asarray(mask, dtype=bool)
+    assert mask.ndim in (1, 2) and mask.shape[-1] == size, \
+           'the mask must have shape ({0},) or (batch, {0}), not {1}'.format(size, mask.shape)
+    if current is not None and current.shape == mask.shape:
+        current[...] = mask
+        return current
+    return mask.copy()
+
+
+def masked_mean(values, mask):
+    """Mean of the values over the last axis, restricted to the units where `mask` is True."""
+    if mask is None:
+        return np.mean(values, axis=-1)
+    return np.sum(values * mask, axis=-1) / np.maximum(np.sum(mask, axis=-1), 1)
+
+
+def sweep(network, lesions, patterns, batch_size=256, **kwargs):
+    """Settle the patterns under each lesion. Return the settled activities of the layers.
+
+    The lesions are settled `batch_size` at a time, as the batch elements of an
+    `Engine` state, without learning. The masks of the network are restored afterward.
+
+    Parameters:
+        network     the network.
+        lesions     list of lesions, as dicts of layer name or Connection: mask. The
+                    layers and connections absent from a lesion keep their current mask.
+        patterns    list of input patterns, as in `Engine.settle`, settled in order.
+        batch_size  maximum number of lesions settled together.
+        kwargs      the other arguments of `Engine`.
+
+    Returns a dict of layer name: (lesions, patterns, units) array of the `act_m`.
+    """
+    from .engine import Engine  # avoiding circular imports
+
+    keys = []
+    for lesion in lesions:
+        keys.extend(key for key in lesion if not any(key is other for other in keys))
+    targets = [network._get_layer(key) if isinstance(key, str) else key for key in keys]
+    saved = [target.mask for target in targets]
+    defaults = [np.ones(len(target.units) if isinstance(key, str) else target.n_links, dtype=bool)
+                if mask is None else mask for key, target, mask in zip(keys, targets, saved)]
+
+    engine = Engine(network, **kwargs)
+    acts = {layer.name: np.empty((len(lesions), len(patterns), len(layer.units)))
+            for layer in network.layers}
+    try:
+        for target in targets:
+            target.mask = None  # not overwriting the saved masks in place
+        for start in range(0, len(lesions), batch_size):
+            batch = lesions[start:start + batch_size]
+            for key, target, default in zip(keys, targets, defaults):
+                target.set_mask([np.broadcast_to(lesion.get(key, default), default.shape)
+                                 for lesion in batch])
+            state = engine.new_state(batch=len(batch))
+            for p, inputs in enumerate(patterns):
+                engine.settle(state, inputs)
+                for layer, ls in zip(network.layers, state.layers):
+                    acts[layer.name][start:start + len(batch), p] = ls.act_m
+    finally:
+        for target, mask in zip(targets, saved):
+            target.mask = mask
+    return acts
@@ -0,0 +1,214 @@
+"""Memory footprint accounting.
+
+`network_memory()` (or `Network.memory_report()`) measures the bytes used by an
+existing network, broken down by owner (each layer and each connection) and by
+category:
+
+    weights     the connections's `wt` arrays.
+    learning    the learning buffers of the connections (`fwt` and `dwt`).
+    indexes     the pre and post unit indexes of non-dense connections, and the
+                link masks.
+    unit_state  the Unit objects and their dynamical variables, and the layers's own.
+    logs        the units's and layers's logs.
+    caches      Link views, precomputed activation function tables, and the
+                network's settle cache (owner 'network').
+
+`estimate_memory()` predicts the same breakdown for a proposed architecture,
+before constructing it. Sizes of Python objects are approximations computed with
+`sys.getsizeof`; array sizes are exact.
+"""
+import sys
+import collections
+
+import numpy as np
+
+
+CATEGORIES = ('weights', 'learning', 'indexes', 'unit_state', 'logs', 'caches')
+
+
+def deep_getsizeof(obj, seen=None):
+    """Approximate number of bytes used by an object and the containers it references.
+
+    Follows lists, tuples, sets, dicts (values only: keys are usually shared strings)
+    and the base of numpy views (a view counts its header, and the array owning its
+    data). Objects already in `seen` are not counted again, so that the data of
+    several views of an array is counted once.
+    """
+    if seen is None:
+        seen = set()
+    if obj is None or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_getsizeof(value, seen) for value in obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_getsizeof(item, seen) for item in obj)
+    elif isinstance(obj, np.ndarray) and obj.base is not None:
+        size += deep_getsizeof(obj.base, seen)
+    return size
+
+
+class MemoryReport:
+    """Bytes used, by owner and by category"""
+
+    def __init__(self):
+        self.rows = collections.OrderedDict()  # owner -> {category: bytes}
+
+    def add(self, owner, category, nbytes):
+        assert category in CATEGORIES, 'unknown category {}'.format(category)
+        row = self.rows.setdefault(owner, collections.OrderedDict((c, 0) for c in CATEGORIES))
+        row[category] += int(nbytes)
+
+    def total(self, category=None, owner=None):
+        """Total bytes, optionally restricted to a category and/or an owner."""
+        return sum(nbytes for row_owner, row in self.rows.items() for c, nbytes in row.items()
+                   if (category is None or c == category) and (owner is None or row_owner == owner))
+
+    def by_category(self):
+        return collections.OrderedDict((c, self.total(category=c)) for c in CATEGORIES)
+
+    def by_owner(self):
+        return collections.OrderedDict((owner, sum(row.values())) for owner, row in self.rows.items())
+
+    def __str__(self):
+        width = max([len('total')] + [len(owner) for owner in self.rows])
+        lines = ['{:{w}}  '.format('', w=width) + ' '.join('{:>10}'.format(c) for c in CATEGORIES)
+                 + ' {:>10}'.format('total')]
+        for owner, row in self.rows.items():
+            lines.append('{:{w}}  '.format(owner, w=width)
+                         + ' '.join('{:>10}'.format(format_bytes(n)) for n in row.values())
+                         + ' {:>10}'.format(format_bytes(sum(row.values()))))
+        lines.append('{:{w}}  '.format('total', w=width)
+                     + ' '.join('{:>10}'.format(format_bytes(n)) for n in self.by_category().values())
+                     + ' {:>10}'.format(format_bytes(self.total())))
+        return '\n'.join(lines)
+
+
+def format_bytes(nbytes):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if nbytes < 1024 or unit == 'GB':
+            return '{:.0f}{}'.format(nbytes, unit) if unit == 'B' else '{:.1f}{}'.format(nbytes, unit)
+        nbytes /= 1024
+
+
+def _array_bytes(array):
+    return 0 if array is None else array.nbytes
+
+
+def layer_owner(layer):
+    return 'layer {}'.format(layer.name)
+
+def connection_owner(connection):
+    return 'connection {}->{}'.format(connection.pre.name, connection.post.name)
+
+
+def _unit_state_bytes(unit, seen):
+    """Bytes of a Unit object and its state variables, excluding its spec and logs"""
+    size = sys.getsizeof(unit) + sys.getsizeof(unit.__dict__)
+    for name, value in unit.__dict__.items():
+        if name not in ('spec', 'logs', 'log_names'):
+            size += deep_getsizeof(value, seen)
+    return size
+
+def _layer_state_bytes(layer, seen):
+    size = sys.getsizeof(layer) + sys.getsizeof(layer.__dict__) + sys.getsizeof(layer.units)
+    for name, value in layer.__dict__.items():
+        if name not in ('spec', 'units', 'logs', 'from_connections', 'to_connections', 'name'):
+            size += deep_getsizeof(value, seen)
+    return size
+
+
+def network_memory(network):
+    """Return the MemoryReport of a network. See the module documentation."""
+    report = MemoryReport()
+    seen = set()  # objects shared between owners are only counted once
+
+    for layer in network.layers:
+        owner = layer_owner(layer)
+        report.add(owner, 'unit_state', _layer_state_bytes(layer, seen))
+        report.add(owner, 'logs', deep_getsizeof(layer.logs, seen))
+        for unit in layer.units:
+            report.add(owner, 'unit_state', _unit_state_bytes(unit, seen))
+            report.add(owner, 'logs', deep_getsizeof(unit.logs, seen))
+            report.add(owner, 'caches', deep_getsizeof(unit.spec._nxx1_conv, seen))
+
+    for conn in network.connections:
+        owner = connection_owner(conn)
+        report.add(owner, 'weights', _array_bytes(conn.wt))
+        report.add(owner, 'learning', _array_bytes(conn.fwt) + _array_bytes(conn.dwt))
+        if not conn.dense:
+            report.add(owner, 'indexes', _array_bytes(conn._pre_idx) + _array_bytes(conn._post_idx))
+        if conn.mask is not None:
+            report.add(owner, 'indexes', _array_bytes(conn.mask))
+        if conn._links is not None:
+            report.add(owner, 'caches', sys.getsizeof(conn._links) + sum(
+                sys.getsizeof(link) + sys.getsizeof(link.__dict__) for link in conn._links))
+
+    if network.settle_cache is not None:
+        report.add('network', 'caches', deep_getsizeof(network.settle_cache.entries, seen))
+    return report
+
+
+def _log_bytes(log_names, n_entries):
+    """Bytes of a logs dict holding `n_entries` floats for each name."""
+    return (sys.getsizeof({name: [] for name in log_names})
+            + len(log_names) * (sys.getsizeof([]) + n_entries * (8 + sys.getsizeof(0.5))))
+
+
+def estimate_memory(layers, connections, log_names=('net', 'I_net', 'v_m', 'act', 'v_m_eq', 'adapt'),
+                    logged_cycles=0, total_cycles=0, link_views=False, noisy_act=True):
+    """Predict the MemoryReport of a network before constructing it.
+
+    The per-object sizes of units, layers and links are measured on small sample
+    objects; the predictions of Python object sizes are therefore approximate, but
+    the sizes of the arrays of the connections are exact.
+
+    Parameters:
+        layers         list of (name, size) pairs.
+        connections    list of (pre name, post name, proj) triplets, with proj
+                       'full' or '1to1'.
+        log_names      names of the variables logged by each unit.
+        logged_cycles  number of cycles in the units's logs (they are reset at the
+                       beginning of each trial).
+        total_cycles   number of cycles executed by the network (the layers's logs
+                       are never reset).
+        link_views     if True, account for the Link views of the connections,
+                       created on the first access to `Connection.links`.
+        noisy_act      if True, account for the noisy XX1 table of the unit spec,
+                       shared by all layers (and accounted to the first one).
+    """
+    from .layer import Layer  # avoiding circular imports
+    from .unit import Unit, UnitSpec
+    from .connection import Link
+
+    sample_layer = Layer(0)
+    layer_bytes = _layer_state_bytes(sample_layer, set())
+    sample_unit = Unit(spec=UnitSpec(noisy_act=False), log_names=log_names)
+    sample_unit.add_excitatory(0.5)  # after one cycle, the state variables are distinct floats
+    sample_unit.cycle('minus')
+    unit_bytes  = _unit_state_bytes(sample_unit, set())
+    sample_link = Link(None, 0)
+    link_bytes  = sys.getsizeof(sample_link) + sys.getsizeof(sample_link.__dict__)
+
+    report = MemoryReport()
+    sizes = dict(layers)
+    for name, size in layers:
+        owner = 'layer {}'.format(name)
+        report.add(owner, 'unit_state', layer_bytes + size * (unit_bytes + 8))
+        report.add(owner, 'logs', _log_bytes(tuple(sample_layer.logs), total_cycles)
+                                  + size * _log_bytes(log_names, logged_cycles))
+    if noisy_act and len(layers) > 0:
+        report.add('layer {}'.format(layers[0][0]), 'caches', deep_getsizeof(UnitSpec().nxx1_table()))
+
+    for pre, post, proj in connections:
+        owner = 'connection {}->{}'.format(pre, post)
+        n = sizes[pre] * sizes[post] if proj == 'full' else sizes[post]
+        report.add(owner, 'weights', 8 * n)
+        report.add(owner, 'learning', 16 * n)  # fwt and dwt
+        if proj != 'full':
+            report.add(owner, 'indexes', 16 * n)  # pre_idx and post_idx
+        if link_views:
+            # the list of views is built element by element, and overallocated by ~1/8
+            report.add(owner, 'caches', sys.getsizeof([]) + n * (9 + link_bytes))
+    return report
@@ -0,0 +1,363 @@
+"""Trial metrics, computed as vectorized reductions at phase boundaries.
+
+A `Metrics` instance holds a list of `Metric`, and accumulates their values into
+running statistics over the current epoch. It is attached to a `Network`, or to a
+`NetworkState` of the `Engine` (for batched states, each batch element is a
+trial):
+
+>>> metrics = Metrics([SSE(), CosDiff(), AvgAct(), SettleCycles(), WeightChange()])
+>>> network.metrics = metrics
+>>> for inputs, outputs in patterns:
+...     network.set_inputs(inputs)
+...     network.set_outputs(outputs)
+...     network.trial()
+>>> metrics.end_epoch()
+{'sse': {'n': 4, 'mean': 0.12, 'std': 0.05, 'min': 0.06, 'max': 0.18}, ...}
+
+Metrics are computed from the activities at the end of the phases, not from logs.
+A metric can define the following methods, all receiving a view of the simulation
+(`NetworkView` or `StateView`):
+
+    trial_start(view)  at the start of the trial, after the inputs are forced.
+    cycle(view)        after each cycle. Only called if the metric defines it.
+    minus_end(view)    at the end of the minus phase.
+    values(view)       at the end of the trial (after learning), or after
+                       `settle()`. Returns a dict of name: (batch,) array.
+
+A trial ended by `settle()` has no plus phase, and its view has no targets: the
+metrics comparing the activities to the targets (`SSE`, `CosDiff`) have no value.
+"""
+import numpy as np
+
+from .lesion import masked_mean
+
+
+    ## Views of the simulation
+
+class NetworkView:
+    """Arrays of the activities of a `Network`, with a batch dimension of 1."""
+
+    def __init__(self, network, settled=False):
+        """
+        Parameters:
+            settled  True for the view of a trial ended by `settle()`, without targets.
+        """
+        self.network = network
+        self.batch   = 1
+        self.settled = settled
+
+    @property
+    def layer_names(self):
+        return [layer.name for layer in self.network.layers]
+
+    @property
+    def cycle(self):
+        """Cycle of the trial"""
+        return (self.network.quarter_nb - 1) * self.network.spec.quarter_size + self.network.cycle_count
+
+    @property
+    def phase(self):
+        return self.network.phase
+
+    @property
+    def cycle_tot(self):
+        return self.network.cycle_tot
+
+    def act(self, name):
+        return np.array([[u.act for u in self.network._get_layer(name).units]])
+
+    def act_m(self, name):
+        return np.array([[u.act_m for u in self.network._get_layer(name).units]])
+
+    def mask(self, name):
+        """Unit mask of a layer (see `Layer.set_mask()`), or None."""
+        return self.network._get_layer(name).mask
+
+    def var(self, name, var):
+        """Variable of a layer, as a (batch,) array, or of its units, as a (batch, size) array."""
+        layer = self.network._get_layer(name)
+        if hasattr(layer, var):
+            return np.array([getattr(layer, var)])
+        return np.array([[getattr(u, var) for u in layer.units]])
+
+    def force_activity(self, name, activities):
+        """Force the activities of a layer's units, until the end of the trial."""
+        self.network._get_layer(name).force_activity(activities)
+
+    @property
+    def targets(self):
+        """Activities forced on the output layers, as (batch, size) arrays."""
+        if self.settled:
+            return {}
+        return {name: np.atleast_2d(np.asarray(acts, dtype=float))
+                for name, acts in self.network._outputs.items()}
+
+    @property
+    def connections(self):
+        return self.network.connections
+
+
+class StateView:
+    """Arrays of the activities of a `NetworkState` of an `Engine`."""
+
+    def __init__(self, engine, state, settled=False):
+        """
+        Parameters:
+            settled  True for the view of a trial ended by `settle()`, without targets.
+        """
+        self.engine  = engine
+        self.state   = state
+        self.batch   = state.batch
+        self.settled = settled
+
+    @property
+    def layer_names(self):
+        return [ls.name for ls in self.state.layers]
+
+    @property
+    def cycle(self):
+        """Cycle of the trial"""
+        return (self.state.quarter_nb - 1) * self.engine.quarter_size + self.state.cycle_count
+
+    @property
+    def phase(self):
+        return self.state.phase
+
+    @property
+    def cycle_tot(self):
+        return self.state.cycle_tot
+
+    def act(self, name):
+        return self.state.layer(name).act
+
+    def act_m(self, name):
+        return self.state.layer(name).act_m
+
+    def mask(self, name):
+        """Unit mask of a layer (see `Layer.set_mask()`), or None."""
+        return self.engine.network._get_layer(name).mask
+
+    def var(self, name, var):
+        """Variable of a layer, as a (batch,) array, or of its units, as a (batch, size) array."""
+        if var == 'net':
+            return self.engine.net(self.state, name)
+        return getattr(self.state.layer(name), var)
+
+    def force_activity(self, name, activities):
+        """Force the activities of a layer's units, until the end of the trial."""
+        self.engine.force_activity(self.state, name, activities)
+
+    @property
+    def targets(self):
+        """Activities forced on the output layers, as (batch, size) arrays."""
+        if self.settled:
+            return {}
+        return {name: np.broadcast_to(np.asarray(acts, dtype=float), self.state.layer(name).act.shape)
+                for name, acts in self.state.outputs.items()}
+
+    @property
+    def connections(self):
+        return [conn for conn, _, _ in self.engine.connections]
+
+
+    ## Metrics
+
+class Metric:
+    """Base class of the metrics. See the module documentation."""
+
+    def trial_start(self, view):
+        pass
+
+    def minus_end(self, view):
+        pass
+
+    def values(self, view):
+        raise NotImplementedError
+
+
+class SSE(Metric):
+    """Sum of squared errors between the minus phase activities and the targets.
+
+    No value without targets.
+    """
+
+    def __init__(self, layers=None):
+        """
+        Parameters:
+            layers  names of the output layers to consider. If None, all the layers
+                    with a target. The layers without a target are skipped.
+        """
+        self.layers = layers
+
+    def values(self, view):
+        targets = view.targets
+        names = [name for name in (self.layers or targets) if name in targets]
+        if not names:
+            return {}
+        sse = np.zeros(view.batch)
+        for name in names:
+            sse += np.sum((targets[name] - view.act_m(name))**2, axis=-1)
+        return {'sse': sse}
+
+
+class CosDiff(Metric):
+    """Cosine between the minus phase activities and the targets of the output layers.
+
+    As the targets are the plus phase activities of the output layers, this is the
+    emergent `cos_diff`. 1.0 for a perfect prediction. No value without targets.
+    """
+
+    def __init__(self, layers=None):
+        self.layers = layers
+
+    def values(self, view):
+        targets = view.targets
+        names = [name for name in (self.layers or targets) if name in targets]
+        if not names:
+            return {}
+        act_m  = np.concatenate([view.act_m(name) for name in names], axis=-1)
+        target = np.concatenate([targets[name] for name in names], axis=-1)
+        norms = np.linalg.norm(act_m, axis=-1) * np.linalg.norm(target, axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cos = np.sum(act_m * target, axis=-1) / norms
+        return {'cos_diff': np.where(norms > 0, cos, 0.0)}
+
+
+class AvgAct(Metric):
+    """Average minus phase activity of each layer, as 'avg_act/<layer name>'.
+
+    The silenced units of the layers (see `Layer.set_mask()`) are left out.
+    """
+
+    def __init__(self, layers=None):
+        self.layers = layers
+
+    def values(self, view):
+        return {'avg_act/{}'.format(name): masked_mean(view.act_m(name), view.mask(name))
+                for name in (self.layers or view.layer_names)}
+
+
+class SettleCycles(Metric):
+    """Number of cycles of the minus phase before the activities settle.
+
+    The activities are settled after the last cycle during which an activity
+    changed by more than `tol`.
+    """
+
+    def __init__(self, tol=1e-3, layers=None):
+        self.tol    = tol
+        self.layers = layers
+
+    def trial_start(self, view):
+        self._acts = None
+        self._settled = np.zeros(view.batch)
+
+    def cycle(self, view):
+        if view.phase != 'minus':
+            return
+        acts = [np.array(view.act(name)) for name in (self.layers or view.layer_names)]
+        if self._acts is not None:
+            change = np.max([np.max(np.abs(act - prev), axis=-1)
+                             for act, prev in zip(acts, self._acts)], axis=0)
+            self._settled = np.where(change > self.tol, view.cycle, self._settled)
+        self._acts = acts
+
+    def values(self, view):
+        return {'settle_cycles': self._settled}
+
+
+class WeightChange(Metric):
+    """Norm of the change of the weights of the learning connections during the trial.
+
+    The value is the same for all batch elements, as the weights are shared.
+    """
+
+    def minus_end(self, view):
+        self._wts = [conn.wt.copy() if conn.spec.lrule is not None else None
+                     for conn in view.connections]
+
+    def values(self, view):
+        sq_change = sum(np.sum((conn.wt - wt)**2) for conn, wt in zip(view.connections, self._wts)
+                        if wt is not None)
+        return {'wt_change': np.full(view.batch, np.sqrt(sq_change))}
+
+
+    ## Accumulation
+
+class RunningStats:
+    """Running count, mean, variance, min and max of a stream of values.
+
+    The values are added by arrays, merged with the statistics of the previous ones
+    (Chan et al.'s parallel variant of Welford's algorithm).
+    """
+
+    def __init__(self):
+        self.n, self.mean, self._m2 = 0, 0.0, 0.0
+        self.min, self.max = np.inf, -np.inf
+
+    def add(self, values):
+        values = np.ravel(np.asarray(values, dtype=float))
+        if len(values) == 0:
+            return
+        n, mean = len(values), np.mean(values)
+        total = self.n + n
+        delta = mean - self.mean
+        self._m2  += np.sum((values - mean)**2) + delta**2 * self.n * n / total
+        self.mean += delta * n / total
+        self.n     = total
+        self.min, self.max = min(self.min, np.min(values)), max(self.max, np.max(values))
+
+    @property
+    def std(self):
+        return np.sqrt(self._m2 / self.n) if self.n > 0 else 0.0
+
+    def summary(self):
+        return {'n': self.n, 'mean': float(self.mean), 'std': float(self.std),
+                'min': float(self.min), 'max': float(self.max)}
+
+
+class Metrics:
+    """A set of metrics, and their running statistics over the current epoch."""
+
+    def __init__(self, metrics):
+        self.metrics = list(metrics)
+        self._cycle_metrics = [m for m in self.metrics if hasattr(m, 'cycle')]
+        self.last    = {}  # values of the last trial, name: (batch,) array
+        self.stats   = {}  # name: RunningStats, over the current epoch
+        self.history = []  # summaries of the previous epochs
+
+    @property
+    def needs_cycles(self):
+        return len(self._cycle_metrics) > 0
+
+    def trial_start(self, view):
+        for metric in self.metrics:
+            metric.trial_start(view)
+
+    def cycle(self, view):
+        for metric in self._cycle_metrics:
+            metric.cycle(view)
+
+    def minus_end(self, view):
+        for metric in self.metrics:
+            metric.minus_end(view)
+
+    def trial_end(self, view):
+        """Compute the values of the metrics, and add them to the epoch statistics."""
+        self.last = {}
+        for metric in self.metrics:
+            self.last.update(metric.values(view))
+        for name, values in self.last.items():
+            self.stats.setdefault(name, RunningStats()).add(values)
+        return self.last
+
+    def epoch_stats(self):
+        """Return the statistics of the current epoch, as a dict of name: summary dict."""
+        return {name: stats.summary() for name, stats in self.stats.items()}
+
+    def end_epoch(self):
+        """Return the statistics of the current epoch, and start a new epoch."""
+        summary = self.epoch_stats()
+        self.history.append(summary)
+        self.stats = {}
+        return summary
@@ -1,3 +1,10 @@
+import copy
+
+import numpy as np
+from . import memory
+from .metrics import NetworkView
+from .hooks import Hooks
+
 
 class NetworkSpec:
     """Network parameters"""
@@ -5,6 +12,13 @@ class NetworkSpec:
     def __init__(self, quarter_size = 25, **kwargs):
         # number of cycles in a settle period
         self.quarter_size = quarter_size
+        # seed of the network's random generator. If not None, the weights of the
+        # connections are drawn from it when the network is created.
+        self.seed = None
+        # number of trials whose weight changes are accumulated in `dwt` before being
+        # applied to the weights (emergent's SMALL_BATCH weight update). If 1, the
+        # weights are updated after every trial.
+        self.small_batch_n = 1
 
         for key, value in kwargs.items():
             assert hasattr(self, key) # making sure the parameter exists.
@@ -24,17 +38,63 @@ class Network:
         self.quarter_nb  = 1 # current quarter number (1, 2, 3 or 4)
         self.trial_count = 0 # number of trial finished
         self.phase       = 'minus'
+        self.n_dwt_trials = 0 # number of trials accumulated in the connections's `dwt`
 
         self.layers      = list(layers)
         self.connections = list(connections)
 
         self._inputs, self._outputs = {}, {}
+        self.metrics  = None  # a `metrics.Metrics` instance, computed during the trials
+        self.recorder = None  # a `trace.TraceRecorder` instance, recording every cycle
+        self.settle_cache = None  # a `cache.SettleCache` instance, used by `settle()`
+        self.hooks    = Hooks()  # functions called at the events of the simulation (see `hooks`)
+        self.rng = np.random.default_rng(self.spec.seed)
+        if self.spec.seed is not None:
+            self.init_weights()
         self.build()
 
+    def clone(self):
+        """Return a copy of the network, cheap to create and to store.
+
+        The weights of the connections are shared copy-on-write: they are read-only,
+        in the network and in its clones, until one of them modifies them (by learning,
+        or by the methods setting weights), and copies the arrays of the modified
+        connections only. The specs are shared, as between the units of a layer: to
+        change the parameters of a clone, assign it a copy (`copy.deepcopy(spec)`).
+        The units and layers, with their state and logs, are copied. The clone has no
+        metrics, recorder, settle cache nor hooks.
+        """
+        network = copy.copy(self)
+        layers = {id(layer): layer.clone() for layer in self.layers}
+        network.layers = list(layers.values())
+        network.connections = [conn.clone(layers[id(conn.pre)], layers[id(conn.post)])
+                               for conn in self.connections]
+        network._inputs, network._outputs = dict(self._inputs), dict(self._outputs)
+        network.rng = copy.deepcopy(self.rng)
+        return network
+
+    def __getstate__(self):
+        """Copy and pickle the network without its metrics, recorder, settle cache and hooks.
+
+        They are attached to one simulation, and may hold threads, large caches or
+        unpicklable functions.
+        """
+        state = self.__dict__.copy()
+        state.update(metrics=None, recorder=None, settle_cache=None, hooks=Hooks())
+        return state
+
     def add_connection(self, connection):
+        """Add a connection. If the network is seeded, its weights are drawn from the network's generator."""
         self.connections.append(connection)
+        if self.spec.seed is not None:
+            connection.init_weights(rng=self.rng)
         self.build()
 
+    def init_weights(self):
+        """Draw new initial weights for all connections, from the network's random generator."""
+        for connection in self.connections:
+            connection.init_weights(rng=self.rng)
+
     def add_layer(self, layer):
         self.layers.append(layer)
 
@@ -102,16 +162,22 @@ class Network:
                 # force activities for inputs
                 for name, activities in self._inputs.items():
                     self._get_layer(name).force_activity(activities)
+                if self.metrics is not None:
+                    self.metrics.trial_start(NetworkView(self))
+                self.hooks.call('trial_start', NetworkView, self)
 
             elif self.quarter_nb == 4: # start of plus phase
                 # force activities for outputs
                 for name, activities in self._outputs.items():
                     self._get_layer(name).force_activity(activities)
+                self.hooks.call('plus_start', NetworkView, self)
+            self.hooks.call('quarter_start', NetworkView, self)
 
 
     def _post_cycle(self):
         """Same as _pre_cycle, but after the cycle has executed"""
         if self.cycle_count == self.spec.quarter_size: # end of a quarter
+            self.hooks.call('quarter_end', NetworkView, self)
             if self.quarter_nb == 3: # end of minus phase
                 self.end_minus_phase()
 
@@ -121,23 +187,36 @@ class Network:
 
     def cycle(self):
         """Execute a cycle"""
+        self._cycle(self.hooks if self.hooks.per_cycle else None)
+
+    def _cycle(self, hooks=None):
+        """Execute a cycle, calling the cycle hooks of `hooks` if not None."""
         self._pre_cycle()
+        if hooks is not None:
+            hooks.call('cycle_start', NetworkView, self)
 
-        for conn in self.connections:
+        for conn in self.connections:  # all transmit before any unit is updated
             conn.cycle()
         for layer in self.layers:
             layer.cycle(self.phase)
         self.cycle_count += 1
         self.cycle_tot   += 1
+        if self.metrics is not None and self.metrics.needs_cycles:
+            self.metrics.cycle(NetworkView(self))
+        if self.recorder is not None:
+            self.recorder.record(NetworkView(self))
+        if hooks is not None:
+            hooks.call('cycle_end', NetworkView, self)
 
         self._post_cycle()
 
 
     def quarter(self): # FIXME:
         """Execute a quarter"""
-        self.cycle()
+        hooks = self.hooks if self.hooks.per_cycle else None  # looked up once per quarter
+        self._cycle(hooks)
         while self.cycle_count < self.spec.quarter_size:
-            self.cycle()
+            self._cycle(hooks)
 
 
     def trial(self):
@@ -148,6 +227,83 @@ class Network:
             self.quarter()
         return self.compute_sse()
 
+    def settle(self):
+        """Execute the minus phase of a trial, without plus phase nor learning.
+
+        Used for inference: the settled activities are available in the units's `act_m`.
+        The next cycle starts a new trial. Must be called between trials. If
+        `settle_cache` is set, the settled state is restored from it when the same
+        inputs were settled with the same weights (see the `cache` module).
+        """
+        assert ((self.cycle_count == 0 and self.quarter_nb == 1) or
+                (self.cycle_count == self.spec.quarter_size and self.quarter_nb == 4)), \
+               'settle() must be called between trials'
+        key, cache = None, self.settle_cache
+        if cache is not None:
+            if cache.usable(self):
+                key = cache.key(self)
+                entry = cache.get(key)
+                if entry is not None:
+                    self._restore_settled(entry)
+                    return
+            else:
+                cache.bypasses += 1
+
+        self.quarter()
+        while self.quarter_nb != 3:
+            self.quarter()
+        # skipping the plus phase
+        self.quarter_nb = 4
+        self.phase = 'minus'
+        if key is not None:
+            cache.put(key, self)
+        if self.metrics is not None:
+            self.metrics.trial_end(NetworkView(self, True))
+        self.hooks.call('trial_end', NetworkView, self, True)
+
+    def _restore_settled(self, entry):
+        """Start a trial and set its settled state from a cache entry, without simulating it."""
+        if self.quarter_nb == 4:
+            self.trial_count += 1
+        for layer in self.layers:
+            layer.trial_init()
+        for name, activities in self._inputs.items():
+            self._get_layer(name).force_activity(activities)
+        if self.metrics is not None:
+            self.metrics.trial_start(NetworkView(self))
+        self.settle_cache.restore(entry, self)
+        self.cycle_count, self.quarter_nb, self.phase = self.spec.quarter_size, 4, 'minus'
+        if self.metrics is not None:
+            view = NetworkView(self, True)
+            self.metrics.minus_end(view)
+            self.metrics.trial_end(view)
+
+    def _count_dwt_trial(self):
+        """Count a trial whose weight changes are accumulated. Return True if they must be applied."""
+        self.n_dwt_trials += 1
+        if self.n_dwt_trials < self.spec.small_batch_n:
+            return False
+        self.n_dwt_trials = 0
+        return True
+
+    def update_weights(self):
+        """Apply the weight changes accumulated since the last update (see `NetworkSpec.small_batch_n`).
+
+        Useful at the end of training, when the number of trials is not a multiple
+        of `small_batch_n`.
+        """
+        for conn in self.connections:
+            conn.update_weights()
+        self.n_dwt_trials = 0
+
+    def memory_report(self):
+        """Return the bytes used by the network, by layer and connection, and by category.
+
+        See the `memory` module for the categories, and `memory.estimate_memory()` to
+        predict the footprint of an architecture before constructing it.
+        """
+        return memory.network_memory(self)
+
     def compute_sse(self):
         """Compute the sum of squared error in prediction (SSE).
 
@@ -165,13 +321,21 @@ class Network:
             for unit in layer.units:
                 unit.act_m = unit.act
         self.phase = 'plus'
+        if self.metrics is not None:
+            self.metrics.minus_end(NetworkView(self))
+        self.hooks.call('minus_end', NetworkView, self)
 
     def end_plus_phase(self):
-        """End of the plus phase. Connections change weights."""
+        """End of the plus phase. Connections accumulate weight changes, and apply them
+        every `small_batch_n` trials."""
+        apply = self._count_dwt_trial()
         for conn in self.connections:
-            conn.learn()
+            conn.learn(apply=apply)
         for layer in self.layers:
             for unit in layer.units:
                 unit.update_avg_l()
 
         self.phase = 'minus'
+        if self.metrics is not None:
+            self.metrics.trial_end(NetworkView(self))
+        self.hooks.call('trial_end', NetworkView, self)
@@ -0,0 +1,111 @@
+"""Neuromodulation of the activation threshold of the units, for the `Engine`.
+
+Dopamine and adenosine modulate the activation threshold `act_thr` of the units
+through four receptors, D1 and D2 (dopamine), A1 and A2 (adenosine):
+
+    act_thr = logistic(c_act_thr - r_D1 + r_A1 + r_D2 - r_A2)
+
+where `c_act_thr` is the unit spec's parameter, and `r_X` is the activation of the
+receptor X of the unit: its density times its occupancy by the neuromodulator,
+`c / (c + K_X)`, for a concentration `c` and an affinity (dissociation constant)
+`K_X`. This is the vectorized, working version of `UnitSpec.cycle_da`.
+
+The receptor densities are per-unit arrays, set per layer; layers without any
+receptor keep the constant `act_thr` of their unit spec, at no cost. The
+concentrations are signals, evaluated at each cycle:
+
+    - a number, for a constant concentration.
+    - a sequence, giving the concentration at each cycle of the trial (cycle `t`
+      of the trial being `(quarter_nb - 1) * quarter_size + cycle_count`). The
+      last value is kept if the trial is longer than the sequence.
+    - a callable `f(state, t)`, called with the NetworkState and the cycle of the
+      trial.
+
+A signal may return a (batch,) array, to give each batch element its own
+concentration.
+
+>>> neuromod = Neuromodulation()
+>>> neuromod.set_density('hidden_layer', 'D1', np.linspace(0.0, 1.0, 5))
+>>> neuromod.set_concentration('dopamine', [0.0] * 75 + [2.0] * 25)  # plus phase burst
+>>> engine = Engine(network, neuromodulation=neuromod)
+"""
+import collections
+
+import numpy as np
+
+
+# receptor: (neuromodulator, sign of its effect on the activation threshold)
+RECEPTORS = collections.OrderedDict([('D1', ('dopamine',  -1.0)),
+                                     ('D2', ('dopamine',   1.0)),
+                                     ('A1', ('adenosine',  1.0)),
+                                     ('A2', ('adenosine', -1.0))])
+
+
+class Neuromodulation:
+    """Receptor densities of the layers and neuromodulator concentrations."""
+
+    def __init__(self, affinities=None):
+        """
+        Parameters:
+            affinities  dict of the dissociation constants of the receptors, in the
+                        same unit as the concentrations. Default to 1.0.
+        """
+        self.affinities = {receptor: 1.0 for receptor in RECEPTORS}
+        self.affinities.update(affinities or {})
+        assert set(self.affinities) == set(RECEPTORS), 'unknown receptor in {}'.format(affinities)
+        self.densities = {}  # layer name -> {receptor: (size,) array}
+        self.signals   = {neuromodulator: 0.0 for neuromodulator, _ in RECEPTORS.values()}
+
+    def set_density(self, layer_name, receptor, density):
+        """Set the density of a receptor on the units of a layer.
+
+        density  a number, or an array with one value per unit of the layer.
+        """
+        assert receptor in RECEPTORS, "unknown receptor '{}'".format(receptor)
+        self.densities.setdefault(layer_name, {})[receptor] = np.array(density, dtype=float)
+
+    def set_concentration(self, neuromodulator, signal):
+        """Set the concentration signal of a neuromodulator. See the module documentation."""
+        assert neuromodulator in self.signals, "unknown neuromodulator '{}'".format(neuromodulator)
+        if not callable(signal) and np.ndim(signal) > 0:
+            signal = np.array(signal, dtype=float)
+        self.signals[neuromodulator] = signal
+
+    def concentration(self, neuromodulator, state, t):
+        """Concentration of a neuromodulator at the cycle `t` of the trial.
+
+        Returns a number, or a (batch, 1) array.
+        """
+        signal = self.signals[neuromodulator]
+        if callable(signal):
+            value = signal(state, t)
+        elif np.ndim(signal) > 0:
+            value = signal[min(t, len(signal) - 1)]
+        else:
+            value = signal
+        return value if np.ndim(value) == 0 else np.reshape(value, (-1, 1))
+
+    def occupancies(self, state, t):
+        """Occupancy of each receptor at the cycle `t` of the trial.
+
+        Computed once per cycle, and shared by all layers.
+        """
+        concentrations = {neuromodulator: self.concentration(neuromodulator, state, t)
+                          for neuromodulator in self.signals}
+        return {receptor: concentrations[neuromodulator] / (concentrations[neuromodulator]
+                                                            + self.affinities[receptor])
+                for receptor, (neuromodulator, _) in RECEPTORS.items()}
+
+    def act_thr(self, layer_name, unit_spec, occupancies):
+        """Activation threshold of the units of a layer, for a (frozen or not) UnitSpec.
+
+        Returns the unit spec's `act_thr` if the layer has no receptors, else a
+        (size,) or (batch, size) array.
+        """
+        densities = self.densities.get(layer_name)
+        if not densities:
+            return unit_spec.act_thr
+        drive = unit_spec.c_act_thr
+        for receptor, density in densities.items():
+            drive = drive + RECEPTORS[receptor][1] * density * occupancies[receptor]
+        return 1.0 / (1 + np.exp(-drive))  # logistic function, as `UnitSpec.logistic`
@@ -0,0 +1,264 @@
+"""Data-parallel training of a network over several worker processes.
+
+Each worker holds a replica of the network, and trains it on a disjoint shard of
+every epoch. Every `sync_interval` trials, the replicas write the changes they
+accumulated since the last synchronization into a shared memory buffer, and all
+replicas merge them into the same new parameters. The merged parameters are the
+fast weights of the learning connections (`fwt`, from which `wt` is derived, as
+`dwt` is zero once the weights are updated) and the long-term averages of the
+units (`avg_l`), which are always averaged. With small batch weight updates
+(`NetworkSpec.small_batch_n` > 1), the replicas apply their pending weight changes
+before synchronizing, and at the end of training: a `sync_interval` multiple of
+`small_batch_n` keeps the batches whole.
+
+With a single worker, training is identical to sequential training (followed by
+`Network.update_weights()`, with small batch weight updates).
+"""
+import copy
+import math
+import time
+import queue
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .shared import attach_shared_memory
+
+
+MERGE_MODES = 'average', 'sum'
+
+
+def epoch_orders(n_patterns, n_epochs, shuffle=True, seed=0):
+    """Return the order of presentation of the patterns for each epoch."""
+    rng = np.random.RandomState(seed)
+    if shuffle:
+        return [rng.permutation(n_patterns) for _ in range(n_epochs)]
+    return [np.arange(n_patterns) for _ in range(n_epochs)]
+
+
+def _learning_connections(network):
+    return [conn for conn in network.connections if conn.spec.lrule is not None]
+
+
+def get_params(network):
+    """Return the flat vector of the parameters that are merged across replicas.
+
+    The vector is composed of the `fwt` values of the learning connections,
+    followed by the `avg_l` values of all the units, in network order.
+    """
+    values = [conn.link_values('fwt') for conn in _learning_connections(network)]
+    values += [np.array([u.avg_l for u in layer.units], dtype=float)
+               for layer in network.layers]
+    return np.concatenate(values) if len(values) > 0 else np.zeros(0)
+
+def set_params(network, params):
+    """Set the parameters returned by `get_params()`. `wt` is recomputed from `fwt`."""
+    start = 0
+    for conn in _learning_connections(network):
+        fwt = params[start:start + conn.n_links]
+        conn.set_link_values('fwt', fwt)
+        conn.set_link_values('wt', np.clip(conn.spec.sig(fwt), 0.0, 1.0))
+        start += conn.n_links
+    for layer in network.layers:
+        for unit, avg_l in zip(layer.units, params[start:start + len(layer.units)]):
+            unit.avg_l = float(avg_l)
+        start += len(layer.units)
+    assert start == len(params)
+
+def _n_weights(network):
+    return sum(conn.n_links for conn in _learning_connections(network))
+
+
+def merge_params(base, deltas, n_weights, merge='average'):
+    """Merge the parameters changes of several replicas.
+
+    base      the parameters at the last synchronization.
+    deltas    array of shape (n_workers, n_params), changes of each replica since then.
+    n_weights number of weights values at the start of the parameters vector. Those
+              are merged according to `merge`, and clipped to [0, 1], the range of `fwt`.
+              The remaining values (`avg_l`) are always averaged.
+    """
+    merged = base + np.mean(deltas, axis=0)
+    if merge == 'sum':
+        merged[:n_weights] = base[:n_weights] + np.sum(deltas[:, :n_weights], axis=0)
+    np.clip(merged[:n_weights], 0.0, 1.0, out=merged[:n_weights])  # summed changes can overshoot
+    return merged
+
+
+def _run_trials(network, patterns, indexes):
+    """Run one trial per pattern index, and return the list of SSE values"""
+    sses = []
+    for k in indexes:
+        inputs, outputs = patterns[k]
+        network.set_inputs(inputs)
+        network.set_outputs(outputs)
+        sses.append(network.trial())
+    return sses
+
+def train_sequential(network, patterns, orders):
+    """Train the network sequentially, one epoch per order. Return the mean SSE of each epoch."""
+    return np.array([np.mean(_run_trials(network, patterns, order)) for order in orders])
+
+
+def _worker(rank, n_workers, network, patterns, orders, sync_interval, merge,
+            shm_name, n_params, barrier, results):
+    """Worker process: train the replica on its shards, synchronizing with the others."""
+    shm = attach_shared_memory(shm_name)
+    try:
+        buf = np.ndarray((n_workers + 1, n_params), dtype=np.float64, buffer=shm.buf)
+        n_weights = _n_weights(network)
+        base = get_params(network)
+        for epoch, order in enumerate(orders):
+            positions = np.arange(rank, len(order), n_workers)  # this worker's shard
+            n_rounds = math.ceil(len(range(0, len(order), n_workers)) / sync_interval)
+            sses = []
+            for r in range(n_rounds):
+                round_pos = positions[r * sync_interval:(r + 1) * sync_interval]
+                round_sses = _run_trials(network, patterns, order[round_pos])
+                sses.extend(zip(round_pos, round_sses))
+
+                if network.n_dwt_trials > 0:  # publishing the pending weight changes
+                    network.update_weights()
+                if n_workers > 1:
+                    buf[rank] = get_params(network) - base
+                    barrier.wait()
+                    base = merge_params(base, buf[:n_workers], n_weights, merge=merge)
+                    barrier.wait()  # everyone has read the deltas before they are overwritten
+                    set_params(network, base)
+                else:
+                    base = get_params(network)
+                if rank == 0:
+                    buf[n_workers] = base
+            results.put((rank, epoch, sses))
+    except Exception:
+        barrier.abort()
+        results.put((rank, None, traceback.format_exc()))
+    finally:
+        shm.close()
+
+
+class ParallelTrainer:
+    """Train a network on several worker processes (data parallelism)"""
+
+    def __init__(self, network, n_workers=2, sync_interval=1, merge='average',
+                 shuffle=True, seed=0, context=None, poll_interval=1.0):
+        """
+        network        the network to train. At the end of `train()`, it holds the
+                       merged parameters.
+        n_workers      number of worker processes.
+        sync_interval  number of trials each worker executes between synchronizations.
+        merge          'average' or 'sum': how the weight changes of the workers are
+                       combined.
+        shuffle        if True, the patterns are presented in a random order every epoch.
+        seed           seed of the presentation orders.
+        context        multiprocessing context (default: the default context).
+        poll_interval  seconds between checks that the workers are still alive, while
+                       waiting for their results.
+        """
+        assert n_workers >= 1
+        assert sync_interval >= 1
+        assert merge in MERGE_MODES, 'merge should be one of {}'.format(MERGE_MODES)
+        self.network       = network
+        self.n_workers     = n_workers
+        self.sync_interval = sync_interval
+        self.merge         = merge
+        self.shuffle       = shuffle
+        self.seed          = seed
+        self.context       = context if context is not None else multiprocessing.get_context()
+        self.poll_interval = poll_interval
+
+        self.trials_per_sec = None  # throughput of the last call to `train()`
+
+    def train(self, patterns, n_epochs=1, orders=None):
+        """Train the network, and return the mean SSE of each epoch.
+
+        patterns  a list of (inputs, outputs) pairs, each a dict with layer names as
+                  keys and activities as values (see `Network.set_inputs()`).
+        orders    the presentation order of each epoch. If None, computed with
+                  `epoch_orders()` from `n_epochs`, `shuffle` and `seed`.
+        """
+        if orders is None:
+            orders = epoch_orders(len(patterns), n_epochs, shuffle=self.shuffle, seed=self.seed)
+        n_params = len(get_params(self.network))
+
+        ctx = self.context
+        shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * (self.n_workers + 1) * n_params))
+        try:
+            barrier = ctx.Barrier(self.n_workers)
+            results = ctx.Queue()
+            start = time.perf_counter()
+            workers = [ctx.Process(target=_worker,
+                                   args=(rank, self.n_workers, self.network, patterns, orders,
+                                         self.sync_interval, self.merge, shm.name, n_params,
+                                         barrier, results))
+                       for rank in range(self.n_workers)]
+            for worker in workers:
+                worker.start()
+
+            epoch_sses = [np.zeros(len(order)) for order in orders]
+            n_results = 0
+            while n_results < self.n_workers * len(orders):
+                try:
+                    rank, epoch, sses = results.get(timeout=self.poll_interval)
+                except queue.Empty:  # checking for workers killed without reporting
+                    for rank, worker in enumerate(workers):
+                        if worker.exitcode not in (None, 0):
+                            for other in workers:
+                                other.terminate()
+                            raise RuntimeError('worker {} exited with code {}'.format(
+                                               rank, worker.exitcode))
+                    continue
+                n_results += 1
+                if epoch is None:
+                    for worker in workers:
+                        worker.terminate()
+                    raise RuntimeError('worker {} failed:\n{}'.format(rank, sses))
+                for pos, sse in sses:
+                    epoch_sses[epoch][pos] = sse
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            buf = np.ndarray((self.n_workers + 1, n_params), dtype=np.float64, buffer=shm.buf)
+            set_params(self.network, buf[self.n_workers].copy())
+        finally:
+            shm.close()
+            shm.unlink()
+
+        self.network.trial_count += sum(len(order) for order in orders)
+        self.trials_per_sec = sum(len(order) for order in orders) / elapsed
+        return np.array([np.mean(sses) for sses in epoch_sses])
+
+
+def scaling_report(network, patterns, n_epochs=1, workers=(1, 2, 4), sync_interval=1,
+                   merge='average', shuffle=True, seed=0):
+    """Compare parallel training with sequential training.
+
+    The network is not modified: every run trains a copy of it. All runs use the same
+    presentation orders. Return a list of dicts, one for the sequential run (with 0
+    workers) and one for each number of workers, with keys:
+        workers         number of worker processes.
+        trials_per_sec  throughput of the run.
+        speedup         throughput relative to the sequential run.
+        sse_curve       mean SSE of each epoch.
+        sse_diff        maximum absolute difference with the sequential SSE curve.
+    """
+    orders = epoch_orders(len(patterns), n_epochs, shuffle=shuffle, seed=seed)
+    n_trials = sum(len(order) for order in orders)
+
+    start = time.perf_counter()
+    seq_curve = train_sequential(copy.deepcopy(network), patterns, orders)
+    seq_tps = n_trials / (time.perf_counter() - start)
+    report = [{'workers': 0, 'trials_per_sec': seq_tps, 'speedup': 1.0,
+               'sse_curve': seq_curve, 'sse_diff': 0.0}]
+
+    for n_workers in workers:
+        trainer = ParallelTrainer(copy.deepcopy(network), n_workers=n_workers,
+                                  sync_interval=sync_interval, merge=merge)
+        curve = trainer.train(patterns, orders=orders)
+        report.append({'workers': n_workers, 'trials_per_sec': trainer.trials_per_sec,
+                       'speedup': trainer.trials_per_sec / seq_tps, 'sse_curve': curve,
+                       'sse_diff': float(np.max(np.abs(curve - seq_curve)))})
+    return report
@@ -0,0 +1,197 @@
+"""Population mode: many members of the same architecture, with different parameters, in lockstep.
+
+A `PopulationEngine` is compiled once from a network, for a population of `size`
+members. The members share the architecture of the network, and differ by the
+values of some parameters of their specs, given as one value per member. The
+members are the batch elements of the engine's states, so that the population
+advances with one vectorized update per cycle. Each member has its own weights,
+stacked in (size, n_links) arrays initialized from the network's weights, and
+learns independently:
+
+>>> population = PopulationEngine(network, size=64, params={
+...     'hidden_layer':          {'g_i': np.linspace(1.5, 2.5, 64), 'act_thr': thresholds},
+...     network.connections[0]:  {'lrate': np.logspace(-3, -1, 64)}})
+>>> state = population.new_state()
+>>> for inputs, outputs in 20 * patterns:
+...     sse = population.trial(state, inputs, outputs)   # the SSE of each member
+>>> best = population.member_network(np.argmin(sse))
+
+The parameters of a layer, given by its name, are the ones of its `LayerSpec`
+listed in `LAYER_PARAMS`, and the numeric parameters of the `UnitSpec` of its
+units. The parameters of a connection, given by the `Connection` object, are the
+ones listed in `CONNECTION_PARAMS`. The parameters used when building the network
+(projections, initial weights, netin scaling) are shared by all members. The
+units of a layer with their own parameters (see `Layer.set_unit_params()`) keep
+them in all the members: the parameters of their unit spec cannot vary.
+Parameters from which non-numeric constants are derived (`act_gain` and `act_sd`,
+which define the noisy activation function table) cannot vary either.
+
+The specs of the members are frozen records (see `spec.FrozenSpec`) whose varying
+parameters and derived constants are arrays, with one value per member: the
+equations of the `Engine` are computed unchanged, by broadcasting.
+"""
+import copy
+
+import numpy as np
+
+from .engine import Engine
+
+
+LAYER_PARAMS      = ('fb_dt', 'fb', 'ff', 'g_i', 'ff0', 'trial_decay')
+CONNECTION_PARAMS = ('wt_scale_abs', 'lrate', 'm_lrn', 'd_thr', 'd_rev', 'sig_off', 'sig_gain')
+
+
+def member_record(spec, values, shape):
+    """Return the frozen record of a spec, with parameters varying across members.
+
+    Parameters:
+        spec    the spec.
+        values  dict of parameter name: array of the values of the members.
+        shape   shape of the arrays of the varying parameters and constants, so
+                that they broadcast against the state arrays.
+    """
+    return spec.freeze_with({name: np.reshape(member_values, shape)
+                             for name, member_values in values.items()})
+
+
+class MemberLinks:
+    """Link arrays of a connection for all the members of a population: (size, n_links) arrays."""
+
+    def __init__(self, connection, size):
+        self.wt  = np.tile(connection.wt, (size, 1))   # weights
+        self.fwt = np.tile(connection.fwt, (size, 1))  # fast weights
+        self.dwt = np.zeros((size, connection.n_links))  # weight changes
+
+
+class PopulationEngine(Engine):
+    """Vectorized simulation of a population of networks. See the module documentation."""
+
+    def __init__(self, network, size, params=None, **kwargs):
+        """Compile the network for a population. Must be recreated if layers or connections are added.
+
+        Parameters:
+            network  the network whose architecture, specs and weights are used by
+                     all the members.
+            size     number of members.
+            params   dict of layer name or Connection: dict of parameter name:
+                     array of the `size` values of the members.
+            kwargs   the other arguments of `Engine`.
+        """
+        Engine.__init__(self, network, **kwargs)
+        self.size  = size
+        self.links = [MemberLinks(conn, size) for conn, _, _ in self.connections]
+        self._layer_params = [{} for _ in self.layers]
+        self._unit_params  = [{} for _ in self.layers]
+        self._conn_params  = [{} for _ in self.connections]
+        self._records      = {}  # (kind, index): (frozen spec, member record)
+        self.n_dwt_trials  = 0   # number of trials accumulated in the `dwt` of the members
+
+        conn_index = {id(conn): k for k, (conn, _, _) in enumerate(self.connections)}
+        for target, values in (params or {}).items():
+            for name, member_values in values.items():
+                member_values = np.asarray(member_values, dtype=float)
+                if member_values.shape != (size,):
+                    raise ValueError("'{}' must have one value per member ({}), not shape {}".format(
+                                     name, size, member_values.shape))
+                if isinstance(target, str):
+                    k = self._layer_index(target)
+                    if name in LAYER_PARAMS:
+                        self._layer_params[k][name] = member_values
+                    elif name in self._unit_specs[k].params():
+                        if self.layers[k].unit_params:
+                            raise ValueError("the units of layer '{}' have their own parameters, that "
+                                             "cannot vary across members".format(target))
+                        self._unit_params[k][name] = member_values
+                    else:
+                        raise ValueError("'{}' is not a parameter of layer '{}' that can vary".format(
+                                         name, target))
+                else:
+                    if id(target) not in conn_index:
+                        raise ValueError('{!r} is not a connection of the network'.format(target))
+                    if name not in CONNECTION_PARAMS:
+                        raise ValueError("'{}' is not a connection parameter that can vary".format(name))
+                    self._conn_params[conn_index[id(target)]][name] = member_values
+        # computing the records now, to raise ValueError for the parameters that cannot vary
+        _ = self.unit_specs, self.layer_specs, self.connection_specs
+
+    def _member_records(self, kind, specs, params, shape, defaults=None):
+        records = []
+        for k, (spec, values) in enumerate(zip(specs, params)):
+            frozen = spec.freeze()
+            if not values:
+                records.append(frozen if defaults is None else defaults[k])
+                continue
+            cached = self._records.get((kind, k))
+            if cached is None or cached[0] is not frozen:  # the spec was modified
+                cached = self._records[(kind, k)] = (frozen, member_record(spec, values, shape))
+            records.append(cached[1])
+        return records
+
+    @property
+    def unit_specs(self):
+        """The unit spec record of each layer, with one value per member for the varying parameters."""
+        return self._member_records('unit', self._unit_specs, self._unit_params, (self.size, 1),
+                                    defaults=Engine.unit_specs.fget(self))
+
+    @property
+    def layer_specs(self):
+        """The layer spec record of each layer, with one value per member for the varying parameters."""
+        return self._member_records('layer', [layer.spec for layer in self.layers],
+                                    self._layer_params, (self.size,))
+
+    @property
+    def connection_specs(self):
+        """The spec record of each connection, with one value per member for the varying parameters."""
+        return self._member_records('connection', [conn.spec for conn, _, _ in self.connections],
+                                    self._conn_params, (self.size, 1))
+
+    def new_state(self, batch=None):
+        """Return a new state of the population: one batch element per member."""
+        assert batch is None or batch == self.size, 'the batch elements are the members'
+        return Engine.new_state(self, batch=self.size)
+
+    def _net_input(self, k, conn, pre_act):
+        c = self.connection_specs[k]
+        return c.wt_scale_abs * conn.wt_scale * conn.spec.net_input(conn, pre_act, wt=self.links[k].wt)
+
+    def learn(self, state):
+        """Update the weights of each member, every `small_batch_n` trials (see `Engine.learn`)."""
+        connection_specs = self.connection_specs
+        for (conn, pre_k, post_k), links, c in zip(self.connections, self.links, connection_specs):
+            if c.lrule is not None:
+                pre, post = state.layers[pre_k], state.layers[post_k]
+                avg_l_lrn = self._avg_l_lrn(self.layers[post_k], self.unit_specs[post_k], post)
+                links.dwt += conn.spec.compute_dwt(conn, pre.avg_s_eff, pre.avg_m, post.avg_s_eff,
+                                                   post.avg_m, post.avg_l, avg_l_lrn, frozen=c)
+        self.n_dwt_trials += 1
+        if self.n_dwt_trials < self.network.spec.small_batch_n:
+            return
+        self.n_dwt_trials = 0
+        for (conn, _, _), links, c in zip(self.connections, self.links, connection_specs):
+            if c.lrule is not None:
+                conn.spec.apply_dwt(links, frozen=c)
+            np.clip(links.wt, 0.0, 1.0, out=links.wt)  # clipping weights after change
+
+    def member_network(self, k):
+        """Return a clone of the network, with the parameters and the weights of member `k`."""
+        network = self.network.clone()
+        for layer, layer_params, unit_params in zip(network.layers, self._layer_params,
+                                                    self._unit_params):
+            if layer_params:
+                layer.spec = copy.deepcopy(layer.spec)
+                for name, values in layer_params.items():
+                    setattr(layer.spec, name, float(values[k]))
+            if unit_params:
+                unit_spec = copy.deepcopy(layer.units[0].spec)
+                for name, values in unit_params.items():
+                    setattr(unit_spec, name, float(values[k]))
+                for unit in layer.units:
+                    unit.spec = unit_spec
+        for conn, conn_params, links in zip(network.connections, self._conn_params, self.links):
+            if conn_params:
+                conn.spec = copy.deepcopy(conn.spec)
+                for name, values in conn_params.items():
+                    setattr(conn.spec, name, float(values[k]))
+            conn.set_link_values('wt', links.wt[k])
+            conn.set_link_values('fwt', links.fwt[k])
+        return network
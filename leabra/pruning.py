@@ -0,0 +1,116 @@
+"""Pruning the weak links of a trained network.
+
+`prune()` removes the links of the connections whose weight is below a threshold,
+or keeps only the `top_k` strongest links received by each unit, converting the
+connections to their non-dense form (see `Connection.prune()`). Given evaluation
+patterns, it reports the change of SSE and the speedup of the settles:
+
+>>> report = prune(network, threshold=0.05, patterns=test_patterns)
+>>> report
+PruningReport(removed 7200/10000 links, sse 0.1210 -> 0.1234, speedup x1.35)
+
+The non-dense form only saves time when the connections are large and pruned
+heavily: for small or moderately pruned connections, the dense matrix product is
+faster, and the report shows a speedup below 1.
+
+During training, a `Pruner` prunes the network periodically, as a `Trainer`
+callback:
+
+>>> pruner = Pruner(every=5, threshold=0.05, patterns=test_patterns)
+>>> trainer.train(50, callbacks=[pruner])
+>>> pruner.reports
+"""
+import time
+
+import numpy as np
+
+
+def evaluate(network, patterns, repeats=1):
+    """Settle a clone of the network on the patterns. Return (mean SSE, seconds per settle).
+
+    The SSE is the one of the first repetition. The network is not modified.
+    """
+    clone = network.clone()
+    sses, start = [], time.perf_counter()
+    for repeat in range(repeats):
+        for inputs, outputs in patterns:
+            clone.set_inputs(inputs)
+            clone.set_outputs(outputs)
+            clone.settle()
+            if repeat == 0:
+                sses.append(clone.compute_sse())
+    duration = time.perf_counter() - start
+    return float(np.mean(sses)), duration / max(1, len(sses) * repeats)
+
+
+class PruningReport:
+    """Results of a pruning."""
+
+    def __init__(self, links_before, links_after, sse_before=None, sse_after=None,
+                 time_before=None, time_after=None):
+        self.links_before = links_before  # number of links of each pruned connection, before
+        self.links_after  = links_after   # ... and after pruning
+        self.sse_before   = sse_before    # mean SSE on the patterns, or None
+        self.sse_after    = sse_after
+        self.time_before  = time_before   # seconds per settle, or None
+        self.time_after   = time_after
+
+    @property
+    def n_removed(self):
+        return sum(self.links_before) - sum(self.links_after)
+
+    @property
+    def speedup(self):
+        """Ratio of the settle durations before and after pruning, or None."""
+        if self.time_before is None:
+            return None
+        return self.time_before / self.time_after
+
+    def __repr__(self):
+        text = 'PruningReport(removed {}/{} links'.format(self.n_removed, sum(self.links_before))
+        if self.sse_before is not None:
+            text += ', sse {:.4f} -> {:.4f}, speedup x{:.2f}'.format(self.sse_before, self.sse_after,
+                                                                     self.speedup)
+        return text + ')'
+
+
+def prune(network, threshold=None, top_k=None, patterns=None, connections=None, repeats=3):
+    """Prune the weak links of the connections of the network. Return a PruningReport.
+
+    Parameters:
+        threshold    the links with a lower weight are removed.
+        top_k        only the `top_k` strongest links received by each unit are kept.
+        patterns     if not None, list of (inputs, outputs) pairs, settled before and
+                     after pruning to measure the SSE and the duration of the settles.
+        connections  the connections to prune. If None, all the connections.
+        repeats      number of repetitions of the patterns for the timing.
+    """
+    if connections is None:
+        connections = network.connections
+    before = evaluate(network, patterns, repeats) if patterns is not None else (None, None)
+    links_before = [conn.n_links for conn in connections]
+    for conn in connections:
+        conn.prune(threshold=threshold, top_k=top_k)
+    after = evaluate(network, patterns, repeats) if patterns is not None else (None, None)
+    return PruningReport(links_before, [conn.n_links for conn in connections],
+                         sse_before=before[0], sse_after=after[0],
+                         time_before=before[1], time_after=after[1])
+
+
+class Pruner:
+    """`Trainer` callback, pruning the network every `every` epochs. See `prune()`."""
+
+    def __init__(self, every, threshold=None, top_k=None, patterns=None, connections=None):
+        self.every       = every
+        self.threshold   = threshold
+        self.top_k       = top_k
+        self.patterns    = patterns
+        self.connections = connections
+        self.reports     = []  # (epoch index, PruningReport) of each pruning
+
+    def __call__(self, trainer, epoch):
+        if (epoch.index + 1) % self.every == 0:
+            report = prune(trainer.network, threshold=self.threshold, top_k=self.top_k,
+                           patterns=self.patterns, connections=self.connections)
+            self.reports.append((epoch.index, report))
+        return False
@@ -0,0 +1,355 @@
+"""Local inference server, batching concurrent requests.
+
+The server loads a saved network, and answers inference requests over HTTP (or
+over a Unix socket, with the same protocol) with the settled minus phase
+activities of the network. Concurrent requests are collected into micro-batches,
+settled together as one batched `NetworkState` of the `Engine`: a batch is
+dispatched when it reaches `max_batch` requests, or when its oldest request has
+waited `max_delay` seconds. Requests that waited more than `timeout` seconds
+before being processed are rejected (HTTP 503), so that the latency stays within
+budget when the server is overloaded.
+
+    $ python -m leabra.server network.pickle --port 8080 --max-batch 32 --max-delay 5
+
+    POST /infer    {"inputs": {"input_layer": [1.0, 0.0, 1.0, 0.0]}}
+                   -> {"outputs": {"output_layer": [0.02, 0.91]}}
+    GET  /metrics  -> {"requests": 1200, "throughput": 850.3, "mean_batch_size": 11.2,
+                       "latency_ms": {"p50": 7.1, "p95": 9.8, "p99": 12.0, "max": 14.2}, ...}
+
+From Python, `InferenceServer` can be started in a running event loop, and
+`http_request()` is a minimal client, for testing on localhost.
+"""
+import json
+import time
+import pickle
+import asyncio
+import argparse
+import collections
+
+import numpy as np
+
+from .engine import Engine
+
+
+def save_network(network, filename):
+    """Save a network, to be loaded by `load_network()` or the server."""
+    with open(filename, 'wb') as f:
+        pickle.dump(network, f)
+
+
+def load_network(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+class ServerStats:
+    """Throughput and latency of the requests, over a sliding window."""
+
+    def __init__(self, window=1000):
+        self.start       = time.perf_counter()
+        self.n_requests  = 0  # answered requests
+        self.n_rejected  = 0  # requests rejected for exceeding the latency budget
+        self.n_batches   = 0
+        self.latencies   = collections.deque(maxlen=window)  # in seconds
+        self.batch_sizes = collections.deque(maxlen=window)
+
+    def add_batch(self, latencies):
+        self.n_batches  += 1
+        self.n_requests += len(latencies)
+        self.latencies.extend(latencies)
+        self.batch_sizes.append(len(latencies))
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        latencies = 1000 * np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {'requests': self.n_requests, 'rejected': self.n_rejected, 'batches': self.n_batches,
+                'throughput': self.n_requests / elapsed if elapsed > 0 else 0.0,
+                'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+                'latency_ms': {'p50': float(np.percentile(latencies, 50)),
+                               'p95': float(np.percentile(latencies, 95)),
+                               'p99': float(np.percentile(latencies, 99)),
+                               'max': float(np.max(latencies))}}
+
+
+class LatencyBudgetExceeded(Exception):
+    pass
+
+
+class MicroBatcher:
+    """Collect concurrent inference requests into batched settles of an Engine."""
+
+    def __init__(self, network, max_batch=32, max_delay=0.005, timeout=None, layers=None,
+                 executor=None):
+        """
+        Parameters:
+            network    the network to settle. Its weights are read, not copied.
+            max_batch  maximum number of requests in a batch.
+            max_delay  maximum time, in seconds, a request waits for others to
+                       join its batch.
+            timeout    if not None, requests that waited more than `timeout`
+                       seconds before their batch is processed are rejected.
+            layers     names of the layers whose activities are returned. If None,
+                       the last layer of the network.
+            executor   concurrent.futures executor running the settles, so that
+                       the event loop is not blocked. None for asyncio's default.
+        """
+        self.engine    = Engine(network)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout   = timeout
+        self.layers    = layers or [network.layers[-1].name]
+        self.executor  = executor
+        self.sizes     = {layer.name: len(layer.units) for layer in network.layers}
+        self.stats     = ServerStats()
+        self._queue, self._task = None, None
+
+    def start(self):
+        """Start batching. Must be called from a running event loop."""
+        self._queue = asyncio.Queue()
+        self._task  = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def infer(self, inputs):
+        """Return the settled activities of the output layers, for the input activities.
+
+        inputs  dict with layer names as keys, and activities as values.
+
+        The inputs are checked before joining a batch: raises ValueError (or
+        TypeError) for invalid inputs, without failing the other requests.
+        """
+        if not isinstance(inputs, dict):
+            raise TypeError('inputs must be a dict of layer name: activities')
+        checked = {}
+        for name, activities in inputs.items():
+            if name not in self.sizes:
+                raise ValueError("layer '{}' not found.".format(name))
+            activities = np.asarray(activities, dtype=float)
+            if activities.shape != (self.sizes[name],):
+                raise ValueError('layer {} has {} units, got activities of shape {}'.format(
+                                 name, self.sizes[name], activities.shape))
+            checked[name] = activities
+        inputs = checked
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((time.perf_counter(), inputs, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0][0] + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining <= 0:
+                        batch.append(self._queue.get_nowait())
+                    else:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+            await self._process(batch)
+
+    async def _process(self, batch):
+        if self.timeout is not None:
+            now, on_time = time.perf_counter(), []
+            for request in batch:
+                if now - request[0] > self.timeout:
+                    self.stats.n_rejected += 1
+                    request[2].set_exception(LatencyBudgetExceeded(
+                        'request waited more than {} s'.format(self.timeout)))
+                else:
+                    on_time.append(request)
+            batch = on_time
+
+        groups = collections.OrderedDict()  # requests forcing the same layers are settled together
+        for request in batch:
+            groups.setdefault(tuple(sorted(request[1])), []).append(request)
+        loop = asyncio.get_running_loop()
+        for group in groups.values():
+            try:
+                outputs = await loop.run_in_executor(self.executor, self._settle,
+                                                     [inputs for _, inputs, _ in group])
+            except Exception as e:
+                for _, _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            self.stats.add_batch([now - t_arrival for t_arrival, _, _ in group])
+            for (_, _, future), output in zip(group, outputs):
+                if not future.done():  # the client may have given up
+                    future.set_result(output)
+
+    def _settle(self, inputs_list):
+        """Settle a batch of inputs. Run in the executor."""
+        state = self.engine.new_state(batch=len(inputs_list))
+        inputs = {name: np.array([inputs[name] for inputs in inputs_list], dtype=float)
+                  for name in inputs_list[0]}
+        self.engine.settle(state, inputs)
+        return [{name: state.layer(name).act_m[k].tolist() for name in self.layers}
+                for k in range(len(inputs_list))]
+
+
+    ## HTTP
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 503: 'Service Unavailable'}
+
+
+async def _read_request(reader):
+    """Read an HTTP request. Return (method, path, headers, body), or None at the end of the stream."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    parts = request_line.decode('latin-1').split(' ', 2)
+    if len(parts) != 3:
+        raise ValueError('malformed request line')
+    method, path, _ = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return method, path, headers, body
+
+
+def _write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                 'Connection: {}\r\n\r\n'.format(status, _REASONS[status], len(body),
+                                                 'keep-alive' if keep_alive else 'close').encode('latin-1')
+                 + body)
+
+
+class InferenceServer:
+    """HTTP inference server on localhost (or on a Unix socket), over a MicroBatcher."""
+
+    def __init__(self, network, host='127.0.0.1', port=8080, unix_path=None, **kwargs):
+        """
+        Parameters:
+            host, port  address to listen on. Port 0 for any free port.
+            unix_path   if not None, listen on this Unix socket instead.
+            kwargs      parameters of the MicroBatcher.
+        """
+        self.batcher = MicroBatcher(network, **kwargs)
+        self.host, self.port, self.unix_path = host, port, unix_path
+        self._server = None
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        """Create a server for a network saved with `save_network()`."""
+        return cls(load_network(filename), **kwargs)
+
+    async def start(self):
+        self.batcher.start()
+        if self.unix_path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, self.unix_path)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                _write_response(writer, status, payload, keep_alive=keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ValueError:  # malformed request: answered, and the connection closed
+            _write_response(writer, 400, {'error': 'malformed request'}, keep_alive=False)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        if method == 'GET' and path == '/metrics':
+            return 200, self.batcher.stats.summary()
+        if method == 'POST' and path == '/infer':
+            try:
+                payload = json.loads(body.decode())
+                if not isinstance(payload, dict):
+                    return 400, {'error': 'the request must be a JSON object'}
+                inputs = payload['inputs']
+                return 200, {'outputs': await self.batcher.infer(inputs)}
+            except LatencyBudgetExceeded as e:
+                return 503, {'error': str(e)}
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {'error': str(e)}
+        return 404, {'error': 'unknown endpoint {} {}'.format(method, path)}
+
+
+async def http_request(method, path, payload=None, host='127.0.0.1', port=8080, unix_path=None):
+    """Minimal HTTP client for the server. Return the status and the decoded JSON response."""
+    if unix_path is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write('{} {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n'
+                 'Content-Length: {}\r\nConnection: close\r\n\r\n'.format(
+                 method, path, host, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    response = await reader.readexactly(int(headers['content-length']))
+    writer.close()
+    return status, json.loads(response.decode())
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Local inference server for a saved leabra network.')
+    parser.add_argument('network', help='network file, saved with leabra.server.save_network()')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None, help='listen on a Unix socket instead')
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-delay', type=float, default=5.0, help='in ms')
+    parser.add_argument('--timeout', type=float, default=None, help='latency budget, in ms')
+    args = parser.parse_args(args)
+
+    server = InferenceServer.from_file(args.network, host=args.host, port=args.port,
+                                       unix_path=args.unix, max_batch=args.max_batch,
+                                       max_delay=args.max_delay / 1000,
+                                       timeout=None if args.timeout is None else args.timeout / 1000)
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Sharing the weights of a network between processes, for inference.
+
+`SharedWeights` publishes the weights of a network in a shared memory block (or in a
+memory-mapped file), and provides a small, picklable handle on them. In the worker
+processes, `InferenceReplica(handle)` creates an inference-only replica of the
+network, whose connections reference the published weights without copying them.
+Only the state of the units and layers is private to each replica.
+
+    def init_worker(handle):
+        global replica
+        replica = InferenceReplica(handle)
+
+    def evaluate(inputs):
+        return replica.infer(inputs)
+
+    with SharedWeights(network) as shared:
+        with multiprocessing.Pool(4, initializer=init_worker, initargs=(shared.handle,)) as pool:
+            outputs = pool.map(evaluate, input_patterns)
+
+To fit more replicas per host, the weights can be published in a compact `dtype`:
+`float32` or `float16`, or `uint16` or `uint8` with a per-connection scale and
+offset (the weights are bounded to [0, 1], so the quantization steps are at most
+1/65535 and 1/255). The replicas compute the net inputs from the compact weights
+directly, dequantizing them inside the product. `quantization_report()` measures
+the error of the settled activities against full precision:
+
+    with SharedWeights(network, dtype='uint8') as shared:
+        ...
+
+    quantization_report(network, input_patterns)
+"""
+import copy
+import pickle
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+
+_created = set()  # names of the shared memory blocks created by this process
+
+
+def attach_shared_memory(name):
+    """Attach an existing shared memory block, leaving its lifetime to its creator."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if multiprocessing.parent_process() is None and shm._name not in _created:
+            # not sharing the resource tracker of the creator: without this, the block
+            # would be destroyed when this process exits.
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+DTYPES = ('float64', 'float32', 'float16', 'uint16', 'uint8')
+
+
+def quantize(wt, dtype):
+    """Return `(values, scale, offset)`, with `wt ~= scale * values + offset` and values of `dtype`.
+
+    Floating point types are a plain conversion (scale 1, offset 0). Integer types
+    cover the range of the weights with their full resolution.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return wt.astype(dtype), 1.0, 0.0
+    lo, hi = (float(np.min(wt)), float(np.max(wt))) if len(wt) > 0 else (0.0, 0.0)
+    scale = (hi - lo) / np.iinfo(dtype).max if hi > lo else 1.0
+    return np.round((wt - lo) / scale).astype(dtype), scale, lo
+
+
+def _views(raw, handle):
+    """Return the (scale, offset) array of the connections and the weights array of a raw buffer."""
+    header = 16 * len(handle.layout)
+    return (raw[:header].view(np.float64).reshape(len(handle.layout), 2),
+            raw[header:handle.nbytes].view(handle.dtype))
+
+
+def _skeleton(network):
+    """Return a serialized copy of the network, without the links's values."""
+    memo = {}
+    for conn in network.connections:
+        for name in ('wt', 'fwt', 'dwt'):
+            memo[id(getattr(conn, name))] = None
+    return pickle.dumps(copy.deepcopy(network, memo))
+
+
+class WeightsHandle:
+    """Picklable reference to published weights. See `SharedWeights`."""
+
+    def __init__(self, location, memmap, layout, skeleton, dtype='float64'):
+        """
+        location  name of the shared memory block, or path of the memory-mapped file.
+        memmap    True if `location` is a file path.
+        layout    (offset, size) of the weights of each connection in the buffer.
+        skeleton  the serialized network, without weights.
+        dtype     type of the published weights.
+
+        The buffer holds the (scale, offset) pairs of the connections, as float64,
+        followed by the weights.
+        """
+        self.location = location
+        self.memmap   = memmap
+        self.layout   = layout
+        self.skeleton = skeleton
+        self.dtype    = np.dtype(dtype).name
+
+    @property
+    def size(self):
+        return sum(size for _, size in self.layout)
+
+    @property
+    def nbytes(self):
+        """Size of the buffer, in bytes."""
+        return 16 * len(self.layout) + np.dtype(self.dtype).itemsize * self.size
+
+
+class SharedWeights:
+    """Weights of a network, published for inference replicas in other processes."""
+
+    def __init__(self, network, path=None, dtype='float64'):
+        """
+        network  the network whose weights are published.
+        path     if None, the weights are published in a shared memory block. Else, they
+                 are written in a `.npy` file at this path, memory-mapped by the replicas.
+        dtype    type of the published weights, one of `DTYPES`.
+        """
+        assert np.dtype(dtype).name in DTYPES, 'dtype must be one of {}'.format(DTYPES)
+        self.network = network
+        sizes = [conn.n_links for conn in network.connections]
+        offsets = np.cumsum([0] + sizes[:-1], dtype=int)
+        layout = [(int(offset), size) for offset, size in zip(offsets, sizes)]
+        self.handle = WeightsHandle(None, path is not None, layout, _skeleton(network), dtype)
+
+        if path is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, self.handle.nbytes))
+            self._buffer = np.ndarray((self.handle.nbytes,), dtype=np.uint8, buffer=self._shm.buf)
+            self.handle.location = self._shm.name
+            _created.add(self._shm._name)
+        else:
+            self._shm = None
+            self._buffer = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                                     shape=(self.handle.nbytes,))
+            self.handle.location = path
+        self._quant, self._weights = _views(self._buffer, self.handle)
+        self.update()
+
+    def update(self):
+        """Copy the current weights of the network into the shared buffer.
+
+        Replicas see the new weights immediately, without being recreated.
+        """
+        for k, (conn, (offset, size)) in enumerate(zip(self.network.connections, self.handle.layout)):
+            assert conn.n_links == size, 'the connections changed since publication'
+            values, scale, wt_offset = quantize(conn.wt, self.handle.dtype)
+            self._weights[offset:offset + size] = values
+            self._quant[k] = scale, wt_offset
+        if self._shm is None:
+            self._buffer.flush()
+
+    def close(self):
+        """Release the shared buffer. Replicas must not be used afterward."""
+        if self._buffer is not None:
+            self._buffer = self._quant = self._weights = None
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+                _created.discard(self._shm._name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InferenceReplica:
+    """Inference-only network replica, with read-only weights referencing a shared buffer.
+
+    The replica cannot learn: its connections have no `fwt` and `dwt` arrays. With
+    integer weights, the `wt_quant` of the connections reference their (scale,
+    offset) in the buffer (see `ConnectionSpec.net_input`).
+    """
+
+    def __init__(self, handle):
+        self.network = pickle.loads(handle.skeleton)
+        if handle.memmap:
+            self._shm = None
+            self._buffer = np.load(handle.location, mmap_mode='r')
+        else:
+            self._shm = attach_shared_memory(handle.location)
+            self._buffer = np.ndarray((handle.nbytes,), dtype=np.uint8, buffer=self._shm.buf)
+            self._buffer.flags.writeable = False
+        quant, weights = _views(self._buffer, handle)
+        for k, (conn, (offset, size)) in enumerate(zip(self.network.connections, handle.layout)):
+            conn.wt = weights[offset:offset + size]  # zero-copy views
+            if np.dtype(handle.dtype).kind != 'f':
+                conn.wt_quant = quant[k]
+
+    def infer(self, inputs, layers=None):
+        """Settle the network on the inputs, and return the minus phase activities.
+
+        inputs  dict with layer names as keys, and activities as values.
+        layers  names of the layers whose activities are returned. If None, the
+                last layer of the network.
+        """
+        self.network.set_inputs(inputs)
+        self.network.settle()
+        if layers is None:
+            layers = [self.network.layers[-1].name]
+        return {name: np.array([u.act_m for u in self.network._get_layer(name).units])
+                for name in layers}
+
+    def close(self):
+        """Detach from the shared buffer."""
+        for conn in self.network.connections:
+            conn.wt, conn.wt_quant = None, None
+        self._buffer = None
+        if self._shm is not None:
+            self._shm.close()
+
+
+def quantization_report(network, inputs, dtypes=DTYPES[1:], layers=None):
+    """Compare the settled activities of replicas with compact weights to full precision ones.
+
+    Parameters:
+        network  the network, whose weights are published in each dtype.
+        inputs   list of dicts of layer name: activities, settled in order.
+        dtypes   the weights types to compare to float64.
+        layers   names of the layers whose activities are compared. If None, the
+                 last layer of the network.
+
+    Returns a dict of dtype name: dict with the bytes of the weights (`bytes`), the
+    compression ratio against float64 (`ratio`), and the maximum and mean absolute
+    error of the settled activities (`max_abs_err`, `mean_abs_err`).
+    """
+    def settled(dtype):
+        with SharedWeights(network, dtype=dtype) as shared:
+            replica = InferenceReplica(shared.handle)
+            try:
+                outputs = [replica.infer(acts, layers=layers) for acts in inputs]
+            finally:
+                replica.close()
+        return np.array([np.concatenate([output[name] for name in sorted(output)])
+                         for output in outputs]), shared.handle
+    reference, handle = settled('float64')
+    report = {}
+    for dtype in dtypes:
+        acts, quant_handle = settled(dtype)
+        errors = np.abs(acts - reference)
+        n_bytes = np.dtype(dtype).itemsize * quant_handle.size
+        report[np.dtype(dtype).name] = {
+            'bytes'       : n_bytes,
+            'ratio'       : 8 * handle.size / n_bytes if n_bytes else 1.0,
+            'max_abs_err' : float(np.max(errors)) if errors.size else 0.0,
+            'mean_abs_err': float(np.mean(errors)) if errors.size else 0.0}
+    return report
@@ -0,0 +1,130 @@
+"""Frozen specs.
+
+The `freeze()` method of `UnitSpec`, `LayerSpec` and `ConnectionSpec` returns a
+`FrozenSpec`: an immutable, hashable record of the parameters of the spec, along
+with the constants derived from them (`dt_net`, `gc_l`, ...), computed once. The
+record is cached by the spec, and dropped as soon as a parameter of the spec is
+modified: the next `freeze()` call computes a new one, so that constants derived
+from outdated parameters are never used. The hot paths (the `cycle` methods of the
+specs, the `Engine`) read their parameters from the frozen record.
+
+>>> spec = UnitSpec(act_thr=0.45)
+>>> frozen = spec.freeze()
+>>> frozen.dt_net
+0.7142857142857143
+>>> frozen.act_thr = 0.5
+AttributeError: can't modify frozen UnitSpec parameter 'act_thr'
+>>> spec.act_thr = 0.5           # the spec can be modified,
+>>> spec.freeze() is frozen      # ... and the record is recomputed.
+False
+
+`freeze_with()` returns a record where some numeric parameters are arrays (the
+values of the units of a layer, or of the members of a population): the constants
+derived from them are arrays too, and the vectorized equations compute all the
+values at once, by broadcasting. The record is not cached by the spec.
+"""
+import copy
+import numbers
+
+import numpy as np
+
+
+def _hashable(value):
+    if isinstance(value, np.ndarray):
+        return ('ndarray', value.shape, tuple(value.ravel().tolist()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item)) for key, item in value.items()))
+    return value
+
+
+class FrozenSpec:
+    """Immutable, hashable record of the parameters and derived constants of a spec.
+
+    Two records are equal if they were frozen from specs of the same class with the
+    same parameters.
+    """
+
+    def __init__(self, kind, params, constants):
+        """
+        Parameters:
+            kind       name of the class of the spec
+            params     dict of the parameters of the spec
+            constants  dict of the constants derived from the parameters
+        """
+        self.__dict__.update(params)
+        self.__dict__.update(constants)
+        self.__dict__['_kind'] = kind
+        self.__dict__['_key']  = (kind, tuple(sorted((name, _hashable(value))
+                                                     for name, value in params.items())))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("can't modify frozen {} parameter '{}'".format(self._kind, name))
+
+    def __delattr__(self, name):
+        raise AttributeError("can't modify frozen {} parameter '{}'".format(self._kind, name))
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        return isinstance(other, FrozenSpec) and self._key == other._key
+
+    def __repr__(self):
+        return 'Frozen{}({})'.format(self._kind, ', '.join('{}={!r}'.format(name, value)
+                                                          for name, value in self._key[1]))
+
+
+class Spec:
+    """Base class of the specs: parameters, and their frozen record."""
+
+    state_attrs  = ()  # public attributes that are not parameters, not frozen nor hashed
+    fixed_params = ()  # numeric parameters that cannot be arrays (see `freeze_with()`)
+
+    def __setattr__(self, name, value):
+        if not name.startswith('_') and name not in self.state_attrs:
+            self._invalidate()
+        object.__setattr__(self, name, value)
+
+    def _invalidate(self):
+        """Drop the values derived from the parameters. Called when a parameter is modified."""
+        self.__dict__.pop('_frozen', None)
+
+    def params(self):
+        """Return the dict of the parameters of the spec."""
+        return {name: value for name, value in self.__dict__.items()
+                if not name.startswith('_') and name not in self.state_attrs}
+
+    def constants(self):
+        """Return the dict of the constants derived from the parameters."""
+        return {}
+
+    def freeze(self):
+        """Return the frozen record of the spec, with the current parameters (see module doc)."""
+        frozen = self.__dict__.get('_frozen')
+        if frozen is None:
+            frozen = FrozenSpec(type(self).__name__, self.params(), self.constants())
+            self.__dict__['_frozen'] = frozen
+        return frozen
+
+    def freeze_with(self, params):
+        """Return a frozen record of the spec, with some parameters replaced by arrays.
+
+        Parameters:
+            params  dict of parameter name: array of values. The constants derived
+                    from the parameters are computed from the arrays, by broadcasting.
+
+        Raises ValueError for the parameters that cannot be arrays: the non-numeric
+        ones, and the ones listed in `fixed_params`.
+        """
+        current = self.params()
+        for name in params:
+            value = current.get(name)
+            if (name in self.fixed_params or isinstance(value, bool)
+                    or not isinstance(value, numbers.Real)):
+                raise ValueError("'{}' of {} cannot vary".format(name, type(self).__name__))
+        spec = copy.copy(self)
+        spec.__dict__.update(params)
+        spec.__dict__.pop('_frozen', None)
+        return spec.freeze()
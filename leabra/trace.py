@@ -0,0 +1,305 @@
+"""Recording of full simulation traces to disk, in chunks.
+
+A `TraceRecorder` records variables of the layers and of their units at every
+cycle, like `Unit.logs` and `Layer.logs`, but streams them to `.npy` chunk files
+rather than keeping them in memory: every `chunk_size` cycles, the buffered values
+are handed to a background thread that writes them. At most `max_pending` chunks
+wait to be written; beyond that, the simulation waits for the writer, so that the
+memory used is bounded. The recorder is attached to a `Network`, or to a
+`NetworkState` of the `Engine`:
+
+>>> with TraceRecorder('traces/', {'hidden_layer': ('net', 'act', 'gc_i')}) as recorder:
+...     network.recorder = recorder
+...     for _ in range(1000):
+...         network.trial()
+...     network.recorder = None
+
+A `TraceReader` memory-maps the chunks, so that a trace can be plotted or compared
+without loading the whole file:
+
+>>> reader = TraceReader('traces/')
+>>> act = reader['hidden_layer', 'act']     # (cycles, batch, size), lazy
+>>> act[-100:, 0, 3]                        # last 100 cycles of the unit 3
+>>> quantitative_match(reader.unit_logs('hidden_layer', 3), emergent_logs)
+
+Each recorded cycle (or integration step, with an `AdaptiveStep`) also records the
+total number of cycles of the simulation (`reader.cycle_tot`), as the time axis.
+Chunk files are written under a temporary name and then renamed, so that the
+traces written before an interruption of the process can be read.
+
+For display, `downsample_minmax()` and `downsample_lttb()` reduce a trace to a
+few thousand points, preserving its peaks, and `append_decimated()` bounds a line
+growing during a run.
+"""
+import os
+import json
+import queue
+import threading
+
+import numpy as np
+
+
+INDEX_FILE = 'index.json'
+
+
+def _chunk_filename(key, k):
+    return '{}.{:06d}.npy'.format(key, k)
+
+
+class TraceRecorder:
+    """Stream traces of a simulation to chunked `.npy` files."""
+
+    def __init__(self, path, variables, chunk_size=1000, max_pending=4, background=True,
+                 dtype=np.float64):
+        """
+        Parameters:
+            path         directory of the chunk files. Created if needed.
+            variables    dict of layer name: names of the variables to record. Unit
+                         variables are recorded as (batch, size) arrays, layer
+                         variables (e.g., `gc_i`) as (batch,) arrays.
+            chunk_size   number of cycles per chunk.
+            max_pending  maximum number of chunks waiting to be written.
+            background   if False, chunks are written by the simulation thread.
+            dtype        type of the recorded values.
+        """
+        self.path       = path
+        self.variables  = {name: tuple(names) for name, names in variables.items()}
+        self.chunk_size = chunk_size
+        self.dtype      = np.dtype(dtype)
+        self.keys = ['cycle_tot'] + ['{}.{}'.format(name, var) for name, names in self.variables.items()
+                                     for var in names]
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, INDEX_FILE), 'w') as f:
+            json.dump({'variables': self.variables, 'keys': self.keys,
+                       'dtype': self.dtype.str, 'chunk_size': chunk_size}, f)
+
+        self._buffers  = {key: [] for key in self.keys}
+        self._n_chunks = 0
+        self._error    = None
+        self._queue, self._thread = None, None
+        if background:
+            self._queue  = queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+
+    def record(self, view):
+        """Record the variables of the current cycle, from a `NetworkView` or `StateView`."""
+        self._buffers['cycle_tot'].append(view.cycle_tot)
+        for name, names in self.variables.items():
+            for var in names:
+                self._buffers['{}.{}'.format(name, var)].append(np.array(view.var(name, var), dtype=self.dtype))
+        if len(self._buffers['cycle_tot']) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered cycles to the writer."""
+        self._raise_error()
+        if len(self._buffers['cycle_tot']) == 0:
+            return
+        chunk = {key: np.array(values) for key, values in self._buffers.items()}
+        self._buffers = {key: [] for key in self.keys}
+        if self._queue is None:
+            self._write(self._n_chunks, chunk)
+        else:
+            self._queue.put((self._n_chunks, chunk))  # blocks if max_pending chunks are pending
+        self._n_chunks += 1
+
+    def close(self):
+        """Write the remaining cycles, and wait for all chunks to be written."""
+        self.flush()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, k, chunk):
+        for key, values in chunk.items():
+            filename = os.path.join(self.path, _chunk_filename(key, k))
+            with open(filename + '.tmp', 'wb') as f:
+                np.save(f, values)
+            os.replace(filename + '.tmp', filename)
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                try:
+                    self._write(*item)
+                except Exception as e:  # reported to the simulation thread
+                    self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise IOError('writing the traces to {} failed'.format(self.path)) from self._error
+
+
+class Trace:
+    """A recorded variable, as a lazy sequence of per-cycle arrays over memory-mapped chunks.
+
+    `trace[t]` is the value at the recorded cycle `t`; `trace[ts, ...]` loads only
+    the chunks of the cycles `ts`. `trace.select(index)` is the lazy trace of
+    `value[index]` (e.g., `select((0, 3))` for the unit 3 of the batch element 0).
+    """
+
+    def __init__(self, chunks, index=()):
+        self.chunks = chunks  # memory-mapped arrays, (cycles, ...)
+        self.index  = index
+        self._starts = np.cumsum([0] + [len(chunk) for chunk in chunks])
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    @property
+    def shape(self):
+        return (len(self),) + np.empty(self.chunks[0].shape[1:])[self.index].shape if self.chunks else (0,)
+
+    def select(self, index):
+        return Trace(self.chunks, index if isinstance(index, tuple) else (index,))
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        ts, rest = key[0], key[1:]
+        if isinstance(ts, (int, np.integer)):
+            ts = ts + len(self) if ts < 0 else ts
+            if not 0 <= ts < len(self):
+                raise IndexError('cycle {} out of range'.format(key[0]))
+            k = np.searchsorted(self._starts, ts, side='right') - 1
+            return np.asarray(self.chunks[k][ts - self._starts[k]][self.index])[rest]
+        ts = np.arange(len(self))[ts]
+        if len(ts) == 0:
+            return np.empty((0,) + self.shape[1:])[(slice(None),) + rest]
+        ks = np.searchsorted(self._starts, ts, side='right') - 1
+        order = np.argsort(ks, kind='stable')  # grouping the cycles by chunk
+        parts = [np.asarray(self.chunks[k][ts[ks == k] - self._starts[k]])[(slice(None),) + self.index]
+                 for k in np.unique(ks)]
+        values = np.empty_like(np.concatenate(parts))
+        values[order] = np.concatenate(parts)
+        return values[(slice(None),) + rest]
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            for value in chunk:
+                yield np.asarray(value[self.index])
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:] if dtype is None else self[:].astype(dtype)
+
+
+class TraceReader:
+    """Read the traces written by a `TraceRecorder`, memory-mapping the chunks."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.variables = {name: tuple(names) for name, names in index['variables'].items()}
+        self.keys = index['keys']
+        self.n_chunks = 0
+        while all(os.path.exists(os.path.join(path, _chunk_filename(key, self.n_chunks)))
+                  for key in self.keys):
+            self.n_chunks += 1
+
+    def trace(self, key):
+        return Trace([np.load(os.path.join(self.path, _chunk_filename(key, k)), mmap_mode='r')
+                      for k in range(self.n_chunks)])
+
+    def __getitem__(self, name_var):
+        """Trace of a variable, from a (layer name, variable name) tuple."""
+        name, var = name_var
+        if var not in self.variables.get(name, ()):
+            raise KeyError("variable '{}' of layer '{}' was not recorded".format(var, name))
+        return self.trace('{}.{}'.format(name, var))
+
+    @property
+    def cycle_tot(self):
+        """Total number of cycles of the simulation, at each recorded cycle."""
+        return self.trace('cycle_tot')
+
+    def unit_logs(self, name, unit, batch=0):
+        """Traces of the unit variables of a unit, as a dict similar to `Unit.logs`."""
+        logs = {}
+        for var in self.variables[name]:
+            trace = self[name, var]
+            if len(trace.shape) == 3:
+                logs[var] = trace.select((batch, unit))
+        return logs
+
+    def layer_logs(self, name, batch=0):
+        """Traces of the layer variables of a layer, as a dict similar to `Layer.logs`."""
+        logs = {}
+        for var in self.variables[name]:
+            trace = self[name, var]
+            if len(trace.shape) == 2:
+                logs[var] = trace.select(batch)
+        return logs
+
+
+    ## Downsampling, for display
+
+def downsample_minmax(xs, ys, n_out):
+    """Keep the minimum and the maximum of `ys` in each of `n_out // 2` bins of consecutive points.
+
+    Returns `xs` and `ys` unchanged if they have no more than `n_out` points.
+    """
+    xs, ys = np.asarray(xs), np.asarray(ys, dtype=float)
+    if len(ys) <= n_out:
+        return xs, ys
+    n_bins = max(1, n_out // 2)
+    edges  = np.linspace(0, len(ys), n_bins + 1).astype(int)[:-1]
+    bin_id = np.repeat(np.arange(n_bins), np.diff(np.append(edges, len(ys))))
+    idx = []
+    for extremum in (np.minimum, np.maximum):
+        is_extremum = ys == extremum.reduceat(ys, edges)[bin_id]
+        _, first = np.unique(bin_id[is_extremum], return_index=True)
+        idx.append(np.flatnonzero(is_extremum)[first])
+    idx = np.unique(np.concatenate(idx))
+    return xs[idx], ys[idx]
+
+
+def append_decimated(xs, ys, new_xs, new_ys, max_points):
+    """Points of a displayed line after appending new ones, or None if they can be appended as is.
+
+    If the line would exceed `max_points` points, all its points are reduced to
+    `max_points // 2` with `downsample_minmax()`, and returned as `(xs, ys)` arrays,
+    to replace the displayed ones. If `max_points` is None, the line is unbounded.
+    """
+    if max_points is None or len(xs) + len(new_xs) <= max_points:
+        return None
+    return downsample_minmax(np.concatenate([xs, new_xs]),
+                             np.concatenate([ys, new_ys]), max_points // 2)
+
+
+def downsample_lttb(xs, ys, n_out):
+    """Largest-Triangle-Three-Buckets downsampling of `ys` to `n_out` points.
+
+    Keeps the first and last points, and, in each bucket of consecutive points,
+    the point forming the largest triangle with the point kept in the previous
+    bucket and the average of the next bucket.
+    """
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    if len(ys) <= n_out or n_out < 3:
+        return xs, ys
+    edges = np.linspace(1, len(ys) - 1, n_out - 1).astype(int)
+    idx = [0]
+    for k in range(n_out - 2):
+        start, stop = edges[k], edges[k + 1]
+        if k + 2 < len(edges):
+            next_x, next_y = xs[stop:edges[k + 2]].mean(), ys[stop:edges[k + 2]].mean()
+        else:
+            next_x, next_y = xs[-1], ys[-1]
+        prev_x, prev_y = xs[idx[-1]], ys[idx[-1]]
+        areas = np.abs((prev_x - next_x) * (ys[start:stop] - prev_y)
+                       - (prev_x - xs[start:stop]) * (next_y - prev_y))
+        idx.append(start + int(np.argmax(areas)))
+    idx.append(len(ys) - 1)
+    return xs[idx], ys[idx]
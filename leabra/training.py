@@ -0,0 +1,240 @@
+"""Training a network by epochs, on pattern sets streamed from memory, disk or generators.
+
+A pattern is a pair `(inputs, outputs)` of dicts of layer name: activities, as
+given to `Network.set_inputs()` and `Network.set_outputs()`. A pattern set is:
+
+    - a list of patterns,
+    - an `ArrayPatterns`, holding one (n_patterns, size) array per layer. The
+      arrays can be memory-mapped `.npy` files (`ArrayPatterns.from_npy()`), so
+      that only the patterns being presented are read from disk.
+    - a `GeneratorPatterns`, wrapping a function that returns a new iterator on
+      the patterns at each epoch. The patterns are presented in the generated
+      order, without permutation.
+
+The `Trainer` presents the patterns of an epoch (in a new random order at each
+epoch, if `shuffle`), while a background thread prefetches the next ones, so that
+loading the patterns does not stall the simulation. After each epoch, it can run
+an evaluation pass (settling without learning) on a test set, call callbacks, and
+stop when the SSE reaches a criterion:
+
+>>> trainer = Trainer(network, ArrayPatterns.from_npy({'input_layer': 'inputs.npy'},
+...                                                   {'output_layer': 'outputs.npy'}),
+...                   test=test_patterns, stop_sse=0.1)
+>>> epochs = trainer.train(n_epochs=100, callbacks=[lambda trainer, epoch: print(epoch)])
+"""
+import time
+import queue
+import threading
+
+import numpy as np
+
+
+class ArrayPatterns:
+    """Patterns stored as one (n_patterns, size) array per layer."""
+
+    def __init__(self, inputs, outputs=None):
+        """
+        Parameters:
+            inputs   dict of layer name: (n_patterns, size) array.
+            outputs  dict of layer name: (n_patterns, size) array, or None for
+                     inference only.
+        """
+        self.inputs, self.outputs = dict(inputs), dict(outputs or {})
+        lengths = {len(array) for array in list(self.inputs.values()) + list(self.outputs.values())}
+        assert len(lengths) == 1, 'all arrays must have the same number of patterns'
+        self._len = lengths.pop()
+
+    @classmethod
+    def from_npy(cls, input_files, output_files=None):
+        """Memory-map `.npy` files, given as dicts of layer name: filename."""
+        return cls({name: np.load(filename, mmap_mode='r') for name, filename in input_files.items()},
+                   {name: np.load(filename, mmap_mode='r') for name, filename in (output_files or {}).items()})
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, k):
+        return ({name: np.array(array[k], dtype=float) for name, array in self.inputs.items()},
+                {name: np.array(array[k], dtype=float) for name, array in self.outputs.items()})
+
+
+class GeneratorPatterns:
+    """Patterns produced by a function returning a new iterator at each epoch."""
+
+    def __init__(self, make_iterator):
+        self.make_iterator = make_iterator
+
+    def __iter__(self):
+        return iter(self.make_iterator())
+
+
+class Prefetcher:
+    """Iterate over the items of an iterable, loaded ahead by a background thread.
+
+    At most `depth` items are loaded ahead. Exceptions raised while loading are
+    raised by the iteration.
+    """
+
+    _end = object()
+
+    def __init__(self, iterable, depth=16):
+        self._queue  = queue.Queue(maxsize=depth)
+        self._stop   = threading.Event()
+        self._thread = threading.Thread(target=self._load, args=(iterable,), daemon=True)
+        self._thread.start()
+
+    def _load(self, iterable):
+        try:
+            for item in iterable:
+                if self._stop.is_set():
+                    return
+                self._queue.put(item)
+            self._queue.put(self._end)
+        except Exception as e:
+            self._queue.put(e)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        """Stop loading. Items already loaded are dropped."""
+        self._stop.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                self._thread.join(0.01)
+
+
+class Epoch:
+    """Results of an epoch."""
+
+    def __init__(self, index, sses, test_sses=None, metrics=None, duration=0.0):
+        self.index     = index      # number of the epoch, starting at 0
+        self.sses      = sses       # SSE of each training trial, in presentation order
+        self.test_sses = test_sses  # SSE of each test pattern, or None
+        self.metrics   = metrics    # epoch statistics of `network.metrics`, or None
+        self.duration  = duration   # in seconds
+
+    @property
+    def sse(self):
+        return float(np.mean(self.sses)) if len(self.sses) > 0 else 0.0
+
+    @property
+    def test_sse(self):
+        return None if self.test_sses is None else float(np.mean(self.test_sses))
+
+    def __repr__(self):
+        text = 'Epoch({}, sse={:.4f}'.format(self.index, self.sse)
+        if self.test_sses is not None:
+            text += ', test_sse={:.4f}'.format(self.test_sse)
+        return text + ', {:.2f}s)'.format(self.duration)
+
+
+class Trainer:
+    """Train a network by epochs, on a pattern set."""
+
+    def __init__(self, network, patterns, test=None, shuffle=True, seed=0, prefetch=16,
+                 stop_sse=None):
+        """
+        Parameters:
+            network   the network to train.
+            patterns  the training pattern set (see the module documentation).
+            test      if not None, a pattern set evaluated after each epoch.
+            shuffle   if True, the patterns are presented in a new random order at
+                      each epoch (not for `GeneratorPatterns`). The orders are the
+                      same as `parallel.epoch_orders()` with the same seed.
+            prefetch  number of patterns loaded ahead by the background thread.
+                      0 to load them in the simulation thread.
+            stop_sse  if not None, training stops after an epoch whose mean SSE
+                      (on the test set if any, else on the training trials) is
+                      lower or equal.
+        """
+        self.network  = network
+        self.patterns = patterns
+        self.test     = test
+        self.shuffle  = shuffle
+        self.prefetch = prefetch
+        self.stop_sse = stop_sse
+        self.rng      = np.random.RandomState(seed)
+        self.epochs   = []  # Epoch instances of all epochs trained
+
+    def _order(self, patterns, shuffle):
+        if isinstance(patterns, GeneratorPatterns):
+            return patterns
+        if shuffle:
+            order = self.rng.permutation(len(patterns))
+        else:
+            order = range(len(patterns))
+        return (patterns[k] for k in order)
+
+    def _iterate(self, patterns, shuffle):
+        items = self._order(patterns, shuffle)
+        if self.prefetch <= 0:
+            return items, None
+        prefetcher = Prefetcher(items, depth=self.prefetch)
+        return iter(prefetcher), prefetcher
+
+    def run_epoch(self):
+        """Train the network on one epoch of the patterns. Return the Epoch."""
+        start = time.perf_counter()
+        items, prefetcher = self._iterate(self.patterns, self.shuffle)
+        sses = []
+        try:
+            for inputs, outputs in items:
+                self.network.set_inputs(inputs)
+                self.network.set_outputs(outputs)
+                sses.append(self.network.trial())
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+        test_sses = None if self.test is None else self.evaluate(self.test)
+        metrics = None if self.network.metrics is None else self.network.metrics.end_epoch()
+        epoch = Epoch(len(self.epochs), np.array(sses), test_sses, metrics,
+                      time.perf_counter() - start)
+        self.epochs.append(epoch)
+        return epoch
+
+    def evaluate(self, patterns):
+        """Settle the network on the patterns, without learning. Return the SSE of each pattern.
+
+        The patterns are presented in order. Patterns without outputs have an SSE of 0.
+        """
+        items, prefetcher = self._iterate(patterns, False)
+        sses = []
+        metrics, self.network.metrics = self.network.metrics, None  # not in the training statistics
+        try:
+            for inputs, outputs in items:
+                self.network.set_inputs(inputs)
+                self.network.set_outputs(outputs)
+                self.network.settle()
+                sses.append(self.network.compute_sse())
+        finally:
+            self.network.metrics = metrics
+            if prefetcher is not None:
+                prefetcher.close()
+        return np.array(sses)
+
+    def train(self, n_epochs, callbacks=()):
+        """Train for up to `n_epochs` epochs. Return the list of Epoch of this call.
+
+        callbacks  functions called as `callback(trainer, epoch)` after each epoch.
+                   Training stops if a callback returns True.
+        """
+        epochs = []
+        for _ in range(n_epochs):
+            epoch = self.run_epoch()
+            epochs.append(epoch)
+            stop = False
+            for callback in callbacks:
+                stop = bool(callback(self, epoch)) or stop
+            sse = epoch.sse if epoch.test_sses is None else epoch.test_sse
+            if stop or (self.stop_sse is not None and sse <= self.stop_sse):
+                break
+        return epochs
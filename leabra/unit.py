@@ -9,6 +9,8 @@ import copy
 import numpy as np
 import scipy.interpolate
 
+from .spec import Spec
+
 
 # type of layer and correspondingly, unit behaviors
 INPUT  = 0
@@ -30,16 +32,20 @@ class Unit:
         if self.spec is None:
             self.spec = UnitSpec()
 
+        self.own_params = None  # (dict of parameter name: array, index of the unit) of the unit's
+                                # own parameter values (see `Layer.set_unit_params()`)
+        self._record    = None  # (spec record, own_params, unit record)
+
         self.log_names = log_names
         self.logs  = {name: [] for name in self.log_names}
 
         self.reset()
 
         # averages of the activity
-        self.avg_ss    = self.spec.avg_init # super-short-term average
-        self.avg_s     = self.spec.avg_init # short-term average
-        self.avg_m     = self.spec.avg_init # medium-term average
-        self.avg_l     = self.spec.avg_l_init
+        self.avg_ss    = self.record.avg_init # super-short-term average
+        self.avg_s     = self.record.avg_init # short-term average
+        self.avg_m     = self.record.avg_init # medium-term average
+        self.avg_l     = self.record.avg_l_init
         self.avg_s_eff = 0.0  # linear mixing of avg_s and avg_m
 
     def reset(self):
@@ -49,7 +55,7 @@ class Unit:
         self.g_e     = 0                  # excitatory conductance
         self.I_net   = 0                  # net current
         self.I_net_r = self.I_net         # net current, equilibrium version (for v_m_eq)
-        self.v_m     = self.spec.v_m_init # membrane potential
+        self.v_m     = self.record.v_m_init # membrane potential
         self.v_m_eq  = self.v_m           # equilibrium membrane potential
                                           # (not reseted after a spike)
         self.act_ext = None               # externally forced activity (None for not forced)
@@ -60,6 +66,25 @@ class Unit:
         self.adapt   = 0     # adaptation current: causes the rate of activation
                               # to decrease over time
 
+    def clone(self):
+        """Return a copy of the unit, sharing its spec. The logs are copied."""
+        unit = copy.copy(self)
+        unit.logs = {name: list(values) for name, values in self.logs.items()}
+        unit.ex_inputs = list(self.ex_inputs)
+        return unit
+
+    @property
+    def record(self):
+        """Frozen record of the parameters of the unit: the ones of its spec, with its own values."""
+        frozen = self.spec.freeze()
+        if self.own_params is None:
+            return frozen
+        if self._record is None or self._record[0] is not frozen or self._record[1] is not self.own_params:
+            params, k = self.own_params
+            self._record = frozen, self.own_params, self.spec.freeze_with(
+                               {name: float(values[k]) for name, values in params.items()})
+        return self._record[2]
+
     @property
     def act_eq(self):
         """For rate-coded units, `act` == `act_eq`. This Unit implementation is only rate-coded."""
@@ -81,7 +106,7 @@ class Unit:
     @property
     def net(self):
         """Excitatory conductance."""
-        return self.spec.g_bar_e * self.g_e
+        return self.record.g_bar_e * self.g_e
 
     def force_activity(self, act_ext):
         """Force the activity of a unit.
@@ -123,7 +148,7 @@ class Unit:
 
 
 
-class UnitSpec:
+class UnitSpec(Spec):
     """Units specification.
 
     Each unit can have different parameters values. They don't change during
@@ -136,6 +161,7 @@ class UnitSpec:
     >>> u = Unit(spec=spec)           # creating a Unit instance
 
     """
+    fixed_params = ('act_gain', 'act_sd')  # define the noisy activation function table
 
 
     def __init__(self, **kwargs):
@@ -196,11 +222,35 @@ class UnitSpec:
 
         self._nxx1_conv = None # precomputed convolution for the noisy xx1 function
 
+    def _invalidate(self):
+        Spec._invalidate(self)
+        self._nxx1_conv = None
+
+    def constants(self):
+        """Constants derived from the parameters, precomputed in the frozen spec."""
+        constants = {'dt_net'  : self.dt_net,
+                     'dt_v_m'  : self.dt_v_m,
+                     'gc_l'    : self.g_bar_l * self.g_l,
+                     # constant terms of the g_e_thr computation in `cycle`
+                     'gc_l_thr': self.g_bar_l * self.g_l * (self.e_rev_l - self.act_thr),
+                     'thr_e'   : self.act_thr - self.e_rev_e,
+                     'avg_fact': (self.avg_lrn_max - self.avg_lrn_min)/(self.avg_l_gain - self.avg_l_min)}
+        if self.noisy_act:
+            xs, conv = self.nxx1_table()
+            xs.flags.writeable, conv.flags.writeable = False, False
+            constants['nxx1_table'] = xs, conv
+        return constants
+
+    def freeze_with(self, params):
+        if self.noisy_act:
+            self.nxx1_table()  # computed once, shared by the records
+        return Spec.freeze_with(self, params)
+
     def avg_l_lrn(self, unit):
         if unit.genre != HIDDEN:  # no self-organization for non-hidden layers
             return 0.0
-        avg_fact = (self.avg_lrn_max - self.avg_lrn_min)/(self.avg_l_gain - self.avg_l_min)
-        return self.avg_lrn_min + avg_fact * (unit.avg_l - self.avg_l_min)
+        c = unit.record
+        return c.avg_lrn_min + c.avg_fact * (unit.avg_l - c.avg_l_min)
 
     @property
     def dt_net(self):
@@ -219,13 +269,10 @@ class UnitSpec:
         X = self.act_gain * max(v_m, 0.0)
         return X / (X + 1)
 
-    def noisy_xx1(self, v_m):
-        """Compute the noisy x/(x+1) activation function.
+    def nxx1_table(self):
+        """Return the precomputed noisy x/(x+1) function, as a (xs, values) pair of arrays.
 
-        The noisy x/(x+1) function is the convolution of the x/(x+1) function
-        with a Gaussian with a `self.spec.act_sd` standard deviation. Here, we
-        precompute the convolution as a look-up table, and interpolate it with
-        the desired point every time the function is called.
+        The values are linearly interpolated between the `xs` points.
         """
         if self._nxx1_conv is None:  # convolution not precomputed yet
             res = 0.001 # resolution of the precomputed array
@@ -253,7 +300,17 @@ class UnitSpec:
 
             self._nxx1_conv = xs_valid, conv
 
-        xs, conv = self._nxx1_conv
+        return self._nxx1_conv
+
+    def noisy_xx1(self, v_m):
+        """Compute the noisy x/(x+1) activation function.
+
+        The noisy x/(x+1) function is the convolution of the x/(x+1) function
+        with a Gaussian with a `self.spec.act_sd` standard deviation. Here, we
+        precompute the convolution as a look-up table, and interpolate it with
+        the desired point every time the function is called.
+        """
+        xs, conv = self.nxx1_table()
         if v_m < xs[0]:
             return 0.0
         elif xs[-1] < v_m:
@@ -280,7 +337,7 @@ class UnitSpec:
             unit.ex_inputs = []
 
         # updating net
-        unit.g_e += dt_integ * self.dt_net * (net_raw - unit.g_e)  # eq 2.16
+        unit.g_e += dt_integ * unit.record.dt_net * (net_raw - unit.g_e)  # eq 2.16
 
 
     def force_activity(self, unit):
@@ -289,16 +346,17 @@ class UnitSpec:
         Note that this is computed immediately when forcing a unit's activity, and in particular
         before cycling connections.
         """
+        c = unit.record
         # calculate_netin
-        unit.g_e = unit.act_ext / self.g_bar_e  # unit.net == unit.act
+        unit.g_e = unit.act_ext / c.g_bar_e  # unit.net == unit.act
         # cycle
         unit.I_net = 0.0
         unit.act    = unit.act_ext
         unit.act_nd = unit.act_ext
         if unit.act == 0:
-            unit.v_m = self.e_rev_l
+            unit.v_m = c.e_rev_l
         else:
-            unit.v_m = self.act_thr + unit.act_ext / self.act_gain;
+            unit.v_m = c.act_thr + unit.act_ext / c.act_gain;
         unit.v_m_eq = unit.v_m
 
 
@@ -313,58 +371,58 @@ class UnitSpec:
             self.update_avgs(unit, dt_integ)
             unit.update_logs()
             return # see self.force_activity
+        c = unit.record  # parameters and precomputed constants
 
         # computing I_net and I_net_r
         unit.I_net   = self.integrate_I_net(unit, g_i, dt_integ, ratecoded=False, steps=2) # half-step integration
         unit.I_net_r = self.integrate_I_net(unit, g_i, dt_integ, ratecoded=True,  steps=1) # one-step integration
 
         # updating v_m and v_m_eq
-        unit.v_m    += dt_integ * self.dt_v_m * unit.I_net   # - unit.adapt is done on the I_net value.
-        unit.v_m_eq += dt_integ * self.dt_v_m * unit.I_net_r
+        unit.v_m    += dt_integ * c.dt_v_m * unit.I_net   # - unit.adapt is done on the I_net value.
+        unit.v_m_eq += dt_integ * c.dt_v_m * unit.I_net_r
         #unit.v_m     = max(self.v_m_min, min(unit.v_m, self.v_m_max))
 
         # modulate act_thr
         
 
         # reseting v_m if over the threshold (spike-like behavior)
-        if unit.v_m > self.act_thr: # 2021-12-05 TAT may use Dopa and Adeno to modulate act_thr!
+        if unit.v_m > c.act_thr: # 2021-12-05 TAT may use Dopa and Adeno to modulate act_thr!
             unit.spike = 1
-            unit.v_m   = self.v_m_r
+            unit.v_m   = c.v_m_r
             unit.I_net = 0.0
         else:
             unit.spike = 0
 
         # selecting the activation function, noisy or not. (note: could also use sigmoid here)
-        act_fun = self.noisy_xx1 if self.noisy_act else self.xx1
+        act_fun = self.noisy_xx1 if c.noisy_act else self.xx1
 
         # computing new_act, from v_m_eq (because rate-coded neuron)
-        if unit.v_m_eq <= self.act_thr:
-            new_act = act_fun(unit.v_m_eq - self.act_thr)
+        if unit.v_m_eq <= c.act_thr:
+            new_act = act_fun(unit.v_m_eq - c.act_thr)
             #print('SUBTHR {} {}\n       new_act={}'.format(unit.v_m_eq, self.act_thr, new_act))
         else:
-            gc_e = self.g_bar_e * unit.g_e
-            gc_i = self.g_bar_i * g_i
-            gc_l = self.g_bar_l * self.g_l
-            g_e_thr = (  gc_i * (self.e_rev_i - self.act_thr)
-                       + gc_l * (self.e_rev_l - self.act_thr)
-                       - unit.adapt + self.bias) / (self.act_thr - self.e_rev_e)
+            gc_e = c.g_bar_e * unit.g_e
+            gc_i = c.g_bar_i * g_i
+            g_e_thr = (  gc_i * (c.e_rev_i - c.act_thr)
+                       + c.gc_l_thr  # gc_l * (e_rev_l - act_thr)
+                       - unit.adapt + c.bias) / c.thr_e
 
             new_act = act_fun(gc_e - g_e_thr)  # gc_e == unit.net
             #print('ABVTHR {} net={} {}\n       new_act={}'.format(unit.v_m_eq, gc_e, g_e_thr, new_act))
 
 
         # updating activity
-        unit.act_nd += dt_integ * self.dt_v_m * (new_act - unit.act_nd)
+        unit.act_nd += dt_integ * c.dt_v_m * (new_act - unit.act_nd)
         #print('FASTCYV act={}'.format(unit.act_nd))
 
         #unit.act_nd = max(self.act_min, min(unit.act_nd, self.act_max))
         unit.act = unit.act_nd # FIXME: implement stp
 
         # updating adaptation
-        if self.adapt_on:
+        if c.adapt_on:
             unit.adapt += dt_integ * (
-                            self.dt_adapt * (self.v_m_gain * (unit.v_m - self.e_rev_l) - unit.adapt)
-                            + unit.spike * self.spike_gain
+                            c.dt_adapt * (c.v_m_gain * (unit.v_m - c.e_rev_l) - unit.adapt)
+                            + unit.spike * c.spike_gain
                           )
 
         # if phase == 'minus':
@@ -451,28 +509,30 @@ class UnitSpec:
         """
         assert steps >= 1
 
-        gc_e = self.g_bar_e * unit.g_e
-        gc_i = self.g_bar_i * g_i
-        gc_l = self.g_bar_l * self.g_l
+        c = unit.record
+        gc_e = c.g_bar_e * unit.g_e
+        gc_i = c.g_bar_i * g_i
+        gc_l = c.gc_l
         v_m_eff = unit.v_m_eq if ratecoded else unit.v_m
 
         for _ in range(steps):
-            I_net = (  gc_e * (self.e_rev_e - v_m_eff)
-                     + gc_i * (self.e_rev_i - v_m_eff)
-                     + gc_l * (self.e_rev_l - v_m_eff)
+            I_net = (  gc_e * (c.e_rev_e - v_m_eff)
+                     + gc_i * (c.e_rev_i - v_m_eff)
+                     + gc_l * (c.e_rev_l - v_m_eff)
                      - unit.adapt
-                      + self.bias)
-            v_m_eff += dt_integ/steps * self.dt_v_m * I_net
+                      + c.bias)
+            v_m_eff += dt_integ/steps * c.dt_v_m * I_net
 
         return I_net
 
 
     def update_avgs(self, unit, dt_integ):
         """Update all averages except long-term, at the end of every cycle."""
-        unit.avg_ss += dt_integ * self.avg_ss_dt * (unit.act_nd - unit.avg_ss)
-        unit.avg_s  += dt_integ * self.avg_s_dt  * (unit.avg_ss - unit.avg_s )
-        unit.avg_m  += dt_integ * self.avg_m_dt  * (unit.avg_s  - unit.avg_m )
-        unit.avg_s_eff = self.avg_m_in_s * unit.avg_m + (1 - self.avg_m_in_s) * unit.avg_s
+        c = unit.record
+        unit.avg_ss += dt_integ * c.avg_ss_dt * (unit.act_nd - unit.avg_ss)
+        unit.avg_s  += dt_integ * c.avg_s_dt  * (unit.avg_ss - unit.avg_s )
+        unit.avg_m  += dt_integ * c.avg_m_dt  * (unit.avg_s  - unit.avg_m )
+        unit.avg_s_eff = c.avg_m_in_s * unit.avg_m + (1 - c.avg_m_in_s) * unit.avg_s
         # print('avg_s_eff', unit.avg_s_eff)
 
     def update_avg_l(self, unit):
@@ -480,8 +540,9 @@ class UnitSpec:
 
         Called at the end of every trial (*not every cycle*).
         """
-        unit.avg_l += self.avg_l_dt * (self.avg_l_gain * unit.avg_m - unit.avg_l)
-        unit.avg_l = max(unit.avg_l, self.avg_l_min)
+        c = unit.record
+        unit.avg_l += c.avg_l_dt * (c.avg_l_gain * unit.avg_m - unit.avg_l)
+        unit.avg_l = max(unit.avg_l, c.avg_l_min)
 
         # if unit.avg_m > 0.2: # FIXME: 0.2 is a magic number here
         #     unit.avg_l += self.avg_l_dt * (self.avg_l_gain - unit.avg_l)
@@ -523,4 +584,4 @@ class UnitSpec:
         self.r_a2 = ratio
 
     def logistic(self, val):
-        return 1.0/(1+exp(-val))
\ No newline at end of file
+        return 1.0/(1+np.exp(-val))
\ No newline at end of file
@@ -41,16 +41,20 @@ setuptools.setup(
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
 
         'Programming Language :: Python :: 3 :: Only',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
 
     # where is our code
     packages=['leabra'],
 
+    # shared_memory (parallel and shared modules) requires Python 3.8
+    python_requires='>=3.8',
+
     # required dependencies
-    install_requires=['numpy', 'scipy', 'bokeh>=0.12.6', 'ipywidgets>=7.0', 'jupyter'],
+    install_requires=['numpy>=1.17', 'scipy', 'bokeh>=0.12.6', 'ipywidgets>=7.0', 'jupyter'],
 
     # you can install extras_require with
     # $ pip install -e .[test]
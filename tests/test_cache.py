@@ -0,0 +1,93 @@
+import copy
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+from leabra.cache import SettleCache
+
+from test_engine import build_network, PATTERNS
+
+
+def settled(network, inputs):
+    network.set_inputs(inputs)
+    network.settle()
+    return [np.array([u.act_m for u in layer.units]) for layer in network.layers]
+
+
+class CacheTestBehavior(unittest.TestCase):
+
+    def test_hits(self):
+        """Cached settles restore the same activities as simulated ones."""
+        network = build_network()
+        ref_network = copy.deepcopy(network)
+        network.settle_cache = cache = SettleCache()
+        for _ in range(8):
+            misses = cache.misses
+            for inputs, _ in PATTERNS:
+                acts, ref_acts = settled(network, inputs), settled(ref_network, inputs)
+                for act, ref_act in zip(acts, ref_acts):
+                    self.assertTrue(np.array_equal(act, ref_act))
+        # the state carried over from the previous trial converges after a few epochs
+        self.assertEqual(cache.misses, misses)
+        self.assertGreaterEqual(cache.hits, 3)
+        self.assertEqual(network.trial_count, ref_network.trial_count)
+        self.assertEqual(network.quarter_nb, 4)
+
+        # training after cached settles
+        network.set_outputs(PATTERNS[0][1])
+        ref_network.set_outputs(PATTERNS[0][1])
+        self.assertEqual(network.trial(), ref_network.trial())
+
+    def settle_until_hit(self, network, inputs):
+        hits = network.settle_cache.hits
+        for _ in range(20):
+            settled(network, inputs)
+            if network.settle_cache.hits > hits:
+                return
+        self.fail('no cache hit')
+
+    def test_invalidation(self):
+        network = build_network()
+        network.settle_cache = cache = SettleCache()
+        inputs, outputs = PATTERNS[0]
+        self.settle_until_hit(network, inputs)
+
+        key = cache.key(network)
+        network.set_outputs(outputs)
+        network.trial()  # learning changes the weights
+        network.set_inputs(inputs)
+        self.assertNotEqual(cache.key(network)[1], key[1])
+        ref_network = copy.deepcopy(network)
+        ref_network.settle_cache = None
+        after_learning = settled(network, inputs)
+        for act, ref_act in zip(after_learning, settled(ref_network, inputs)):
+            self.assertTrue(np.array_equal(act, ref_act))
+
+        self.settle_until_hit(network, inputs)
+        misses = cache.misses
+        network.connections[0].weights = network.connections[0].weights * 0.9
+        settled(network, inputs)
+        self.assertEqual(cache.misses, misses + 1)
+        self.settle_until_hit(network, inputs)
+        misses = cache.misses
+        network.layers[1].units[0].spec.g_bar_i = 1.1  # spec change
+        settled(network, inputs)
+        self.assertEqual(cache.misses, misses + 1)
+
+        network.recorder = object()  # recorded settles are simulated
+        self.assertFalse(cache.usable(network))
+
+    def test_lru(self):
+        network = build_network()
+        network.settle_cache = cache = SettleCache(maxsize=2)
+        for _ in range(3):
+            for inputs, _ in PATTERNS:
+                settled(network, inputs)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.hits, 0)  # entries are dropped before they repeat
+        self.assertIn('network', network.memory_report().by_owner())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,8 @@
+import copy
+import random
+
+import numpy as np
+
 import dotdot
 import leabra
 
@@ -8,3 +13,57 @@ def test_sig_inv():
     assert conn_spec.sig_inv( 0.5) == 0.5
     assert conn_spec.sig_inv( 1.0) == 1.0
     assert conn_spec.sig_inv( 2.0) == 1.0
+
+def test_sig_inv_array():
+    conn_spec = leabra.ConnectionSpec()
+    ws = np.array([-1.0, 0.0, 0.1, 0.5, 0.7, 1.0, 2.0])
+    assert np.allclose(conn_spec.sig_inv(ws), [conn_spec.sig_inv(w) for w in ws], rtol=0, atol=1e-15)
+    assert np.allclose(conn_spec.sig(conn_spec.sig_inv(ws[2:5])), ws[2:5])
+
+def test_seeded_weights():
+    """Check that the weights drawn from the network's generator are reproducible."""
+    def build(seed, rnd_type):
+        conn_spec = leabra.ConnectionSpec(rnd_type=rnd_type, rnd_mean=0.5, rnd_var=0.25)
+        layers = [leabra.Layer(30, name='in'), leabra.Layer(20, name='out')]
+        conns = [leabra.Connection(layers[0], layers[1], spec=conn_spec)]
+        return leabra.Network(spec=leabra.NetworkSpec(seed=seed), layers=layers, connections=conns)
+
+    for rnd_type in ['uniform', 'gaussian']:
+        conn0, conn1, conn2 = [build(seed, rnd_type).connections[0] for seed in (1, 1, 2)]
+        assert np.array_equal(conn0.wt, conn1.wt)
+        assert not np.array_equal(conn0.wt, conn2.wt)
+        assert np.array_equal(conn0.fwt, conn0.spec.sig_inv(conn0.wt))
+        if rnd_type == 'uniform':
+            assert np.all((0.25 <= conn0.wt) & (conn0.wt <= 0.75))
+
+def test_unseeded_weights():
+    """Unseeded weights are drawn when the connections are created, from the `random` module."""
+    def build(seed=None):
+        layers = [leabra.Layer(4), leabra.Layer(3)]
+        conns = [leabra.Connection(layers[0], layers[1]),
+                 leabra.Connection(layers[1], layers[1], spec=leabra.ConnectionSpec(proj='1to1'))]
+        return leabra.Network(spec=leabra.NetworkSpec(seed=seed), layers=layers, connections=conns)
+
+    random.seed(0)
+    network = build()
+    state = random.getstate()
+    copied = copy.deepcopy(network)
+    network.connections[0].weights
+    assert random.getstate() == state  # reading and copying the weights draws nothing
+    for conn, other in zip(network.connections, copied.connections):
+        assert np.array_equal(conn.wt, other.wt)
+        assert np.array_equal(conn.fwt, conn.spec.sig_inv(conn.wt))
+    random.seed(0)
+    assert np.array_equal(build().connections[0].weights, network.connections[0].weights)
+    assert np.array_equal(build(seed=1).connections[0].weights, build(seed=1).connections[0].weights)
+
+def test_dense_links():
+    """Check the link views of dense and 1to1 connections."""
+    pre, post = leabra.Layer(3), leabra.Layer(3)
+    full = leabra.Connection(pre, post, spec=leabra.ConnectionSpec(proj='full'))
+    assert full.dense and full.n_links == 9
+    assert full.links[5].pre is pre.units[1] and full.links[5].post is post.units[2]
+    assert full.weights[1, 2] == full.links[5].wt
+    one = leabra.Connection(pre, post, spec=leabra.ConnectionSpec(proj='1to1'))
+    assert not one.dense and one.n_links == 3
+    assert one.links[2].pre is pre.units[2] and one.links[2].post is post.units[2]
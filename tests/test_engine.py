@@ -0,0 +1,271 @@
+import unittest
+import copy
+import threading
+import concurrent.futures
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra.engine import Engine, AdaptiveStep, compare_steps, compare_solver
+
+
+def build_network(adapt_on=True, noisy_act=True, seed=None):
+    unit_spec = leabra.UnitSpec(adapt_on=adapt_on, noisy_act=noisy_act)
+    inpout_spec = leabra.LayerSpec(lay_inhib=True, g_i=2.0, ff=1, fb=0.5)
+    hidden_spec = leabra.LayerSpec(lay_inhib=True, g_i=1.8, ff=1, fb=1)
+    conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04,
+                                      rnd_mean=0.5, rnd_var=0.25)
+    input_layer  = leabra.Layer(4, spec=inpout_spec, unit_spec=unit_spec, genre=leabra.INPUT, name='input_layer')
+    hidden_layer = leabra.Layer(5, spec=hidden_spec, unit_spec=unit_spec, genre=leabra.HIDDEN, name='hidden_layer')
+    output_layer = leabra.Layer(2, spec=inpout_spec, unit_spec=unit_spec, genre=leabra.OUTPUT, name='output_layer')
+    conn0 = leabra.Connection(input_layer, hidden_layer, spec=conn_spec)
+    conn1 = leabra.Connection(hidden_layer, output_layer, spec=conn_spec)
+    return leabra.Network(spec=leabra.NetworkSpec(seed=seed),
+                          layers=[input_layer, hidden_layer, output_layer],
+                          connections=[conn0, conn1])
+
+def build_recurrent_network(seed=None):
+    """Network with feedback (output to hidden) and self-recurrent (hidden to hidden) connections"""
+    network = build_network(seed=seed)
+    input_layer, hidden_layer, output_layer = network.layers
+    feedback_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04, wt_scale_rel=0.3)
+    recurrent_spec = leabra.ConnectionSpec(proj='1to1', wt_scale_rel=0.2)
+    network.add_connection(leabra.Connection(output_layer, hidden_layer, spec=feedback_spec))
+    network.add_connection(leabra.Connection(hidden_layer, hidden_layer, spec=recurrent_spec))
+    return network
+
+PATTERNS = [({'input_layer': [1.0, 1.0, 0.0, 0.0]}, {'output_layer': [1.0, 0.0]}),
+            ({'input_layer': [0.0, 0.0, 1.0, 1.0]}, {'output_layer': [0.0, 1.0]}),
+            ({'input_layer': [0.0, 1.0, 1.0, 0.0]}, {'output_layer': [1.0, 0.0]})]
+
+
+class EngineTestBehavior(unittest.TestCase):
+
+    def test_equivalence(self):
+        """Check that the engine reproduces the Network simulation."""
+        for adapt_on, noisy_act in [(True, True), (False, False)]:
+            network = build_network(adapt_on=adapt_on, noisy_act=noisy_act)
+            ref_network = copy.deepcopy(network)
+            engine = Engine(network)
+            state = engine.new_state()
+
+            for inputs, outputs in 3 * PATTERNS:
+                ref_network.set_inputs(inputs)
+                ref_network.set_outputs(outputs)
+                ref_sse = ref_network.trial()
+                sse = engine.trial(state, inputs, outputs)
+                self.assertTrue(np.allclose(ref_sse, sse, rtol=1e-8, atol=1e-12))
+
+                for layer, ls in zip(ref_network.layers, state.layers):
+                    for name in ['act', 'act_m', 'v_m', 'g_e', 'adapt', 'avg_s_eff', 'avg_m', 'avg_l']:
+                        ref = [getattr(u, name) for u in layer.units]
+                        self.assertTrue(np.allclose(ref, getattr(ls, name)[0], rtol=1e-8, atol=1e-12),
+                                        msg='{} {}'.format(layer.name, name))
+                    self.assertTrue(np.allclose(layer.fbi, ls.fbi[0], rtol=1e-8, atol=1e-12))
+                for ref_conn, conn in zip(ref_network.connections, network.connections):
+                    self.assertTrue(np.allclose(ref_conn.wt, conn.wt, rtol=1e-8, atol=1e-12))
+
+            self.assertEqual(state.trial_count, ref_network.trial_count)
+            self.assertEqual(state.cycle_tot, ref_network.cycle_tot)
+
+    def test_small_batch(self):
+        """Check that the engine accumulates the weight changes as the Network."""
+        network = build_network()
+        network.spec.small_batch_n = 2
+        ref_network = copy.deepcopy(network)
+        engine = Engine(network)
+        state = engine.new_state()
+        for inputs, outputs in 3 * PATTERNS:
+            ref_network.set_inputs(inputs)
+            ref_network.set_outputs(outputs)
+            self.assertTrue(np.allclose(ref_network.trial(), engine.trial(state, inputs, outputs),
+                                        rtol=1e-8, atol=1e-12))
+            self.assertEqual(ref_network.n_dwt_trials, network.n_dwt_trials)
+            for ref_conn, conn in zip(ref_network.connections, network.connections):
+                self.assertTrue(np.allclose(ref_conn.wt, conn.wt, rtol=1e-8, atol=1e-12))
+                self.assertTrue(np.allclose(ref_conn.dwt, conn.dwt, rtol=1e-8, atol=1e-12))
+        self.assertEqual(network.n_dwt_trials, 1)
+
+    def test_recurrent(self):
+        """Check recurrent networks: equivalence with Network, independence from the order of
+        the connections and layers, and parallel transmission."""
+        network = build_recurrent_network()
+        ref_network = copy.deepcopy(network)
+        reordered = copy.deepcopy(network)
+        reordered.layers.reverse()
+        reordered.connections.reverse()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        engines = [Engine(network), Engine(copy.deepcopy(network), executor=executor),
+                   Engine(copy.deepcopy(reordered))]
+        states = [engine.new_state() for engine in engines]
+
+        for inputs, outputs in 2 * PATTERNS:
+            for net in (ref_network, reordered):
+                net.set_inputs(inputs)
+                net.set_outputs(outputs)
+                net.trial()
+            for engine, state in zip(engines, states):
+                engine.trial(state, inputs, outputs)
+
+            for layer in ref_network.layers:
+                ref_act = [u.act for u in layer.units]
+                other = reordered._get_layer(layer.name)
+                self.assertTrue(np.allclose(ref_act, [u.act for u in other.units], rtol=1e-8, atol=1e-12))
+                self.assertTrue(np.allclose(ref_act, states[0].layer(layer.name).act[0],
+                                            rtol=1e-8, atol=1e-12))
+                self.assertTrue(np.allclose(ref_act, states[2].layer(layer.name).act[0],
+                                            rtol=1e-8, atol=1e-12))
+                # parallel transmission gives exactly the same result
+                self.assertTrue(np.array_equal(states[0].layer(layer.name).act,
+                                               states[1].layer(layer.name).act))
+        executor.shutdown()
+
+    def test_batch(self):
+        """Check that batch elements are independent simulations."""
+        engine = Engine(build_network())
+        batch_state = engine.new_state(batch=len(PATTERNS))
+        inputs = {'input_layer': np.array([inp['input_layer'] for inp, _ in PATTERNS])}
+        engine.settle(batch_state, inputs)
+
+        for k, (inp, _) in enumerate(PATTERNS):
+            state = engine.new_state()
+            engine.settle(state, inp)
+            for ls, batch_ls in zip(state.layers, batch_state.layers):
+                self.assertTrue(np.allclose(ls.act_m[0], batch_ls.act_m[k], rtol=1e-12, atol=1e-15))
+
+    def test_snapshot(self):
+        """Check that restoring a snapshot reproduces the same simulation."""
+        engine = Engine(build_network())
+        state = engine.new_state()
+        engine.trial(state, *PATTERNS[0], learn=False)
+        snapshot = state.copy()
+
+        sse = engine.trial(state, *PATTERNS[1], learn=False)
+        acts = [ls.act.copy() for ls in state.layers]
+        state.restore(snapshot)
+        self.assertEqual(state.trial_count, snapshot.trial_count)
+        self.assertTrue(np.array_equal(sse, engine.trial(state, *PATTERNS[1], learn=False)))
+        for act, ls in zip(acts, state.layers):
+            self.assertTrue(np.array_equal(act, ls.act))
+
+    def test_threads(self):
+        """Check that concurrent simulations sharing one engine do not interfere."""
+        engine = Engine(build_network())
+        expected = []
+        for inputs, _ in PATTERNS:
+            state = engine.new_state()
+            engine.settle(state, inputs)
+            expected.append(state.layer('output_layer').act_m.copy())
+
+        results = [None] * len(PATTERNS)
+        def run(k):
+            state = engine.new_state()
+            for _ in range(5):
+                state.restore(engine.new_state())
+                engine.settle(state, PATTERNS[k][0])
+            results[k] = state.layer('output_layer').act_m
+        threads = [threading.Thread(target=run, args=(k,)) for k in range(len(PATTERNS))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for result, exp in zip(results, expected):
+            self.assertTrue(np.array_equal(result, exp))
+
+    def test_adaptive_step(self):
+        """Check that adaptive steps settle with fewer steps, close to the fixed-step simulation."""
+        unit_spec = leabra.UnitSpec(adapt_on=False)
+        layer_spec = leabra.LayerSpec(lay_inhib=True, g_i=1.0)
+        input_layer  = leabra.Layer(4, spec=layer_spec, unit_spec=unit_spec, genre=leabra.INPUT, name='input_layer')
+        output_layer = leabra.Layer(3, spec=layer_spec, unit_spec=unit_spec, genre=leabra.OUTPUT, name='output_layer')
+        conn = leabra.Connection(input_layer, output_layer,
+                                 spec=leabra.ConnectionSpec(proj='full', rnd_mean=0.3, rnd_var=0.05))
+        network = leabra.Network(spec=leabra.NetworkSpec(seed=1), layers=[input_layer, output_layer],
+                                 connections=[conn])
+
+        report = compare_steps(network, {'input_layer': [1.0, 0.0, 1.0, 0.0]}, AdaptiveStep(tol=0.005),
+                               n_trials=2)
+        self.assertEqual(report['fixed_steps'], 150)
+        self.assertLess(report['adaptive_steps'], 0.6 * report['fixed_steps'])
+        self.assertLess(report['max_abs_error'], 1e-6)
+
+    def test_adaptive_trial(self):
+        """Check that adaptive steps keep the time semantics of trials."""
+        engine = Engine(build_network(), adaptive_step=AdaptiveStep(tol=0.02))
+        state = engine.new_state()
+        for inputs, outputs in PATTERNS:
+            engine.trial(state, inputs, outputs)
+        self.assertEqual(state.trial_count, 2)
+        self.assertEqual(state.cycle_tot, 3 * 4 * engine.quarter_size)
+        self.assertEqual((state.quarter_nb, state.cycle_count), (4, engine.quarter_size))
+
+    def test_solve(self):
+        """Check that the fixed-point solver finds the settled activities."""
+        inputs = [inputs for inputs, _ in PATTERNS]
+        for seed in range(10):
+            network = build_network(adapt_on=False, seed=seed)
+            report = compare_solver(network, inputs)
+            self.assertEqual((report['converged'], report['settled']), (1.0, 1.0), msg='seed {}'.format(seed))
+            self.assertLess(report['max_abs_error'], 1e-4)
+
+        # the error only covers the patterns for which both the solver and the simulation stopped
+        for seed in range(10):
+            network = build_recurrent_network(seed=seed)
+            network.layers[0].units[0].spec.adapt_on = False  # shared by all the units
+            report = compare_solver(network, inputs)
+            self.assertEqual(report['converged'], 1.0, msg='seed {}'.format(seed))
+            self.assertGreaterEqual(report['settled'] * len(inputs), 2, msg='seed {}'.format(seed))
+            self.assertLess(report['max_abs_error'], 1e-4)
+
+        engine = Engine(network)
+        state = engine.new_state()
+        engine.trial(state, *PATTERNS[0], learn=False)
+        self.assertTrue(engine.solve(state, PATTERNS[1][0]))
+        self.assertEqual((state.trial_count, state.quarter_nb, state.phase), (1, 4, 'minus'))
+        self.assertTrue(np.array_equal(state.layers[2].act_m, state.layers[2].act))
+
+    def test_unit_params(self):
+        """Check that the engine simulates units with their own parameters as the Network."""
+        for adapt_on in (True, False):
+            network = build_network(adapt_on=adapt_on)
+            hidden_layer = network.layers[1]
+            hidden_layer.set_unit_params(act_thr=np.linspace(0.45, 0.55, 5), g_bar_l=np.linspace(0.1, 0.3, 5),
+                                         bias=[0.0, 0.01, -0.01, 0.02, 0.0], spike_gain=np.linspace(0.005, 0.01, 5))
+            ref_network = copy.deepcopy(network)
+            engine = Engine(network)
+            state = engine.new_state()
+            self.assertEqual(engine.unit_specs[1].act_thr.shape, (5,))
+            self.assertIs(engine.unit_specs[0], network.layers[0].units[0].spec.freeze())
+
+            for inputs, outputs in 2 * PATTERNS:
+                ref_network.set_inputs(inputs)
+                ref_network.set_outputs(outputs)
+                ref_sse = ref_network.trial()
+                sse = engine.trial(state, inputs, outputs)
+                self.assertTrue(np.allclose(ref_sse, sse, rtol=1e-8, atol=1e-12))
+                for layer, ls in zip(ref_network.layers, state.layers):
+                    for name in ['act', 'act_m', 'v_m', 'adapt', 'avg_l']:
+                        ref = [getattr(u, name) for u in layer.units]
+                        self.assertTrue(np.allclose(ref, getattr(ls, name)[0], rtol=1e-8, atol=1e-12),
+                                        msg='{} {}'.format(layer.name, name))
+
+        # modifying the unit parameters or the shared spec is taken into account
+        hidden_layer.set_unit_params(act_thr=[0.45, 0.5, 0.6, 0.5, 0.55])
+        self.assertEqual(engine.unit_specs[1].act_thr[2], 0.6)
+        hidden_layer.units[0].spec.g_bar_i = 1.1
+        self.assertEqual(engine.unit_specs[1].g_bar_i, 1.1)
+        self.assertEqual(engine.unit_specs[1].act_thr[2], 0.6)
+
+    def test_solve_fallback(self):
+        """Check that the solver falls back to the simulation when it cannot converge."""
+        engine = Engine(build_network(adapt_on=True))
+        state, ref_state = engine.new_state(), engine.new_state()
+        self.assertFalse(engine.solve(state, PATTERNS[0][0]))
+        engine.settle(ref_state, PATTERNS[0][0])
+        for ls, ref_ls in zip(state.layers, ref_state.layers):
+            self.assertTrue(np.array_equal(ls.act_m, ref_ls.act_m))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import copy
+import pickle
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+from leabra.engine import Engine
+from leabra.cache import SettleCache
+from leabra.hooks import Hooks, EVENTS
+from leabra.metrics import Metrics, SSE
+from leabra.shared import SharedWeights
+
+from test_engine import build_network, PATTERNS
+
+
+def log_events(network):
+    """Register a hook on every event, logging (event, cycle of the trial)."""
+    log = []
+    for event in EVENTS:
+        network.hooks.add(event, lambda view, event=event: log.append((event, view.cycle)))
+    return log
+
+def occlude(view):
+    """Hide the input during the second half of the minus phase."""
+    if view.cycle == 38:
+        view.force_activity('input_layer', [0.0, 0.0, 0.0, 0.0])
+
+
+class HooksTestBehavior(unittest.TestCase):
+
+    def test_registry(self):
+        hooks = Hooks()
+        self.assertFalse(hooks)
+        hook = hooks.add('cycle_end', print)
+        self.assertIs(hook, print)
+        self.assertTrue(hooks.per_cycle)
+        self.assertEqual(hooks.cycle_end, (print,))
+        hooks.remove('cycle_end', print)
+        self.assertFalse(hooks)
+        hooks.add('quarter_start', print)
+        self.assertFalse(hooks.per_cycle)
+        self.assertTrue(hooks.per_quarter)
+        hooks.clear()
+        self.assertFalse(hooks)
+        with self.assertRaises(ValueError):
+            hooks.add('cycle', print)
+        with self.assertRaises(ValueError):
+            hooks.remove('trial_end', print)
+
+    def test_events(self):
+        """The Network and the Engine call the hooks at the same events, in the same order."""
+        network = build_network()
+        quarter_size = network.spec.quarter_size
+        ref_network = copy.deepcopy(network)
+        ref_log, log = log_events(ref_network), log_events(network)
+        engine = Engine(network)
+        state = engine.new_state()
+        inputs, outputs = PATTERNS[0]
+        ref_network.set_inputs(inputs)
+        ref_network.set_outputs(outputs)
+        ref_network.trial()
+        engine.trial(state, inputs, outputs)
+        self.assertEqual(log, ref_log)
+
+        events = [event for event, _ in ref_log]
+        self.assertEqual(events.count('cycle_start'), 4 * quarter_size)
+        self.assertEqual(events.count('cycle_end'), 4 * quarter_size)
+        self.assertEqual(events[:3], ['trial_start', 'quarter_start', 'cycle_start'])
+        self.assertEqual(events[-2:], ['quarter_end', 'trial_end'])
+        k = events.index('minus_end')
+        self.assertEqual(events[k - 2:k + 4], ['cycle_end', 'quarter_end', 'minus_end',
+                                               'plus_start', 'quarter_start', 'cycle_start'])
+        self.assertEqual(ref_log[k], ('minus_end', 3 * quarter_size))
+
+        # settling ends the trial after the minus phase
+        del ref_log[:]
+        ref_network.settle()
+        self.assertEqual(ref_log[-3:], [('quarter_end', 3 * quarter_size),
+                                        ('minus_end', 3 * quarter_size),
+                                        ('trial_end', 4 * quarter_size)])
+
+    def test_modification(self):
+        """Hooks modifying the simulation are applied identically by the Network and the Engine."""
+        network = build_network()
+        ref_network = copy.deepcopy(network)
+        intact = copy.deepcopy(network)
+        ref_network.hooks.add('cycle_start', occlude)
+        network.hooks.add('cycle_start', occlude)
+        engine = Engine(network)
+        state = engine.new_state()
+        for inputs, outputs in PATTERNS:
+            for net in (ref_network, intact):
+                net.set_inputs(inputs)
+                net.set_outputs(outputs)
+            ref_sse = ref_network.trial()
+            self.assertTrue(np.allclose(ref_sse, engine.trial(state, inputs, outputs),
+                                        rtol=1e-8, atol=1e-12))
+            self.assertFalse(np.isclose(ref_sse, intact.trial(), rtol=1e-6))
+            for layer, ls in zip(ref_network.layers, state.layers):
+                ref = [u.act_m for u in layer.units]
+                self.assertTrue(np.allclose(ref, ls.act_m[0], rtol=1e-8, atol=1e-12))
+        self.assertTrue(np.all(state.layers[0].act_m == 0.0))
+
+    def test_shortcuts(self):
+        """The settle cache is bypassed, and the solver falls back to settling."""
+        network = build_network(adapt_on=False)
+        network.settle_cache = SettleCache()
+        log = log_events(network)
+        network.set_inputs(PATTERNS[0][0])
+        network.settle()
+        network.settle()
+        self.assertEqual(network.settle_cache.bypasses, 2)
+        self.assertEqual([event for event, _ in log].count('trial_start'), 2)
+
+        engine = Engine(network)
+        state = engine.new_state()
+        del log[:]
+        self.assertFalse(engine.solve(state, PATTERNS[0][0]))
+        self.assertEqual([event for event, _ in log].count('trial_start'), 1)
+        self.assertEqual(len(log), 3 * (2 * network.spec.quarter_size + 2) + 3)
+
+        network.hooks.clear()
+        network.hooks.add('trial_end', lambda view: log.append(('solved', view.cycle)))
+        self.assertTrue(engine.solve(state, PATTERNS[0][0]))
+        self.assertEqual(log[-1], ('solved', 4 * network.spec.quarter_size))
+
+    def test_serialization(self):
+        """Networks are copied and pickled without their hooks, metrics and settle cache."""
+        network = build_network()
+        network.hooks.add('cycle_end', lambda view: None)
+        network.metrics = Metrics([SSE()])
+        network.settle_cache = SettleCache()
+        for other in (pickle.loads(pickle.dumps(network)), copy.deepcopy(network), network.clone()):
+            self.assertFalse(other.hooks)
+            self.assertIsNone(other.metrics)
+            self.assertIsNone(other.settle_cache)
+            self.assertEqual(len(other.connections), 2)
+        with SharedWeights(network):
+            pass
+        self.assertTrue(network.hooks.per_cycle)
+        self.assertIsNotNone(network.settle_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import time
 import unittest
 import copy
 
@@ -41,6 +42,50 @@ class LayerTestAPI(unittest.TestCase):
             layer.cycle('minus')
             self.assertEqual(layer.activities, [0.0, 0.25, 0.50, 0.75, 1.0])
 
+    def test_unit_params(self):
+        """Check that the units get their own values of the parameters."""
+        unit_spec = leabra.UnitSpec(act_thr=0.5)
+        layer = leabra.Layer(3, unit_spec=unit_spec)
+        layer.set_unit_params(act_thr=[0.45, 0.5, 0.55], bias=[0.0, 0.1, 0.2])
+        self.assertEqual([u.record.act_thr for u in layer.units], [0.45, 0.5, 0.55])
+        self.assertEqual([u.record.bias for u in layer.units], [0.0, 0.1, 0.2])
+        self.assertTrue(all(u.spec is unit_spec for u in layer.units))  # the spec is still shared
+        self.assertEqual(unit_spec.act_thr, 0.5)                        # ... and not modified
+        self.assertEqual(list(layer.unit_record().act_thr), [0.45, 0.5, 0.55])
+        self.assertEqual(layer.unit_record().thr_e.shape, (3,))  # derived constants
+
+        layer.set_unit_params(g_bar_l=[0.1, 0.2, 0.3])  # the other parameters are kept
+        self.assertEqual([u.record.act_thr for u in layer.units], [0.45, 0.5, 0.55])
+        with self.assertRaises(ValueError):
+            layer.set_unit_params(act_thr=[0.5, 0.5])
+        with self.assertRaises(ValueError):
+            layer.set_unit_params(act_gain=[100, 100, 80])  # the noisy activation table
+        with self.assertRaises(ValueError):
+            layer.set_unit_params(not_a_param=[0, 0, 0])
+        self.assertEqual([u.record.g_bar_l for u in layer.units], [0.1, 0.2, 0.3])
+
+        # modifying the shared spec applies to all the units, keeping their own values
+        record = layer.unit_record()
+        self.assertIs(layer.unit_record(), record)  # cached
+        unit_spec.g_bar_i = 1.1
+        self.assertIsNot(layer.unit_record(), record)
+        self.assertEqual(layer.unit_record().g_bar_i, 1.1)
+        self.assertEqual([u.record.g_bar_i for u in layer.units], [1.1, 1.1, 1.1])
+        self.assertEqual([u.record.act_thr for u in layer.units], [0.45, 0.5, 0.55])
+
+        # modifying other specs does not invalidate the record
+        record = layer.unit_record()
+        leabra.UnitSpec().act_thr = 0.4
+        layer.spec.g_i = 2.0
+        self.assertIs(layer.unit_record(), record)
+
+    def test_unit_params_speed(self):
+        """Per-unit parameters of a large layer are set without a spec per unit."""
+        layer = leabra.Layer(2000)
+        t = time.perf_counter()
+        layer.set_unit_params(act_thr=np.linspace(0.45, 0.55, 2000), bias=np.zeros(2000))
+        layer.unit_record()
+        self.assertLess(time.perf_counter() - t, 0.1)
 
 
 class LayerTestsBehavior(unittest.TestCase):
@@ -0,0 +1,147 @@
+import copy
+import unittest
+import tracemalloc
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra import connection as connection_module
+from leabra.engine import Engine
+from leabra.cache import SettleCache
+from leabra.lesion import sweep
+
+from test_engine import build_network, build_recurrent_network, PATTERNS
+
+
+def settled(network, inputs):
+    network.set_inputs(inputs)
+    network.settle()
+    return np.array([u.act_m for u in network.layers[-1].units])
+
+
+class LesionTestBehavior(unittest.TestCase):
+
+    def test_equivalence(self):
+        """The Engine applies the masks as the Network, and lesioned links do not learn."""
+        network = build_recurrent_network()
+        input_layer, hidden_layer, _ = network.layers
+        input_layer.set_mask([True, True, False, True])
+        hidden_layer.set_mask([True, False, True, True, False])
+        conn = network.connections[0]
+        conn.set_mask(np.random.default_rng(0).random(conn.n_links) < 0.7)
+        ref_network = copy.deepcopy(network)
+        engine = Engine(network)
+        state = engine.new_state()
+        initial_wt = conn.wt.copy()
+
+        for inputs, outputs in 2 * PATTERNS:
+            ref_network.set_inputs(inputs)
+            ref_network.set_outputs(outputs)
+            ref_sse = ref_network.trial()
+            sse = engine.trial(state, inputs, outputs)
+            self.assertTrue(np.allclose(ref_sse, sse, rtol=1e-8, atol=1e-12))
+            for layer, ls in zip(ref_network.layers, state.layers):
+                for name in ['act', 'act_m', 'g_e']:
+                    ref = [getattr(u, name) for u in layer.units]
+                    self.assertTrue(np.allclose(ref, getattr(ls, name)[0], rtol=1e-8, atol=1e-12),
+                                    msg='{} {}'.format(layer.name, name))
+            for ref_conn, other in zip(ref_network.connections, network.connections):
+                self.assertTrue(np.allclose(ref_conn.wt, other.wt, rtol=1e-8, atol=1e-12))
+
+        self.assertTrue(np.all(state.layers[1].act_m[0, ~hidden_layer.mask] == 0.0))
+        frozen = ~conn.mask | ~np.repeat(input_layer.mask, 5) | ~np.tile(hidden_layer.mask, 4)
+        self.assertTrue(np.allclose(conn.wt[frozen], initial_wt[frozen], rtol=0, atol=1e-12))
+        self.assertFalse(np.allclose(conn.wt[~frozen], initial_wt[~frozen], rtol=0, atol=1e-6))
+
+    def test_cut_links(self):
+        """Cut links transmit as zero weights, and removing the mask restores them."""
+        network = build_network()
+        intact = copy.deepcopy(network)
+        zeroed = copy.deepcopy(network)
+        conn = network.connections[1]
+        mask = np.arange(conn.n_links) % 3 != 0
+        conn.set_mask(mask)
+        zeroed.connections[1].weights = np.where(mask, conn.wt, 0.0).reshape(5, 2)
+        for inputs, _ in PATTERNS:
+            self.assertTrue(np.allclose(settled(network, inputs), settled(zeroed, inputs),
+                                        rtol=1e-10, atol=1e-12))
+
+        array = conn.mask
+        conn.set_mask(np.ones(conn.n_links, dtype=bool))
+        self.assertIs(conn.mask, array)  # toggled in place
+        engine, intact_engine = Engine(network), Engine(intact)
+        state, intact_state = engine.new_state(), intact_engine.new_state()
+        for inputs, _ in PATTERNS:
+            engine.settle(state, inputs)
+            intact_engine.settle(intact_state, inputs)
+            self.assertTrue(np.allclose(state.layers[2].act_m, intact_state.layers[2].act_m,
+                                        rtol=1e-10, atol=1e-12))
+        conn.set_mask(None)
+        self.assertIsNone(conn.mask)
+
+    def test_batched_link_mask(self):
+        """Batched link masks are applied by chunks, without allocating the masked weights at once."""
+        pre, post = leabra.Layer(200), leabra.Layer(200)
+        rng = np.random.default_rng(0)
+        pruned = leabra.Connection(pre, post, rng=rng)
+        pruned.prune(threshold=0.5)
+        for conn in [leabra.Connection(pre, post, rng=rng), pruned]:
+            masks = rng.random((64, conn.n_links)) < 0.5
+            pre_act = rng.random((64, 200))
+            conn.set_mask(masks)
+            unchunked = conn.spec.net_input(conn, pre_act)
+            chunk, connection_module.MASK_CHUNK = connection_module.MASK_CHUNK, 2 * conn.n_links
+            try:
+                tracemalloc.start()
+                net = conn.spec.net_input(conn, pre_act)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            finally:
+                connection_module.MASK_CHUNK = chunk
+            self.assertLess(peak, masks.size * 8 / 4)  # the masked weights of the batch: 8 bytes per link
+            self.assertTrue(np.allclose(net, unchunked, rtol=1e-10, atol=1e-12))
+            for k in [0, 17, 63]:
+                conn.set_mask(masks[k])
+                self.assertTrue(np.allclose(net[k], conn.spec.net_input(conn, pre_act[k]), rtol=1e-10, atol=1e-12))
+                conn.set_mask(masks)
+
+    def test_cache(self):
+        """Modifying a mask invalidates the settle cache."""
+        network = build_network()
+        network.settle_cache = SettleCache()
+        inputs = PATTERNS[0][0]
+        settled(network, inputs)
+        network.layers[1].set_mask([True] * 5)
+        settled(network, inputs)
+        network.layers[1].mask[2] = False
+        settled(network, inputs)
+        self.assertEqual(network.settle_cache.misses, 3)
+
+    def test_sweep(self):
+        """A sweep settles each lesion as a separate simulation."""
+        network = build_recurrent_network()
+        conn = network.connections[0]
+        rng = np.random.default_rng(1)
+        lesions = [{'hidden_layer': rng.random(5) < 0.6} for _ in range(4)]
+        lesions.append({conn: rng.random(conn.n_links) < 0.5})
+        lesions.append({'hidden_layer': [True, True, False, True, True], conn: rng.random(conn.n_links) < 0.5})
+        inputs = [inp for inp, _ in PATTERNS]
+        acts = sweep(network, lesions, inputs, batch_size=4)
+        self.assertEqual(acts['output_layer'].shape, (6, 3, 2))
+        self.assertIsNone(network.layers[1].mask)
+        self.assertIsNone(conn.mask)
+
+        for k, lesion in enumerate(lesions):
+            network.layers[1].set_mask(lesion.get('hidden_layer'))
+            conn.set_mask(lesion.get(conn))
+            engine = Engine(network)
+            state = engine.new_state()
+            for p, pattern in enumerate(inputs):
+                engine.settle(state, pattern)
+                for ls in state.layers:
+                    self.assertTrue(np.allclose(ls.act_m[0], acts[ls.name][k, p], rtol=1e-10, atol=1e-12))
+
+
+if __name__ == '__main__':
+    unittest.main()
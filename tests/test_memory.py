@@ -0,0 +1,91 @@
+import sys
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra.memory import estimate_memory, deep_getsizeof, CATEGORIES
+
+from test_engine import build_network, PATTERNS
+
+
+ARCHITECTURE = ([('input_layer', 4), ('hidden_layer', 5), ('output_layer', 2)],
+                [('input_layer', 'hidden_layer', 'full'), ('hidden_layer', 'output_layer', 'full')])
+
+
+class MemoryTestBehavior(unittest.TestCase):
+
+    def test_report(self):
+        network = build_network()
+        report = network.memory_report()
+        self.assertEqual(list(report.by_owner()),
+                         ['layer input_layer', 'layer hidden_layer', 'layer output_layer',
+                          'connection input_layer->hidden_layer', 'connection hidden_layer->output_layer'])
+        self.assertEqual(report.total('weights'), 8 * (4*5 + 5*2))
+        self.assertEqual(report.total('learning'), 16 * (4*5 + 5*2))
+        self.assertEqual(report.total('indexes'), 0)
+        self.assertEqual(report.total(), sum(report.by_category().values()))
+        self.assertIn('total', str(report))
+
+        # logs and link views are accounted as they grow
+        logs = report.total('logs')
+        network.set_inputs(PATTERNS[0][0])
+        network.cycle()
+        network.connections[0].links
+        report = network.memory_report()
+        self.assertGreater(report.total('logs'), logs)
+        self.assertGreater(report.total('caches', owner='connection input_layer->hidden_layer'), 0)
+        self.assertEqual(report.total('caches', owner='connection hidden_layer->output_layer'), 0)
+
+    def test_sparse(self):
+        layer0, layer1 = leabra.Layer(3, name='a'), leabra.Layer(3, name='b')
+        conn = leabra.Connection(layer0, layer1, spec=leabra.ConnectionSpec(proj='1to1'))
+        network = leabra.Network(layers=[layer0, layer1], connections=[conn])
+        report = network.memory_report()
+        self.assertEqual(report.total('indexes'), conn.pre_idx.nbytes + conn.post_idx.nbytes)
+        estimate = estimate_memory([('a', 3), ('b', 3)], [('a', 'b', '1to1')])
+        self.assertEqual(estimate.total('indexes'), report.total('indexes'))
+
+    def test_estimate(self):
+        """Check that the estimator predicts the measured footprint."""
+        network = build_network()
+        network.set_inputs(PATTERNS[0][0])
+        for _ in range(10):
+            network.cycle()
+
+        report = network.memory_report()
+        estimate = estimate_memory(*ARCHITECTURE, logged_cycles=10, total_cycles=10)
+        self.assertEqual(list(estimate.by_owner()), list(report.by_owner()))
+        for category in ('weights', 'learning', 'indexes'):
+            self.assertEqual(estimate.total(category), report.total(category))
+        for category in ('unit_state', 'logs', 'caches'):
+            self.assertAlmostEqual(estimate.total(category) / report.total(category), 1.0, delta=0.15,
+                                   msg=category)
+
+        network.connections[1].links
+        report = network.memory_report()
+        estimate = estimate_memory(*ARCHITECTURE, link_views=True)
+        self.assertAlmostEqual(estimate.total('caches', owner='connection hidden_layer->output_layer')
+                               / report.total('caches', owner='connection hidden_layer->output_layer'),
+                               1.0, delta=0.25)
+
+    def test_deep_getsizeof(self):
+        shared = [0.5] * 100
+        seen = set()
+        size = deep_getsizeof({'a': shared}, seen)
+        self.assertGreater(size, deep_getsizeof(shared))
+        self.assertEqual(deep_getsizeof(shared, seen), 0)
+
+        # numpy views count their header, and their base once
+        array = np.zeros(1000)
+        views = [array[:500], array[500:].reshape(10, 50)]
+        header = deep_getsizeof(views[0], {id(array)})
+        self.assertLess(header, array.nbytes)
+        self.assertGreaterEqual(deep_getsizeof(views[0]), array.nbytes + header)
+        self.assertEqual(deep_getsizeof(views),
+                         sys.getsizeof(views) + sys.getsizeof(array) + sum(sys.getsizeof(view) for view in views))
+
+
+if __name__ == '__main__':
+    unittest.main()
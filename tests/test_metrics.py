@@ -0,0 +1,154 @@
+import copy
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+from leabra.engine import Engine
+from leabra.metrics import (Metrics, RunningStats, SSE, CosDiff, AvgAct,
+                            SettleCycles, WeightChange)
+
+from test_engine import build_network, PATTERNS
+
+
+def all_metrics():
+    return Metrics([SSE(), CosDiff(), AvgAct(), SettleCycles(), WeightChange()])
+
+
+class MetricsTestBehavior(unittest.TestCase):
+
+    def test_running_stats(self):
+        values = np.random.default_rng(0).random(20)
+        stats = RunningStats()
+        stats.add(values[:7])
+        stats.add(values[7:])
+        summary = stats.summary()
+        self.assertEqual(summary['n'], 20)
+        self.assertAlmostEqual(summary['mean'], np.mean(values))
+        self.assertAlmostEqual(summary['std'], np.std(values))
+        self.assertEqual(summary['min'], np.min(values))
+        self.assertEqual(summary['max'], np.max(values))
+        stats.add([])
+        stats.add(2.0)
+        self.assertEqual(stats.n, 21)
+        self.assertAlmostEqual(stats.std, np.std(np.append(values, 2.0)))
+
+    def test_missing_targets(self):
+        """Layers listed without a target are skipped, and settling has no targets."""
+        network = build_network()
+        network.metrics = Metrics([SSE(layers=['hidden_layer', 'output_layer']), CosDiff(layers=['hidden_layer'])])
+        network.set_inputs(PATTERNS[0][0])
+        network.set_outputs(PATTERNS[0][1])
+        sse = network.trial()
+        self.assertAlmostEqual(network.metrics.last['sse'][0], sse)
+        self.assertNotIn('cos_diff', network.metrics.last)
+
+        # the targets of the previous trial are not compared to the settled activities
+        network.metrics = Metrics([SSE(), CosDiff(), AvgAct()])
+        network.set_inputs(PATTERNS[1][0])
+        network.settle()
+        self.assertEqual(set(network.metrics.last), {'avg_act/input_layer', 'avg_act/hidden_layer',
+                                                     'avg_act/output_layer'})
+
+        engine = Engine(build_network())
+        state = engine.new_state()
+        state.metrics = Metrics([SSE(), CosDiff()])
+        engine.trial(state, *PATTERNS[0])
+        engine.settle(state, PATTERNS[1][0])
+        self.assertEqual(state.metrics.last, {})
+        engine.solve(state, PATTERNS[1][0])  # or its fallback settle
+        self.assertEqual(state.metrics.last, {})
+        self.assertEqual(state.metrics.epoch_stats()['sse']['n'], 1)
+
+    def test_masked_avg_act(self):
+        """The silenced units are left out of the average activity."""
+        network = build_network()
+        engine = Engine(copy.deepcopy(network))
+        mask = np.array([True, False, True, True, False])
+        for net in (network, engine.network):
+            net._get_layer('hidden_layer').set_mask(mask)
+        network.metrics = Metrics([AvgAct()])
+        network.set_inputs(PATTERNS[0][0])
+        network.settle()
+        act_m = np.array([u.act_m for u in network._get_layer('hidden_layer').units])
+        self.assertAlmostEqual(network.metrics.last['avg_act/hidden_layer'][0], np.mean(act_m[mask]))
+
+        state = engine.new_state()
+        state.metrics = Metrics([AvgAct()])
+        engine.settle(state, PATTERNS[0][0])
+        self.assertAlmostEqual(state.metrics.last['avg_act/hidden_layer'][0],
+                               np.mean(state.layer('hidden_layer').act_m[0][mask]))
+
+    def test_network(self):
+        """Check the metrics of a Network's trials against their direct computation."""
+        network = build_network()
+        network.metrics = metrics = all_metrics()
+        sses, wt_changes = [], []
+        for inputs, outputs in PATTERNS:
+            network.set_inputs(inputs)
+            network.set_outputs(outputs)
+            wts = [conn.wt.copy() for conn in network.connections]
+            sses.append(network.trial())
+            wt_changes.append(np.sqrt(sum(np.sum((conn.wt - wt)**2)
+                                          for conn, wt in zip(network.connections, wts))))
+            self.assertAlmostEqual(metrics.last['sse'][0], sses[-1])
+            act_m = np.array([u.act_m for u in network._get_layer('output_layer').units])
+            self.assertAlmostEqual(metrics.last['cos_diff'][0],
+                                   np.dot(act_m, outputs['output_layer'])
+                                   / np.linalg.norm(act_m) / np.linalg.norm(outputs['output_layer']))
+            self.assertAlmostEqual(metrics.last['avg_act/output_layer'][0], np.mean(act_m))
+            self.assertTrue(0 < metrics.last['settle_cycles'][0] <= 3 * network.spec.quarter_size)
+
+        epoch = metrics.end_epoch()
+        self.assertEqual(epoch['sse']['n'], len(PATTERNS))
+        self.assertAlmostEqual(epoch['sse']['mean'], np.mean(sses))
+        self.assertAlmostEqual(epoch['wt_change']['max'], np.max(wt_changes))
+        self.assertEqual(metrics.epoch_stats(), {})
+        self.assertEqual(metrics.history, [epoch])
+
+        # inference: no weight change, no targets
+        network.settle()
+        self.assertEqual(metrics.last['wt_change'][0], 0.0)
+        self.assertNotIn('sse', metrics.epoch_stats())
+
+    def test_engine(self):
+        """Check that the engine's metrics match the Network's, for a batched state."""
+        network = build_network()
+        engine_network = copy.deepcopy(network)
+        network.metrics = all_metrics()
+        for inputs, outputs in PATTERNS:
+            network.set_inputs(inputs)
+            network.set_outputs(outputs)
+            network.trial()
+        ref = network.metrics.end_epoch()
+
+        engine = Engine(engine_network)
+        state = engine.new_state()
+        state.metrics = all_metrics()
+        for inputs, outputs in PATTERNS:
+            engine.trial(state, inputs, outputs)
+        epoch = state.metrics.end_epoch()
+        self.assertEqual(set(epoch), set(ref))
+        for name in ref:
+            for key in ('mean', 'min', 'max'):
+                self.assertAlmostEqual(epoch[name][key], ref[name][key], places=10)
+
+        # batch: one value per batch element
+        state = engine.new_state(batch=len(PATTERNS))
+        state.metrics = all_metrics()
+        engine.settle(state, {'input_layer': np.array([inputs['input_layer'] for inputs, _ in PATTERNS])})
+        self.assertEqual(state.metrics.last['settle_cycles'].shape, (len(PATTERNS),))
+        self.assertEqual(state.metrics.epoch_stats()['avg_act/hidden_layer']['n'], len(PATTERNS))
+
+    def test_snapshot(self):
+        """Metrics are not part of the snapshots."""
+        engine = Engine(build_network())
+        state = engine.new_state()
+        state.metrics = all_metrics()
+        self.assertIsNone(state.copy().metrics)
+        state.restore(engine.new_state())
+        self.assertIsNotNone(state.metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
-import unittest
 import os
+import copy
+import unittest
 
 import numpy as np
 
@@ -33,6 +34,68 @@ class NetworkTestAPI(unittest.TestCase):
 
         self.assertTrue(True)
 
+    def test_clone(self):
+        """Clones share the weights until they learn, and train as deep copies do."""
+        input_layer  = leabra.Layer(4, name='input_layer')
+        output_layer = leabra.Layer(2, name='output_layer')
+        conspec = leabra.ConnectionSpec(proj='full', lrule='leabra')
+        fixed   = leabra.ConnectionSpec(proj='1to1', lrule=None)
+        conns = [leabra.Connection(input_layer, output_layer, spec=conspec),
+                 leabra.Connection(output_layer, output_layer, spec=fixed)]
+        network = leabra.Network(layers=[input_layer, output_layer], connections=conns)
+        network.set_inputs({'input_layer': [1.0, 1.0, 0.0, 0.0]})
+        network.set_outputs({'output_layer': [1.0, 0.0]})
+        network.trial()
+
+        ref = copy.deepcopy(network)
+        weights = network.connections[0].weights
+        clone = network.clone()
+        self.assertIs(clone.connections[0].wt, network.connections[0].wt)
+        self.assertIs(clone.layers[1].spec, network.layers[1].spec)
+        self.assertIsNot(clone.layers[1].units[0], network.layers[1].units[0])
+        self.assertIs(clone.connections[0].pre, clone.layers[0])
+        with self.assertRaises(ValueError):
+            clone.connections[0].wt[0] = 0.0  # shared weights are read-only
+
+        for _ in range(3):
+            self.assertEqual(clone.trial(), ref.trial())
+        self.assertTrue(np.array_equal(clone.connections[0].wt, ref.connections[0].wt))
+        self.assertIsNot(clone.connections[0].wt, network.connections[0].wt)
+        self.assertIs(clone.connections[1].wt, network.connections[1].wt)  # not learning
+        self.assertTrue(np.array_equal(network.connections[0].weights, weights))
+
+        network.connections[1].weights = [[0.5, 0.5]]
+        self.assertFalse(np.array_equal(clone.connections[1].wt, network.connections[1].wt))
+
+    def test_small_batch(self):
+        """Weight changes are accumulated over `small_batch_n` trials before being applied."""
+        input_layer  = leabra.Layer(4, name='input_layer')
+        output_layer = leabra.Layer(2, name='output_layer')
+        conn = leabra.Connection(input_layer, output_layer,
+                                 spec=leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.1))
+        network = leabra.Network(spec=leabra.NetworkSpec(small_batch_n=3),
+                                 layers=[input_layer, output_layer], connections=[conn])
+        network.set_inputs({'input_layer': [1.0, 1.0, 0.0, 0.0]})
+        network.set_outputs({'output_layer': [1.0, 0.0]})
+        wt, version = conn.wt.copy(), conn.version
+        for _ in range(2):
+            network.trial()
+        self.assertTrue(np.array_equal(conn.wt, wt))
+        self.assertEqual((conn.version, network.n_dwt_trials), (version, 2))
+        self.assertTrue(np.any(conn.dwt != 0.0))
+
+        network.trial()
+        self.assertFalse(np.array_equal(conn.wt, wt))
+        self.assertTrue(np.all(conn.dwt == 0.0))
+        self.assertEqual(network.n_dwt_trials, 0)
+
+        network.trial()
+        wt = conn.wt.copy()
+        network.update_weights()  # applying the changes of an incomplete batch
+        self.assertFalse(np.array_equal(conn.wt, wt))
+        self.assertTrue(np.all(conn.dwt == 0.0))
+        self.assertEqual(network.n_dwt_trials, 0)
+
 
 class NetworkTestBehavior(unittest.TestCase):
     """Check that the Network behaves as it should.
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra.engine import Engine
+from leabra.neuromod import Neuromodulation
+
+from test_engine import build_network, PATTERNS
+
+
+def settled_acts(engine, inputs, batch=1):
+    state = engine.new_state(batch=batch)
+    engine.settle(state, inputs)
+    return state.layer('hidden_layer').act_m
+
+
+class NeuromodTestBehavior(unittest.TestCase):
+
+    def test_neutral(self):
+        """Check that no modulation reproduces the unmodulated simulation."""
+        network = build_network()
+        ref = settled_acts(Engine(network), PATTERNS[0][0])
+
+        neuromod = Neuromodulation()
+        self.assertTrue(np.array_equal(ref, settled_acts(Engine(network, neuromod), PATTERNS[0][0])))
+        # receptors without neuromodulators: act_thr = logistic(c_act_thr) = 0.5
+        neuromod.set_density('hidden_layer', 'D1', np.ones(5))
+        neuromod.set_density('hidden_layer', 'A2', 0.5)
+        self.assertTrue(np.allclose(ref, settled_acts(Engine(network, neuromod), PATTERNS[0][0]),
+                                    rtol=1e-12, atol=1e-15))
+
+    def test_act_thr(self):
+        unit_spec = leabra.UnitSpec(c_act_thr=0.1)
+        neuromod = Neuromodulation(affinities={'D1': 2.0})
+        neuromod.set_density('layer', 'D1', [0.0, 1.0])
+        neuromod.set_density('layer', 'A1', [1.0, 0.5])
+        neuromod.set_concentration('dopamine', 2.0)
+        neuromod.set_concentration('adenosine', 1.0)
+        occupancies = neuromod.occupancies(None, 0)
+        act_thr = neuromod.act_thr('layer', unit_spec, occupancies)
+        drive = 0.1 - np.array([0.0, 1.0]) * 0.5 + np.array([1.0, 0.5]) * 0.5
+        self.assertTrue(np.allclose(act_thr, 1/(1 + np.exp(-drive))))
+        self.assertEqual(neuromod.act_thr('other_layer', unit_spec, occupancies), unit_spec.act_thr)
+
+    def test_modulation(self):
+        """Check that dopamine excites through D1, and inhibits through D2."""
+        network = build_network()
+        ref = settled_acts(Engine(network), PATTERNS[0][0])
+        for receptor, sign in [('D1', 1), ('D2', -1)]:
+            neuromod = Neuromodulation()
+            neuromod.set_density('hidden_layer', receptor, 0.2)
+            neuromod.set_concentration('dopamine', 1.0)
+            acts = settled_acts(Engine(network, neuromod), PATTERNS[0][0])
+            self.assertGreater(sign * (np.sum(acts) - np.sum(ref)), 0)
+
+    def test_signals(self):
+        """Check schedules, callbacks and per-batch concentrations."""
+        network = build_network()
+        neuromod = Neuromodulation()
+        neuromod.set_density('hidden_layer', 'D1', 0.5)
+        engine = Engine(network, neuromod)
+
+        calls = []
+        def signal(state, t):
+            calls.append(t)
+            return 0.0 if t < 50 else 1.0
+        neuromod.set_concentration('dopamine', signal)
+        acts = settled_acts(engine, PATTERNS[0][0])
+        self.assertEqual(calls, list(range(75)))
+        neuromod.set_concentration('dopamine', [0.0] * 50 + [1.0])
+        self.assertTrue(np.array_equal(acts, settled_acts(engine, PATTERNS[0][0])))
+
+        neuromod.set_concentration('dopamine', lambda state, t: np.array([0.0, 1.0]))
+        batch_acts = settled_acts(engine, PATTERNS[0][0], batch=2)
+        neuromod.set_concentration('dopamine', 0.0)
+        self.assertTrue(np.allclose(batch_acts[0], settled_acts(engine, PATTERNS[0][0])[0]))
+        neuromod.set_concentration('dopamine', 1.0)
+        self.assertTrue(np.allclose(batch_acts[1], settled_acts(engine, PATTERNS[0][0])[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import signal
+import unittest
+import copy
+import multiprocessing
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra import parallel
+
+
+def build_network():
+    unit_spec = leabra.UnitSpec(adapt_on=False, noisy_act=True)
+    layer_spec = leabra.LayerSpec(lay_inhib=True, g_i=1.8, ff=1, fb=1)
+    conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04,
+                                      rnd_mean=0.5, rnd_var=0.25)
+    input_layer  = leabra.Layer(4, spec=layer_spec, unit_spec=unit_spec, genre=leabra.INPUT, name='input_layer')
+    hidden_layer = leabra.Layer(4, spec=layer_spec, unit_spec=unit_spec, genre=leabra.HIDDEN, name='hidden_layer')
+    output_layer = leabra.Layer(2, spec=layer_spec, unit_spec=unit_spec, genre=leabra.OUTPUT, name='output_layer')
+    conn0 = leabra.Connection(input_layer, hidden_layer, spec=conn_spec)
+    conn1 = leabra.Connection(hidden_layer, output_layer, spec=conn_spec)
+    return leabra.Network(layers=[input_layer, hidden_layer, output_layer],
+                          connections=[conn0, conn1])
+
+PATTERNS = [({'input_layer': [1.0, 0.0, 0.0, 0.0]}, {'output_layer': [1.0, 0.0]}),
+            ({'input_layer': [0.0, 1.0, 0.0, 0.0]}, {'output_layer': [1.0, 0.0]}),
+            ({'input_layer': [0.0, 0.0, 1.0, 0.0]}, {'output_layer': [0.0, 1.0]}),
+            ({'input_layer': [0.0, 0.0, 0.0, 1.0]}, {'output_layer': [0.0, 1.0]})]
+
+
+class KillingInputs(dict):
+    """Inputs killing the process that reads them, as a signal would."""
+
+    def items(self):
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+class ParallelTestAPI(unittest.TestCase):
+
+    def test_params_roundtrip(self):
+        """Check that get_params and set_params are inverse of each other."""
+        network = build_network()
+        params = parallel.get_params(network)
+        self.assertEqual(len(params), 4*4 + 4*2 + 4 + 4 + 2)
+        parallel.set_params(network, params)
+        self.assertTrue(np.allclose(parallel.get_params(network), params, rtol=0, atol=1e-12))
+
+    def test_merge(self):
+        """Check the weight changes are averaged or summed, and avg_l always averaged."""
+        base = np.array([0.5, 0.5, 0.4])
+        deltas = np.array([[0.1, 0.0, 0.2], [0.1, -0.2, 0.0]])
+        self.assertTrue(np.allclose(parallel.merge_params(base, deltas, 2, merge='average'),
+                                    [0.6, 0.4, 0.5]))
+        self.assertTrue(np.allclose(parallel.merge_params(base, deltas, 2, merge='sum'),
+                                    [0.7, 0.3, 0.5]))
+
+    def test_merge_range(self):
+        """Summed weight changes are clipped to the range of `fwt`."""
+        base = np.array([0.9, 0.1, 0.4])
+        deltas = np.array([[0.1, -0.1, 0.2], [0.1, -0.1, 0.0]])
+        self.assertTrue(np.allclose(parallel.merge_params(base, deltas, 2, merge='sum'),
+                                    [1.0, 0.0, 0.5]))
+
+
+class ParallelTestBehavior(unittest.TestCase):
+
+    def test_single_worker(self):
+        """With one worker, parallel training is identical to sequential training."""
+        network = build_network()
+        orders = parallel.epoch_orders(len(PATTERNS), 2, seed=1)
+
+        seq_network = copy.deepcopy(network)
+        seq_curve = parallel.train_sequential(seq_network, PATTERNS, orders)
+
+        trainer = parallel.ParallelTrainer(network, n_workers=1, sync_interval=3)
+        curve = trainer.train(PATTERNS, orders=orders)
+
+        self.assertTrue(np.array_equal(seq_curve, curve))
+        self.assertTrue(np.array_equal(parallel.get_params(seq_network),
+                                       parallel.get_params(network)))
+        self.assertEqual(network.trial_count, 8)
+
+    def test_single_worker_small_batch(self):
+        """With one worker, the pending small batch weight changes are applied at the end."""
+        network = build_network()
+        network.spec.small_batch_n = 4
+        orders = [np.array([0, 2, 1])]
+
+        seq_network = copy.deepcopy(network)
+        parallel.train_sequential(seq_network, PATTERNS, orders)
+        self.assertEqual(seq_network.n_dwt_trials, 3)
+        seq_network.update_weights()
+
+        parallel.ParallelTrainer(network, n_workers=1, sync_interval=3).train(PATTERNS, orders=orders)
+        self.assertTrue(np.array_equal(parallel.get_params(seq_network),
+                                       parallel.get_params(network)))
+
+    def test_workers(self):
+        """Check that training with several workers changes the weights and reports the SSE."""
+        for merge in parallel.MERGE_MODES:
+            network = build_network()
+            params_before = parallel.get_params(network)
+            trainer = parallel.ParallelTrainer(network, n_workers=2, sync_interval=1, merge=merge)
+            curve = trainer.train(PATTERNS, n_epochs=2)
+            self.assertEqual(len(curve), 2)
+            self.assertTrue(np.all(np.isfinite(curve)))
+            self.assertFalse(np.allclose(params_before, parallel.get_params(network)))
+            self.assertTrue(trainer.trials_per_sec > 0)
+
+    def test_killed_worker(self):
+        """A worker killed by a signal makes `train()` fail instead of hanging."""
+        patterns = PATTERNS + [(KillingInputs(PATTERNS[0][0]), PATTERNS[0][1])]
+        trainer = parallel.ParallelTrainer(build_network(), n_workers=2, shuffle=False,
+                                           context=multiprocessing.get_context('fork'),
+                                           poll_interval=0.1)
+        with self.assertRaises(RuntimeError):
+            trainer.train(patterns, n_epochs=1)
+
+    def test_scaling_report(self):
+        report = parallel.scaling_report(build_network(), PATTERNS, n_epochs=1, workers=(1, 2))
+        self.assertEqual([r['workers'] for r in report], [0, 1, 2])
+        self.assertEqual(report[1]['sse_diff'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
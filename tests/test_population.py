@@ -0,0 +1,102 @@
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+from leabra.engine import Engine
+from leabra.population import PopulationEngine
+
+from test_engine import build_network, PATTERNS
+
+
+class PopulationTestBehavior(unittest.TestCase):
+
+    def test_members(self):
+        """Each member reproduces the simulation of a network with its parameters."""
+        network = build_network()
+        params = {'hidden_layer':         {'g_i': [1.5, 1.8, 2.2], 'act_thr': [0.45, 0.5, 0.55],
+                                           'avg_l_gain': [2.0, 2.5, 3.0]},
+                  'output_layer':         {'fb': [0.5, 1.0, 0.2]},
+                  network.connections[0]: {'lrate': [0.01, 0.04, 0.08]}}
+        population = PopulationEngine(network, 3, params)
+        members = [population.member_network(k) for k in range(3)]
+        self.assertEqual(members[2].layers[1].spec.g_i, 2.2)
+        self.assertEqual(members[2].layers[0].units[0].spec.act_thr, 0.5)  # spec shared by the layers
+        self.assertEqual(network.layers[1].spec.g_i, 1.8)
+
+        state = population.new_state()
+        for inputs, outputs in 3 * PATTERNS:
+            sses = population.trial(state, inputs, outputs)
+        for k, member in enumerate(members):
+            engine = Engine(member)
+            member_state = engine.new_state()
+            for inputs, outputs in 3 * PATTERNS:
+                sse = engine.trial(member_state, inputs, outputs)
+            self.assertEqual(sses[k], sse[0])
+            for ls, member_ls in zip(state.layers, member_state.layers):
+                self.assertTrue(np.array_equal(ls.act_m[k], member_ls.act_m[0]))
+            for conn, links in zip(member.connections, population.links):
+                self.assertTrue(np.array_equal(conn.wt, links.wt[k]))
+        self.assertFalse(np.array_equal(population.links[0].wt[0], population.links[0].wt[2]))
+
+    def test_small_batch(self):
+        """Each member accumulates its weight changes over `small_batch_n` trials."""
+        network = build_network()
+        network.spec.small_batch_n = 2
+        population = PopulationEngine(network, 2, {network.connections[0]: {'lrate': [0.01, 0.08]}})
+        members = [population.member_network(k) for k in range(2)]
+        state = population.new_state()
+        for inputs, outputs in PATTERNS:
+            population.trial(state, inputs, outputs)
+        self.assertEqual(population.n_dwt_trials, 1)
+        for k, member in enumerate(members):
+            engine = Engine(member)
+            member_state = engine.new_state()
+            for inputs, outputs in PATTERNS:
+                engine.trial(member_state, inputs, outputs)
+            for conn, links in zip(member.connections, population.links):
+                self.assertTrue(np.array_equal(conn.wt, links.wt[k]))
+                self.assertTrue(np.array_equal(conn.dwt, links.dwt[k]))
+
+    def test_spec_changes(self):
+        """Modifying a shared spec parameter applies to all members."""
+        network = build_network()
+        population = PopulationEngine(network, 2, {'hidden_layer': {'g_i': [1.5, 2.0]}})
+        self.assertTrue(np.array_equal(population.layer_specs[1].g_i, [1.5, 2.0]))
+        network.layers[1].spec.fb = 0.5
+        self.assertEqual(population.layer_specs[1].fb, 0.5)
+        self.assertTrue(np.array_equal(population.layer_specs[1].g_i, [1.5, 2.0]))
+
+    def test_unit_params(self):
+        """Units with their own parameters keep them in all the members."""
+        network = build_network()
+        network.layers[1].set_unit_params(act_thr=np.linspace(0.45, 0.55, 5))
+        population = PopulationEngine(network, 2, {'hidden_layer': {'g_i': [1.5, 2.0]},
+                                                   'output_layer': {'act_thr': [0.45, 0.55]}})
+        self.assertEqual(population.unit_specs[1].act_thr.shape, (5,))
+        state = population.new_state()
+        for inputs, outputs in PATTERNS:
+            sses = population.trial(state, inputs, outputs, learn=False)
+        for k in range(2):
+            engine = Engine(population.member_network(k))
+            member_state = engine.new_state()
+            for inputs, outputs in PATTERNS:
+                sse = engine.trial(member_state, inputs, outputs, learn=False)
+            self.assertEqual(sses[k], sse[0])
+        with self.assertRaises(ValueError):
+            PopulationEngine(network, 2, {'hidden_layer': {'act_thr': [0.45, 0.55]}})
+
+    def test_invalid(self):
+        network = build_network()
+        with self.assertRaises(ValueError):
+            PopulationEngine(network, 2, {'hidden_layer': {'g_i': [1.5, 2.0, 2.5]}})
+        with self.assertRaises(ValueError):
+            PopulationEngine(network, 2, {'hidden_layer': {'avg_act_targ_init': [0.1, 0.2]}})
+        with self.assertRaises(ValueError):
+            PopulationEngine(network, 2, {network.connections[0]: {'rnd_mean': [0.4, 0.5]}})
+        with self.assertRaises(ValueError):  # the noisy activation function table
+            PopulationEngine(network, 2, {'hidden_layer': {'act_sd': [0.01, 0.02]}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import copy
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra.engine import Engine
+from leabra.training import Trainer
+from leabra.pruning import prune, Pruner
+
+from test_engine import build_network, build_recurrent_network, PATTERNS
+
+
+def settled(network, inputs):
+    network.set_inputs(inputs)
+    network.settle()
+    return np.array([u.act_m for u in network.layers[-1].units])
+
+
+
+class PruningTestBehavior(unittest.TestCase):
+
+    def test_threshold(self):
+        """Pruned links behave as zero weights."""
+        network = build_network()
+        ref_network = copy.deepcopy(network)
+        conn, ref_conn = network.connections[0], ref_network.connections[0]
+        n_weak = int(np.sum(conn.wt < 0.5))
+        self.assertEqual(conn.prune(threshold=0.5), n_weak)
+        self.assertFalse(conn.dense)
+        self.assertEqual(conn.n_links, 20 - n_weak)
+        self.assertTrue(np.all(conn.wt >= 0.5))
+        ref_conn.weights = np.where(ref_conn.weights < 0.5, 0.0, ref_conn.weights)
+        self.assertTrue(np.array_equal(conn.weights, ref_conn.weights))
+        self.assertEqual(conn.prune(threshold=0.5), 0)
+
+        for inputs, _ in 2 * PATTERNS:
+            self.assertTrue(np.allclose(settled(network, inputs), settled(ref_network, inputs),
+                                        rtol=1e-10, atol=1e-12))
+
+        # learning on the remaining links
+        network.set_outputs(PATTERNS[0][1])
+        network.trial()
+        self.assertEqual(conn.n_links, 20 - n_weak)
+        self.assertTrue(np.all(conn.weights[ref_conn.weights == 0.0] == 0.0))
+
+    def test_pending_changes(self):
+        """The pending weight changes of the kept links survive the pruning."""
+        network = build_network()
+        network.spec.small_batch_n = 4
+        for inputs, outputs in PATTERNS[:2]:
+            network.set_inputs(inputs)
+            network.set_outputs(outputs)
+            network.trial()
+        conn = network.connections[0]
+        self.assertGreater(np.sum(np.abs(conn.dwt)), 0.0)
+        ref_network = copy.deepcopy(network)
+        conn.prune(threshold=np.median(conn.wt))
+        self.assertEqual(network.n_dwt_trials, 2)
+
+        network.update_weights()
+        ref_network.update_weights()
+        ref_weights = ref_network.connections[0].weights
+        self.assertTrue(np.allclose(conn.wt, ref_weights[conn.pre_idx, conn.post_idx],
+                                    rtol=1e-12, atol=1e-15))
+
+    def test_top_k(self):
+        network = build_recurrent_network()
+        conn = network.connections[0]  # input (4) to hidden (5)
+        weights = conn.weights
+        self.assertEqual(conn.prune(top_k=2), 10)
+        for post in range(5):
+            kept = conn.pre_idx[conn.post_idx == post]
+            self.assertEqual(sorted(kept), sorted(np.argsort(-weights[:, post])[:2]))
+        network.connections[3].prune(top_k=1)  # 1to1: nothing to remove
+        self.assertEqual(network.connections[3].n_pruned, 0)
+
+        # the engine simulates pruned connections as the network
+        ref_network = copy.deepcopy(network)
+        engine = Engine(network)
+        state = engine.new_state()
+        for inputs, outputs in PATTERNS:
+            ref_network.set_inputs(inputs)
+            ref_network.set_outputs(outputs)
+            self.assertTrue(np.allclose(engine.trial(state, inputs, outputs), ref_network.trial(),
+                                        rtol=1e-8, atol=1e-12))
+
+    def test_sparse_matrix(self):
+        """A heavily pruned connection transmits as its dense form, through a cached sparse matrix."""
+        pre, post = leabra.Layer(1000), leabra.Layer(1000)
+        conn = leabra.Connection(pre, post, rng=np.random.default_rng(0))
+        dense = copy.deepcopy(conn)
+        self.assertEqual(conn.prune(top_k=20), 1000 * 980)
+        self.assertEqual(conn.n_links, 1000 * 20)
+        self.assertTrue(np.array_equal(np.bincount(conn.post_idx), np.full(1000, 20)))
+        dense.weights = conn.weights
+        for shape in [(1000,), (32, 1000)]:
+            pre_act = np.random.default_rng(1).random(shape)
+            self.assertTrue(np.allclose(conn.spec.net_input(conn, pre_act),
+                                        dense.spec.net_input(dense, pre_act), rtol=1e-10, atol=1e-12))
+
+        matrix = conn.spec._sparse_matrix(conn, conn.wt)
+        self.assertEqual((matrix.shape, matrix.nnz), ((1000, 1000), 1000 * 20))
+        self.assertIs(conn.spec._sparse_matrix(conn, conn.wt), matrix)
+        conn.wt *= 0.5
+        conn.weights_changed()
+        self.assertIsNot(conn.spec._sparse_matrix(conn, conn.wt), matrix)
+        self.assertTrue(np.allclose(conn.spec._sparse_matrix(conn, conn.wt).toarray(),
+                                    0.5 * matrix.toarray(), rtol=1e-12, atol=0.0))
+
+    def test_report(self):
+        network = build_network(seed=0)
+        report = prune(network, threshold=0.3, patterns=PATTERNS, repeats=1)
+        self.assertEqual(report.links_before, [20, 10])
+        self.assertEqual(report.links_after, [conn.n_links for conn in network.connections])
+        self.assertGreater(report.speedup, 0.0)
+        self.assertNotEqual(report.sse_after, report.sse_before)
+        self.assertIn('sse', repr(report))
+        self.assertIsNone(prune(network, threshold=0.3).speedup)
+        report = prune(network, threshold=0.3, patterns=PATTERNS, repeats=1)  # nothing left to remove
+        self.assertEqual(report.links_after, report.links_before)
+        self.assertEqual(report.sse_after, report.sse_before)
+
+        pruner = Pruner(every=2, top_k=2, patterns=PATTERNS)
+        Trainer(network, PATTERNS).train(4, callbacks=[pruner])
+        self.assertEqual([index for index, _ in pruner.reports], [1, 3])
+        self.assertTrue(all(conn.n_links <= 10 for conn in network.connections))
+        self.assertEqual(pruner.reports[1][1].n_removed, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+from leabra.engine import Engine
+from leabra.server import InferenceServer, MicroBatcher, save_network, http_request
+
+from test_engine import build_network, PATTERNS
+
+
+def reference_outputs(network, inputs):
+    engine = Engine(network)
+    state = engine.new_state()
+    engine.settle(state, inputs)
+    return state.layer('output_layer').act_m[0]
+
+
+class ServerTestBehavior(unittest.TestCase):
+
+    def test_batching(self):
+        """Concurrent requests are settled in batches, with the results of single settles."""
+        network = build_network()
+        inputs = [PATTERNS[k % len(PATTERNS)][0] for k in range(20)]
+
+        async def run():
+            batcher = MicroBatcher(network, max_batch=8, max_delay=0.05)
+            batcher.start()
+            outputs = await asyncio.gather(*[batcher.infer(inp) for inp in inputs])
+            with self.assertRaises(ValueError):
+                await batcher.infer({'input_layer': [1.0]})
+            await batcher.stop()
+            return outputs, batcher.stats.summary()
+
+        outputs, stats = asyncio.run(run())
+        for inp, output in zip(inputs, outputs):
+            self.assertTrue(np.allclose(output['output_layer'], reference_outputs(network, inp),
+                                        rtol=1e-12, atol=1e-15))
+        self.assertEqual(stats['requests'], 20)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(stats['mean_batch_size'], 20 / 3)
+
+    def test_bad_request_in_batch(self):
+        """An invalid request fails alone, not the requests of its batch."""
+        network = build_network()
+        inputs = [PATTERNS[0][0], {'input_layer': ['x', 0, 0, 0]}, PATTERNS[1][0],
+                  {'input_layer': [[1.0, 0.0, 0.0, 0.0]]}, 'input_layer', PATTERNS[2][0]]
+
+        async def run():
+            batcher = MicroBatcher(network, max_batch=8, max_delay=0.05)
+            batcher.start()
+            results = await asyncio.gather(*[batcher.infer(inp) for inp in inputs],
+                                           return_exceptions=True)
+            await batcher.stop()
+            return results, batcher.stats.summary()
+
+        results, stats = asyncio.run(run())
+        self.assertIsInstance(results[1], ValueError)
+        self.assertIsInstance(results[3], ValueError)
+        self.assertIsInstance(results[4], TypeError)
+        for k in (0, 2, 5):
+            self.assertTrue(np.allclose(results[k]['output_layer'], reference_outputs(network, inputs[k]),
+                                        rtol=1e-12, atol=1e-15))
+        self.assertEqual((stats['requests'], stats['batches']), (3, 1))
+
+    def test_latency_budget(self):
+        network = build_network()
+
+        async def run():
+            batcher = MicroBatcher(network, max_batch=4, max_delay=0.001, timeout=0.0)
+            batcher.start()
+            results = await asyncio.gather(*[batcher.infer(PATTERNS[0][0]) for _ in range(3)],
+                                           return_exceptions=True)
+            await batcher.stop()
+            return results, batcher.stats.summary()
+
+        results, stats = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, Exception) for result in results))
+        self.assertEqual(stats['rejected'], 3)
+
+    def test_http(self):
+        network = build_network()
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, 'network.pickle')
+            save_network(network, filename)
+
+            async def run():
+                server = InferenceServer.from_file(filename, port=0, max_delay=0.02)
+                await server.start()
+                port = server.port
+                responses = await asyncio.gather(*[http_request('POST', '/infer', {'inputs': inp}, port=port)
+                                                   for inp, _ in PATTERNS])
+                bad = await http_request('POST', '/infer', {'inputs': {'nope': [1.0]}}, port=port)
+                missing = await http_request('GET', '/nope', port=port)
+                not_dict = await http_request('POST', '/infer', [1, 2], port=port)
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(b'GARBAGE\r\n\r\n')
+                malformed = await reader.read()
+                writer.close()
+                metrics = await http_request('GET', '/metrics', port=port)
+                await server.stop()
+                return responses, bad, missing, not_dict, malformed, metrics
+
+            responses, bad, missing, not_dict, malformed, metrics = asyncio.run(run())
+        for (inp, _), (status, response) in zip(PATTERNS, responses):
+            self.assertEqual(status, 200)
+            self.assertTrue(np.allclose(response['outputs']['output_layer'],
+                                        reference_outputs(network, inp), rtol=1e-12, atol=1e-15))
+        self.assertEqual(bad[0], 400)
+        self.assertEqual(missing[0], 404)
+        self.assertEqual(not_dict[0], 400)
+        self.assertTrue(malformed.startswith(b'HTTP/1.1 400 '))
+        self.assertEqual(metrics[0], 200)
+        self.assertEqual(metrics[1]['requests'], len(PATTERNS))
+        self.assertIn('p95', metrics[1]['latency_ms'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import copy
+import os
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra.shared import SharedWeights, InferenceReplica, quantization_report
+
+from read_weight_file import read_weights
+from test_parallel import build_network
+
+
+INPUTS = [{'input_layer': [1.0, 0.0, 0.0, 0.0]},
+          {'input_layer': [0.0, 0.0, 1.0, 1.0]}]
+
+_replica = None
+
+def _init_worker(handle):
+    global _replica
+    _replica = InferenceReplica(handle)
+
+def _infer(inputs):
+    return _replica.infer(inputs)['output_layer']
+
+def std_network(n=4):
+    """The network of the template emergent project, with its weights."""
+    unit_spec  = leabra.UnitSpec(act_thr=0.5, act_gain=100, act_sd=0.005, adapt_on=False)
+    layer_spec = leabra.LayerSpec(lay_inhib=False)
+    layers = [leabra.Layer(n, spec=layer_spec, unit_spec=unit_spec, genre=genre, name=name)
+              for genre, name in [(leabra.INPUT,  'input_layer'), (leabra.HIDDEN, 'hidden_layer'),
+                                  (leabra.OUTPUT, 'output_layer')]]
+    weights = read_weights(os.path.join(os.path.dirname(__file__),
+                                        'emergent_projects/leabra_std{}.wts'.format(n)))
+    connections = []
+    for (pre, post), key in [((0, 1), ('Input', 'Hidden')), ((1, 2), ('Hidden', 'Output'))]:
+        conn = leabra.Connection(layers[pre], layers[post],
+                                 spec=leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04))
+        conn.weights = weights[key]
+        connections.append(conn)
+    return leabra.Network(layers=layers, connections=connections)
+
+
+class SharedWeightsTest(unittest.TestCase):
+
+    def _reference(self, network, inputs):
+        network.set_inputs(inputs)
+        network.settle()
+        return np.array([u.act_m for u in network.layers[-1].units])
+
+    def test_replica(self):
+        """Check that replicas reference the shared weights and infer like the network."""
+        for memmap in [False, True]:
+            network = build_network()
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'weights.npy') if memmap else None
+                with SharedWeights(network, path=path) as shared:
+                    replica = InferenceReplica(shared.handle)
+                    for conn, rep_conn in zip(network.connections, replica.network.connections):
+                        self.assertTrue(np.array_equal(conn.wt, rep_conn.wt))
+                        self.assertFalse(rep_conn.wt.flags.writeable)
+                        self.assertIsNone(rep_conn.fwt)
+
+                    for inputs in INPUTS:
+                        self.assertTrue(np.array_equal(self._reference(network, inputs),
+                                                       replica.infer(inputs)['output_layer']))
+
+                    # updates are visible without recreating the replica
+                    network.connections[0].wt[:] = 0.25
+                    shared.update()
+                    self.assertTrue(np.all(replica.network.connections[0].wt == 0.25))
+                    replica.close()
+
+    def test_quantized(self):
+        """Replicas with compact weights approximate the full precision ones."""
+        network = std_network()
+        inputs_list = [{'input_layer': [0.95, 0.0, 0.0, 0.0]}, {'input_layer': [0.0, 0.0, 0.95, 0.95]}]
+        for memmap, dtype, tol in [(False, 'uint8', 1/255), (True, 'uint16', 1/65535),
+                                   (False, 'float16', 1e-3)]:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'weights.npy') if memmap else None
+                with SharedWeights(network, path=path, dtype=dtype) as shared:
+                    replica = InferenceReplica(shared.handle)
+                    for conn, rep_conn in zip(network.connections, replica.network.connections):
+                        self.assertEqual(rep_conn.wt.dtype, np.dtype(dtype))
+                        wt = rep_conn.wt.astype(float)
+                        if rep_conn.wt_quant is not None:
+                            scale, offset = rep_conn.wt_quant
+                            wt = scale * wt + offset
+                        self.assertLessEqual(np.max(np.abs(wt - conn.wt)), tol)
+                    for inputs in inputs_list:
+                        self.assertTrue(np.allclose(self._reference(network, inputs),
+                                                    replica.infer(inputs)['output_layer'], atol=1e-3))
+                    replica.close()
+
+    def test_quantization_report(self):
+        """Accuracy of the compact weights on the template emergent project."""
+        inputs = [{'input_layer': list(0.95 * row)} for row in np.eye(4)]
+        report = quantization_report(std_network(), inputs, layers=['hidden_layer', 'output_layer'])
+        self.assertEqual(sorted(report), ['float16', 'float32', 'uint16', 'uint8'])
+        self.assertEqual(report['uint8']['ratio'], 8.0)
+        self.assertEqual(report['uint8']['bytes'], 32)
+        for dtype, max_err in [('float32', 1e-8), ('float16', 1e-4), ('uint16', 1e-6), ('uint8', 1e-3)]:
+            self.assertLess(report[dtype]['max_abs_err'], max_err)
+
+    def test_pool(self):
+        """Check inference in a process pool."""
+        network = build_network()
+        expected = [self._reference(copy.deepcopy(network), inputs) for inputs in INPUTS]
+        with SharedWeights(network) as shared:
+            with multiprocessing.Pool(2, initializer=_init_worker, initargs=(shared.handle,),
+                                      maxtasksperchild=1) as pool:
+                outputs = pool.map(_infer, INPUTS)
+        for out, exp in zip(outputs, expected):
+            self.assertTrue(np.array_equal(out, exp))
+
+
+if __name__ == '__main__':
+    unittest.main()
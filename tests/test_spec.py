@@ -0,0 +1,83 @@
+import unittest
+import pickle
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra.engine import Engine
+
+from test_engine import build_network, PATTERNS
+
+
+class SpecTestBehavior(unittest.TestCase):
+
+    def test_frozen(self):
+        spec = leabra.UnitSpec(tau_net=2.0)
+        frozen = spec.freeze()
+        self.assertIs(spec.freeze(), frozen)  # cached
+        self.assertEqual(frozen.tau_net, 2.0)
+        self.assertEqual(frozen.dt_net, 0.5)
+        self.assertEqual(frozen.gc_l, spec.g_bar_l * spec.g_l)
+        with self.assertRaises(AttributeError):
+            frozen.tau_net = 1.0
+        with self.assertRaises(AttributeError):
+            del frozen.dt_net
+        with self.assertRaises(ValueError):  # the noisy XX1 table is read-only
+            frozen.nxx1_table[1][0] = 1.0
+
+    def test_hash(self):
+        frozen = leabra.UnitSpec(act_thr=0.4).freeze()
+        self.assertEqual(frozen, leabra.UnitSpec(act_thr=0.4).freeze())
+        self.assertEqual(hash(frozen), hash(leabra.UnitSpec(act_thr=0.4).freeze()))
+        self.assertNotEqual(frozen, leabra.UnitSpec(act_thr=0.45).freeze())
+        self.assertNotEqual(leabra.LayerSpec().freeze(), leabra.ConnectionSpec().freeze())
+        self.assertEqual(len({leabra.ConnectionSpec().freeze(), leabra.ConnectionSpec().freeze()}), 1)
+
+    def test_invalidation(self):
+        """Check that modifying a parameter invalidates the frozen record."""
+        spec = leabra.UnitSpec()
+        frozen = spec.freeze()
+        xs, conv = spec.nxx1_table()
+        spec.tau_net = 2.0
+        self.assertEqual(spec.freeze().dt_net, 0.5)
+        self.assertEqual(frozen.dt_net, 1/1.4)  # the old record is unchanged
+        spec.act_sd = 0.02
+        self.assertGreater(len(spec.nxx1_table()[0]), len(xs))
+
+        layer_spec = leabra.LayerSpec()
+        frozen = layer_spec.freeze()
+        layer_spec.cycle_count += 1  # not a parameter
+        self.assertIs(layer_spec.freeze(), frozen)
+        self.assertFalse(hasattr(frozen, 'cycle_count'))
+
+        conn_spec = leabra.ConnectionSpec()
+        self.assertAlmostEqual(conn_spec.xcal(np.array([0.01]), np.array([0.5]))[0], -0.01 * 0.9 / 0.1)
+        conn_spec.d_rev = 0.2
+        self.assertAlmostEqual(conn_spec.xcal(np.array([0.05]), np.array([0.5]))[0], -0.05 * 0.8 / 0.2)
+
+    def test_pickle(self):
+        spec = leabra.UnitSpec(act_thr=0.4)
+        frozen = spec.freeze()
+        spec2 = pickle.loads(pickle.dumps(spec))
+        self.assertEqual(spec2.freeze(), frozen)
+        spec2.act_thr = 0.3
+        self.assertEqual(spec2.freeze().act_thr, 0.3)
+        self.assertEqual(pickle.loads(pickle.dumps(frozen)), frozen)
+
+    def test_engine(self):
+        """Check that the engine uses the current parameters of the specs."""
+        network = build_network()
+        engine = Engine(network)
+        state = engine.new_state()
+        engine.settle(state, PATTERNS[0][0])
+        act_m = state.layer('output_layer').act_m.copy()
+
+        network.layers[2].units[0].spec.act_thr = 0.6
+        state = engine.new_state()
+        engine.settle(state, PATTERNS[0][0])
+        self.assertFalse(np.array_equal(act_m, state.layer('output_layer').act_m))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+from leabra.engine import Engine
+from leabra.trace import (TraceRecorder, TraceReader, downsample_minmax, downsample_lttb,
+                          append_decimated)
+
+from utils import quantitative_match
+from test_engine import build_network, PATTERNS
+
+
+class TraceTestBehavior(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_network(self):
+        """Check the recorded traces against the units's and layers's logs."""
+        network = build_network()
+        network.set_inputs(PATTERNS[0][0])
+        network.set_outputs(PATTERNS[0][1])
+        variables = {'hidden_layer': ('net', 'act', 'v_m', 'gc_i')}
+        with TraceRecorder(self.path, variables, chunk_size=7, max_pending=1) as recorder:
+            network.recorder = recorder
+            network.trial()
+            network.recorder = None
+
+        reader = TraceReader(self.path)
+        hidden = network._get_layer('hidden_layer')
+        self.assertEqual(reader.n_chunks, 15)  # 100 cycles
+        self.assertEqual(list(reader.cycle_tot), list(range(1, 101)))
+        self.assertEqual(reader['hidden_layer', 'act'].shape, (100, 1, 5))
+        for k, unit in enumerate(hidden.units):
+            logs = {name: unit.logs[name] for name in ('net', 'act', 'v_m')}
+            self.assertTrue(quantitative_match(reader.unit_logs('hidden_layer', k), logs,
+                                               rtol=0, atol=0))
+        self.assertTrue(quantitative_match(reader.layer_logs('hidden_layer'), hidden.logs,
+                                           rtol=0, atol=0))
+
+    def test_indexing(self):
+        engine = Engine(build_network())
+        state = engine.new_state(batch=2)
+        state.recorder = TraceRecorder(self.path, {'output_layer': ('act',)}, chunk_size=30,
+                                       background=False)
+        acts = []
+        for _ in range(50):
+            engine.cycle(state)
+            acts.append(state.layer('output_layer').act.copy())
+        state.recorder.close()
+        acts = np.array(acts)
+
+        trace = TraceReader(self.path)['output_layer', 'act']
+        self.assertEqual(len(trace), 50)
+        self.assertTrue(np.array_equal(np.asarray(trace), acts))
+        self.assertTrue(np.array_equal(trace[-1], acts[-1]))
+        self.assertTrue(np.array_equal(trace[25:35, 1], acts[25:35, 1]))
+        self.assertTrue(np.array_equal(trace[::-7, :, 0], acts[::-7, :, 0]))
+        self.assertTrue(np.array_equal(trace.select((1, 0))[20:40], acts[20:40, 1, 0]))
+        with self.assertRaises(IndexError):
+            trace[50]
+        with self.assertRaises(KeyError):
+            TraceReader(self.path)['output_layer', 'v_m']
+
+    def test_partial(self):
+        """The chunks written before the recorder is closed can be read."""
+        recorder = TraceRecorder(self.path, {'output_layer': ('act',)}, chunk_size=10,
+                                 background=False)
+        engine = Engine(build_network())
+        state = engine.new_state()
+        state.recorder = recorder
+        for _ in range(25):
+            engine.cycle(state)
+        self.assertEqual(len(TraceReader(self.path).cycle_tot), 20)
+        recorder.close()
+        self.assertEqual(len(TraceReader(self.path).cycle_tot), 25)
+
+
+class DownsampleTestBehavior(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.xs = np.arange(10000)
+        self.ys = np.sin(self.xs / 500) + 0.01 * rng.standard_normal(len(self.xs))
+        self.ys[1234], self.ys[8765] = 5.0, -5.0  # isolated peaks
+
+    def test_minmax(self):
+        xs, ys = downsample_minmax(self.xs, self.ys, 500)
+        self.assertLessEqual(len(ys), 500)
+        self.assertTrue(np.all(np.diff(xs) > 0))
+        self.assertIn(1234, xs)
+        self.assertIn(8765, xs)
+        self.assertTrue(np.array_equal(ys, self.ys[xs]))
+        xs, ys = downsample_minmax(self.xs[:100], self.ys[:100], 500)
+        self.assertEqual(len(ys), 100)
+
+    def test_lttb(self):
+        xs, ys = downsample_lttb(self.xs, self.ys, 500)
+        self.assertEqual(len(ys), 500)
+        self.assertEqual((xs[0], xs[-1]), (0, 9999))
+        self.assertTrue(np.all(np.diff(xs) > 0))
+        self.assertIn(1234, xs)
+        self.assertIn(8765, xs)
+
+    def test_append_decimated(self):
+        """A line streamed by chunks stays bounded, and keeps its peaks."""
+        xs, ys = np.zeros(0), np.zeros(0)
+        n_decimations = 0
+        for start in range(0, len(self.xs), 300):
+            new_xs, new_ys = self.xs[start:start + 300], self.ys[start:start + 300]
+            decimated = append_decimated(xs, ys, new_xs, new_ys, 1000)
+            if decimated is None:
+                xs, ys = np.concatenate([xs, new_xs]), np.concatenate([ys, new_ys])
+            else:
+                xs, ys = decimated
+                n_decimations += 1
+                self.assertLessEqual(len(xs), 500)
+            self.assertLessEqual(len(xs), 1000)
+        self.assertGreater(n_decimations, 0)
+        self.assertTrue(np.all(np.diff(xs) > 0))
+        self.assertIn(1234, xs)
+        self.assertIn(8765, xs)
+        self.assertIsNone(append_decimated(xs, ys, self.xs, self.ys, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
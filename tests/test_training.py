@@ -0,0 +1,92 @@
+import os
+import copy
+import tempfile
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+from leabra import parallel
+from leabra.metrics import Metrics, SSE
+from leabra.training import Trainer, ArrayPatterns, GeneratorPatterns, Prefetcher
+
+from test_parallel import build_network, PATTERNS
+
+
+def as_arrays(patterns):
+    inputs  = {'input_layer':  np.array([inp['input_layer'] for inp, _ in patterns])}
+    outputs = {'output_layer': np.array([out['output_layer'] for _, out in patterns])}
+    return inputs, outputs
+
+
+class TrainingTestBehavior(unittest.TestCase):
+
+    def test_sequential(self):
+        """Check that the trainer reproduces the hand-written training loop."""
+        network = build_network()
+        ref_network = copy.deepcopy(network)
+        orders = parallel.epoch_orders(len(PATTERNS), 3, seed=1)
+        ref_curve = parallel.train_sequential(ref_network, PATTERNS, orders)
+
+        epochs = Trainer(network, PATTERNS, seed=1).train(3)
+        self.assertEqual([epoch.index for epoch in epochs], [0, 1, 2])
+        self.assertTrue(np.array_equal([epoch.sse for epoch in epochs], ref_curve))
+        for conn, ref_conn in zip(network.connections, ref_network.connections):
+            self.assertTrue(np.array_equal(conn.wt, ref_conn.wt))
+
+    def test_sources(self):
+        """In-memory lists, memory-mapped arrays and generators give the same training."""
+        with tempfile.TemporaryDirectory() as path:
+            inputs, outputs = as_arrays(PATTERNS)
+            np.save(os.path.join(path, 'inputs.npy'), inputs['input_layer'])
+            np.save(os.path.join(path, 'outputs.npy'), outputs['output_layer'])
+            mmapped = ArrayPatterns.from_npy({'input_layer': os.path.join(path, 'inputs.npy')},
+                                             {'output_layer': os.path.join(path, 'outputs.npy')})
+            generated = GeneratorPatterns(lambda: iter(PATTERNS))
+
+            network = build_network()
+            curves = []
+            for patterns, prefetch in [(PATTERNS, 0), (PATTERNS, 2), (ArrayPatterns(inputs, outputs), 4),
+                                       (mmapped, 16), (generated, 3)]:
+                trainer = Trainer(copy.deepcopy(network), patterns, shuffle=False, prefetch=prefetch)
+                curves.append([epoch.sse for epoch in trainer.train(3)])
+            del mmapped
+        for curve in curves[1:]:
+            self.assertEqual(curve, curves[0])
+
+    def test_stopping(self):
+        network = build_network()
+        network.metrics = Metrics([SSE()])
+        trainer = Trainer(network, PATTERNS, test=PATTERNS, stop_sse=np.inf)
+        epochs = trainer.train(5)
+        self.assertEqual(len(epochs), 1)
+        self.assertEqual(len(epochs[0].test_sses), len(PATTERNS))
+        # the evaluation pass is not counted in the training metrics
+        self.assertEqual(epochs[0].metrics['sse']['n'], len(PATTERNS))
+        self.assertAlmostEqual(epochs[0].metrics['sse']['mean'], epochs[0].sse)
+
+        seen = []
+        def callback(trainer, epoch):
+            seen.append(epoch.index)
+            return epoch.index % 2 == 1
+        trainer = Trainer(build_network(), PATTERNS)
+        self.assertEqual(len(trainer.train(10, callbacks=[callback])), 2)
+        self.assertEqual(len(trainer.train(10, callbacks=[callback])), 2)
+        self.assertEqual(seen, [0, 1, 2, 3])
+        self.assertEqual(len(trainer.epochs), 4)
+
+    def test_prefetcher(self):
+        def failing():
+            yield 1
+            raise IOError('disk error')
+        with self.assertRaises(IOError):
+            list(Prefetcher(failing()))
+
+        prefetcher = Prefetcher(iter(range(1000)), depth=2)
+        self.assertEqual(next(iter(prefetcher)), 0)
+        prefetcher.close()
+        self.assertFalse(prefetcher._thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+import data
+from utils import compare, quantitative_match
+
+
+def reference_match(python_logs, emergent_logs, limit=-1, rtol=1e-05, atol=0, postprocessing=None):
+    """Per-timestep `np.allclose` check, as the original `quantitative_match`."""
+    steps = {}
+    for name in python_logs.keys():
+        steps[name] = []
+        for py, em in list(zip(python_logs[name], emergent_logs[name]))[:limit]:
+            if postprocessing is not None:
+                py, em = postprocessing(py, em)
+            steps[name].append(np.allclose(py, em, rtol=rtol, atol=atol))
+    return steps
+
+
+class CompareTestBehavior(unittest.TestCase):
+
+    def test_emergent_unit(self):
+        """Check the vectorized comparison against the per-timestep check on emergent data."""
+        neuron_data = data.parse_unit('neuron.dat')
+        spec = leabra.UnitSpec(adapt_on=False, noisy_act=True, g_bar_e=0.3, g_bar_l=0.3,
+                               g_bar_i=1.0, act_gain=40, act_sd=0.01)
+        unit = leabra.Unit(spec=spec)
+        for g_e in 10*[0.0] + 150*[1.0] + 40*[0.0]:
+            unit.add_excitatory(g_e)
+            unit.calculate_net_in()
+            unit.cycle('minus')
+
+        for rtol, atol in [(2e-05, 1e-08), (1e-09, 0)]:
+            comparison = compare(unit.logs, neuron_data, rtol=rtol, atol=atol)
+            reference = reference_match(unit.logs, neuron_data, rtol=rtol, atol=atol)
+            for name, match in comparison.items():
+                self.assertEqual(list(match.step_ok), reference[name])
+            self.assertEqual(quantitative_match(unit.logs, neuron_data, rtol=rtol, atol=atol),
+                             all(all(steps) for steps in reference.values()))
+
+    def test_first_divergence(self):
+        py = {'act': [np.array([0.0, 1.0, 2.0])] * 10, 'gc_i': [0.5] * 10}
+        em = {'act': [np.array([0.0, 1.0, 2.0])] * 10, 'gc_i': [0.5] * 10}
+        em['act'][6] = np.array([0.0, 1.0, 2.1])
+        em['act'][8] = np.array([0.5, 1.0, 2.0])
+
+        comparison = compare(py, em)
+        self.assertFalse(comparison.ok)
+        self.assertTrue(comparison['gc_i'].ok)
+        match = comparison['act']
+        self.assertEqual(match.n_failed, 2)
+        self.assertEqual(match.first_step, 6)
+        self.assertEqual(match.first_index, (2,))
+        self.assertEqual(match.first_values, (2.0, 2.1))
+        self.assertAlmostEqual(match.max_abs_err, 0.5)
+        self.assertIn('first divergence at t=6', str(comparison))
+
+        # the last timestep is excluded by the default `limit=-1`
+        em['act'][9] = np.array([9.0, 9.0, 9.0])
+        self.assertEqual(compare(py, em)['act'].n_failed, 2)
+        self.assertEqual(compare(py, em, limit=None)['act'].n_failed, 3)
+
+    def test_broadcast_and_postprocessing(self):
+        """Timesteps are compared with the broadcasting of `np.allclose`, after postprocessing."""
+        py = {'act': [np.array([t, t, 9.0]) for t in range(5)]}
+        em = {'act': [float(t) for t in range(5)]}
+        postprocessing = lambda py_t, em_t: (py_t[:2], em_t)
+        self.assertTrue(compare(py, em, postprocessing=postprocessing).ok)
+        self.assertFalse(compare(py, em).ok)
+
+        py = {'wts': [[0.1, 0.2], [0.3], [0.4, 0.5]]}  # irregular timesteps
+        em = {'wts': [[0.1, 0.2], [0.3], [0.4, 0.6]]}
+        match = compare(py, em, limit=None)['wts']
+        self.assertEqual(list(match.step_ok), [True, True, False])
+        self.assertEqual(match.first_step, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
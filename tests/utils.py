@@ -1,7 +1,110 @@
+import collections
+
 import numpy as np
 import color
 
 
+VariableMatch = collections.namedtuple('VariableMatch', ['name', 'py', 'em', 'step_ok',
+                                                         'first_step', 'first_index', 'first_values',
+                                                         'max_abs_err', 'max_rel_err'])
+VariableMatch.__doc__ = """Comparison of one variable.
+
+    py, em       aligned data, one element per timestep (arrays, or lists if the
+                 timesteps do not have the same shape).
+    step_ok      (steps,) bool array, True where the timestep matches.
+    first_step   first mismatching timestep, or None.
+    first_index  index of the first mismatching value in that timestep.
+    first_values python and emergent values at that index.
+    max_abs_err  maximum absolute and relative errors (nan if not computable).
+"""
+VariableMatch.ok = property(lambda self: bool(np.all(self.step_ok)))
+VariableMatch.n_failed = property(lambda self: int(np.sum(~self.step_ok)))
+
+
+def _align(py, em, limit, postprocessing):
+    """Return the python and emergent data of a variable as arrays of timesteps.
+
+    Timesteps are those of `list(zip(py, em))[:limit]`. Falls back to lists if the
+    timesteps can't be stacked into numeric arrays.
+    """
+    n = len(range(min(len(py), len(em)))[:limit])
+    if postprocessing is not None:
+        pairs = [postprocessing(py_t, em_t) for py_t, em_t in zip(py[:n], em[:n])]
+        py, em = [p for p, _ in pairs], [e for _, e in pairs]
+    else:
+        py, em = py[:n], em[:n]
+    try:
+        py_array, em_array = np.asarray(py, dtype=float), np.asarray(em, dtype=float)
+        np.broadcast_shapes(py_array.shape[1:], em_array.shape[1:])
+        return py_array, em_array
+    except (ValueError, TypeError):
+        return list(py), list(em)
+
+
+def _match_variable(name, py, em, rtol, atol):
+    if isinstance(py, list):  # timesteps of irregular shapes
+        step_ok = np.array([np.allclose(py_t, em_t, rtol=rtol, atol=atol)
+                            for py_t, em_t in zip(py, em)], dtype=bool)
+        first_step = int(np.argmin(step_ok)) if not np.all(step_ok) else None
+        return VariableMatch(name, py, em, step_ok, first_step, None, None, np.nan, np.nan)
+
+    # aligning the dimensions of the timesteps as `np.allclose(py[t], em[t])` broadcasts them
+    ndim = max(py.ndim, em.ndim)
+    py_b = py.reshape(py.shape[:1] + (1,) * (ndim - py.ndim) + py.shape[1:])
+    em_b = em.reshape(em.shape[:1] + (1,) * (ndim - em.ndim) + em.shape[1:])
+    py_b, em_b = np.broadcast_arrays(py_b, em_b)
+    close = np.isclose(py_b, em_b, rtol=rtol, atol=atol).reshape(len(py_b), -1)
+    step_ok = np.all(close, axis=1)
+
+    first_step, first_index, first_values = None, None, None
+    if not np.all(step_ok):
+        first_step = int(np.argmin(step_ok))
+        first_index = np.unravel_index(int(np.argmin(close[first_step])), py_b.shape[1:])
+        first_values = py_b[first_step][first_index], em_b[first_step][first_index]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        abs_err = np.abs(py_b - em_b)
+        rel_err = np.where(em_b != 0, abs_err / np.abs(em_b), np.where(abs_err == 0, 0.0, np.inf))
+    max_abs_err = float(np.nanmax(abs_err)) if abs_err.size else 0.0
+    max_rel_err = float(np.nanmax(rel_err)) if rel_err.size else 0.0
+    return VariableMatch(name, py, em, step_ok, first_step, first_index, first_values,
+                         max_abs_err, max_rel_err)
+
+
+class Comparison(collections.OrderedDict):
+    """Result of `compare()`: a VariableMatch for each variable."""
+
+    @property
+    def ok(self):
+        return all(match.ok for match in self.values())
+
+    def __str__(self):
+        lines = []
+        for name, match in self.items():
+            status = color.dye_out(' ok ', 'green') if match.ok else color.dye_out('fail', 'bred')
+            line = '[{}] {}: {}/{} timesteps failed, max abs err {:.2e}, max rel err {:.2e}'.format(
+                   status, name, match.n_failed, len(match.step_ok), match.max_abs_err, match.max_rel_err)
+            if match.first_step is not None:
+                line += ', first divergence at t={} index={}'.format(match.first_step, match.first_index)
+            if match.first_values is not None:
+                line += ': [py] {} != {} [em]'.format(*match.first_values)
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def compare(python_logs, emergent_logs, limit=-1, rtol=1e-05, atol=0, postprocessing=None):
+    """Compare python and emergent data, all timesteps of a variable at once.
+
+    Same parameters as `quantitative_match`. Returns a `Comparison`, that reports,
+    for each variable of `python_logs`, the mismatching timesteps, the first
+    divergence and the maximum errors.
+    """
+    comparison = Comparison()
+    for name in python_logs.keys():
+        py, em = _align(python_logs[name], emergent_logs[name], limit, postprocessing)
+        comparison[name] = _match_variable(name, py, em, rtol, atol)
+    return comparison
+
+
 def quantitative_match(python_logs, emergent_logs, limit=-1, check=True, rtol=1e-05, atol=0,
                        verbose=0, postprocessing=None, prefix='', suffix=''):
     """Check that python and emergent data match quantitatively
@@ -14,28 +117,32 @@ def quantitative_match(python_logs, emergent_logs, limit=-1, check=True, rtol=1e
         atol     absolute tolerance. See `numpy.allclose` function.
         verbose  0: no output. 1: output if error. 2: output regardless.
     """
-    check = check
-    for name in python_logs.keys():
-        for t, (py, em) in enumerate(list(zip(python_logs[name], emergent_logs[name]))[:limit]):
-            if postprocessing is not None:
-                py, em = postprocessing(py, em)
-            local_check = np.allclose(py, em, rtol=rtol, atol=atol)
-            if verbose >= 2 or (verbose >= 1 and not local_check):
-                same = np.allclose(py, em, rtol=0, atol=0)
-                if same:
-                    sign_text = '==', color.dye_out('same', 'green')
-                elif local_check:
-                    sign_text = '~=', color.dye_out(' ok ', 'green')
-                else:
-                    sign_text = '!=', color.dye_out('fail', 'bred')
-
-                try:
-                    diff_text = '' if same else 'diff={:+.2e}'.format(py - em)
-                    print('{}{}:{:2d} [{}] [py] {:12.10f} {} {:12.10f} [em] {} {}'.format(prefix,
-                           name, t, sign_text[1], py, sign_text[0], em, diff_text, suffix))
-                except TypeError:
-                    diff_text = '' if same else 'diff={}'.format(py - em)
-                    print('{}{}:{:2d} [{}] [py] {} {} {} [em] {} {}'.format(prefix,
-                           name, t, sign_text[1], py, sign_text[0], em, diff_text, suffix))
-            check = check and local_check
+    comparison = compare(python_logs, emergent_logs, limit=limit, rtol=rtol, atol=atol,
+                         postprocessing=postprocessing)
+    for name, match in comparison.items():
+        if verbose >= 2:
+            steps = range(len(match.step_ok))
+        elif verbose >= 1:
+            steps = np.flatnonzero(~match.step_ok)
+        else:
+            steps = ()
+        for t in steps:
+            py, em, local_check = match.py[t], match.em[t], match.step_ok[t]
+            same = np.allclose(py, em, rtol=0, atol=0)
+            if same:
+                sign_text = '==', color.dye_out('same', 'green')
+            elif local_check:
+                sign_text = '~=', color.dye_out(' ok ', 'green')
+            else:
+                sign_text = '!=', color.dye_out('fail', 'bred')
+
+            try:
+                diff_text = '' if same else 'diff={:+.2e}'.format(py - em)
+                print('{}{}:{:2d} [{}] [py] {:12.10f} {} {:12.10f} [em] {} {}'.format(prefix,
+                       name, t, sign_text[1], py, sign_text[0], em, diff_text, suffix))
+            except TypeError:
+                diff_text = '' if same else 'diff={}'.format(py - em)
+                print('{}{}:{:2d} [{}] [py] {} {} {} [em] {} {}'.format(prefix,
+                       name, t, sign_text[1], py, sign_text[0], em, diff_text, suffix))
+        check = check and match.ok
     return check